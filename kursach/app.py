@@ -1,17 +1,78 @@
-from flask import Flask, render_template, request, jsonify, session
-from database import Database
+from flask import (Blueprint, Flask, current_app, render_template, request, jsonify, session,
+                   make_response, Response, stream_with_context)
+from flask.cli import with_appcontext
+from werkzeug.local import LocalProxy
+import click
+from database import Database, OrderError, BookingError
+from chat_writer import ChatQueueFull
+from auto_responses import KeywordMatcher
+from exports import EXPORT_FORMATS, ndjson_chunks, csv_chunks
+from models import to_dicts
+from compression import Compressor
+from assets import Assets
+from config import load_config
+from metrics import Metrics
+from schedule import parse_date
+import atexit
+import functools
+import hashlib
+import hmac
 import json
-from datetime import datetime
-
-app = Flask(__name__)
-app.secret_key = 'your-secret-key-here-12345'  # Измените на свой секретный ключ
-app.config['SESSION_TYPE'] = 'filesystem'
-app.config['SESSION_PERMANENT'] = False
-app.config['SESSION_USE_SIGNER'] = True
-
-# Инициализация базы данных
-db = Database()
-db.init_parts_data()  # Заполняем тестовыми данными
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+bp = Blueprint('main', __name__)
+
+# ========== БАЗА ДАННЫХ ПРОЦЕССА ==========
+
+_db_lock = threading.Lock()
+
+def open_database(config, metrics=None):
+    """Database по настройкам DATABASE_* (соединения откроются при первом запросе)
+    
+    С metrics методы и запросы базы попадают в /metrics.
+    """
+    database = Database(config['DATABASE_PATH'],
+                        pool_size=config['DATABASE_POOL_SIZE'],
+                        cache_size=config['DATABASE_CACHE_SIZE'],
+                        pragmas=config['DATABASE_PRAGMAS'],
+                        connection_factory=metrics.connection_factory if metrics else sqlite3.Connection,
+                        counters_ttl=config['STATS_TTL_SECONDS'],
+                        archive_dir=config['ARCHIVE_DIR'])
+    if metrics:
+        metrics.instrument(database)
+    return database
+
+def start_chat_writer(database, config):
+    """Групповая запись сообщений чата по настройкам CHAT_WRITER_*"""
+    database.start_chat_writer(max_batch=config['CHAT_WRITER_BATCH'],
+                               flush_interval=config['CHAT_WRITER_WINDOW_MS'] / 1000,
+                               max_queue=config['CHAT_WRITER_QUEUE'])
+
+def get_db():
+    """База данных приложения; создается при первом обращении в процессе
+    
+    Импорт модуля и create_app файл базы не трогают, поэтому в
+    prefork-сервере каждый рабочий процесс открывает соединения уже
+    после fork. Вместо миграций - только проверка версии схемы.
+    """
+    database = current_app.extensions.get('database')
+    if database is None:
+        with _db_lock:
+            database = current_app.extensions.get('database')
+            if database is None:
+                database = open_database(current_app.config, current_app.extensions.get('metrics'))
+                database.check_schema()
+                if current_app.config['CHAT_WRITER_ENABLED']:
+                    start_chat_writer(database, current_app.config)
+                # При остановке процесса дописываем очередь чата
+                atexit.register(database.close)
+                current_app.extensions['database'] = database
+    return database
+
+# db в маршрутах - база текущего приложения
+db = LocalProxy(get_db)
 
 # ========== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ==========
 
@@ -27,32 +88,138 @@ def get_current_user():
         'email': session.get('user_email')
     }
 
+def catalog_response(name, build):
+    """Ответ каталога со строгим ETag по версии каталога
+    
+    Если у клиента уже есть эта версия (If-None-Match), возвращается 304
+    без обращения к данным. Сравнение слабое: у сжатого ответа ETag
+    ослаблен (см. compression.py).
+    """
+    etag = f'{name}-v{db.catalog_version()}'
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(build())
+        if response.status_code != 200:
+            return response
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def page_response(template):
+    """Страница из памяти со строгим ETag по содержимому
+    
+    В шаблонах нет данных пользователя, поэтому каждая страница
+    рендерится один раз на процесс. Повторная загрузка получает 304;
+    скрипты и стили по адресам с хэшем берутся из кэша браузера без
+    запросов. В режиме отладки шаблон рендерится заново на каждый запрос.
+    """
+    page_cache = current_app.extensions.setdefault('page_cache', {})
+    page = page_cache.get(template)
+    if page is None or current_app.debug:
+        html = render_template(template)
+        page = (html, hashlib.sha256(html.encode('utf-8')).hexdigest()[:16])
+        page_cache[template] = page
+    html, etag = page
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(html)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def check_bearer_token(setting, disabled_message, invalid_message):
+    """Ответ с ошибкой, если раздел недоступен; None - доступ есть
+    
+    Раздел открывается только с токеном из app.config[setting] в заголовке
+    Authorization: Bearer <токен>; без настройки он выключен.
+    """
+    token = current_app.config[setting]
+    if not token:
+        return jsonify({'success': False, 'message': disabled_message}), 404
+    expected = f'Bearer {token}'.encode('utf-8')
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode('utf-8'), expected):
+        return jsonify({'success': False, 'message': invalid_message}), 401
+    return None
+
 # ========== МАРШРУТЫ ДЛЯ СТРАНИЦ ==========
 
-@app.route('/')
+@bp.route('/')
 def index():
     """Главная страница"""
-    return render_template('index.html')
+    return page_response('index.html')
 
 # ========== API ДЛЯ РАБОТЫ С КАТАЛОГОМ ==========
 
-@app.route('/api/parts', methods=['GET'])
+PARTS_PAGE_DEFAULT = 24
+PARTS_PAGE_MAX = 100
+
+@bp.route('/api/parts', methods=['GET'])
 def get_parts():
-    """Получение всех запчастей"""
-    parts = db.get_all_parts()
-    return jsonify({'success': True, 'parts': parts})
+    """Страница каталога с фильтрами, сортировкой и пагинацией по курсору"""
+    args = request.args
+    limit = args.get('limit', PARTS_PAGE_DEFAULT, type=int)
+    if not 1 <= limit <= PARTS_PAGE_MAX:
+        return jsonify({'success': False, 'message': f'limit должен быть от 1 до {PARTS_PAGE_MAX}'}), 400
+    # Цена - целое число рублей; пустой параметр - без фильтра. Не больше
+    # 18 цифр, чтобы значение поместилось в INTEGER SQLite
+    prices = {}
+    for name in ('min_price', 'max_price'):
+        value = args.get(name, '')
+        if value and not (value.isascii() and value.isdigit() and len(value) <= 18):
+            return jsonify({'success': False, 'message': f'{name} должен быть целым неотрицательным числом'}), 400
+        prices[name] = int(value) if value else None
+
+    def build():
+        try:
+            page = db.get_parts_page(
+                category=args.get('category'),
+                brand=args.get('brand'),
+                **prices,
+                search=args.get('search', '').strip(),
+                sort=args.get('sort', 'default'),
+                limit=limit,
+                cursor=args.get('cursor')
+            )
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        return jsonify({
+            'success': True,
+            'parts': to_dicts(page['parts']),
+            'total': page['total'],
+            'next_cursor': page['next_cursor']
+        })
+
+    return catalog_response('parts', build)
+
+@bp.route('/api/parts/search', methods=['GET'])
+def search_parts():
+    """Полнотекстовый поиск запчастей (по префиксам слов, с ранжированием)"""
+    query = request.args.get('q', '').strip()
+    limit = request.args.get('limit', 20, type=int)
+    limit = max(1, min(limit, PARTS_PAGE_MAX))
 
-@app.route('/api/parts/<int:part_id>', methods=['GET'])
+    def build():
+        parts = db.search_parts(query, limit=limit) if query else []
+        return jsonify({'success': True, 'parts': to_dicts(parts)})
+
+    return catalog_response('search', build)
+
+@bp.route('/api/parts/<int:part_id>', methods=['GET'])
 def get_part(part_id):
     """Получение запчасти по ID"""
-    part = db.get_part_by_id(part_id)
-    if part:
-        return jsonify({'success': True, 'part': part})
-    return jsonify({'success': False, 'message': 'Запчасть не найдена'}), 404
+    def build():
+        part = db.get_part_by_id(part_id)
+        if part:
+            return jsonify({'success': True, 'part': part.to_dict()})
+        return jsonify({'success': False, 'message': 'Запчасть не найдена'}), 404
+
+    return catalog_response(f'part-{part_id}', build)
 
 # ========== API ДЛЯ РАБОТЫ С ПОЛЬЗОВАТЕЛЯМИ ==========
 
-@app.route('/api/user', methods=['POST'])
+@bp.route('/api/user', methods=['POST'])
 def create_or_get_user():
     """Создание или получение пользователя"""
     data = request.json
@@ -66,15 +233,15 @@ def create_or_get_user():
     user = db.get_or_create_user(name, phone, email)
     
     # Сохраняем в сессию
-    session['user_id'] = user['id']
-    session['user_name'] = user['name']
-    session['user_phone'] = user['phone']
-    session['user_email'] = user['email']
+    session['user_id'] = user.id
+    session['user_name'] = user.name
+    session['user_phone'] = user.phone
+    session['user_email'] = user.email
     session.permanent = True
     
-    return jsonify({'success': True, 'user': user})
+    return jsonify({'success': True, 'user': user.to_dict()})
 
-@app.route('/api/user', methods=['GET'])
+@bp.route('/api/user', methods=['GET'])
 def get_user():
     """Получение текущего пользователя"""
     user = get_current_user()
@@ -82,13 +249,13 @@ def get_user():
         return jsonify({'success': True, 'user': user})
     return jsonify({'success': False, 'message': 'Пользователь не авторизован'}), 401
 
-@app.route('/api/user/logout', methods=['POST'])
+@bp.route('/api/user/logout', methods=['POST'])
 def logout():
     """Выход пользователя"""
     session.clear()
     return jsonify({'success': True, 'message': 'Выход выполнен'})
 
-@app.route('/api/user/profile', methods=['PUT'])
+@bp.route('/api/user/profile', methods=['PUT'])
 def update_profile():
     """Обновление профиля пользователя"""
     user = get_current_user()
@@ -118,7 +285,7 @@ def update_profile():
 
 # ========== API ДЛЯ РАБОТЫ С ЗАКАЗАМИ ==========
 
-@app.route('/api/orders', methods=['POST'])
+@bp.route('/api/orders', methods=['POST'])
 def create_order():
     """Создание нового заказа"""
     user = get_current_user()
@@ -127,38 +294,38 @@ def create_order():
     
     data = request.json
     items = data.get('items', [])
-    total_price = data.get('total_price', 0)
     
     if not items:
         return jsonify({'success': False, 'message': 'Корзина пуста'}), 400
     
-    # Проверяем наличие товаров
-    for item in items:
-        part = db.get_part_by_id(item['id'])
-        if not part:
-            return jsonify({'success': False, 'message': f'Товар {item["name"]} не найден'}), 400
-    
-    order_id = db.create_order(user['id'], items, total_price)
+    # Проверка товаров и расчет суммы по ценам каталога - в одной транзакции;
+    # total_price из запроса не используется
+    try:
+        order = db.place_order(user['id'], items)
+    except OrderError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     
     return jsonify({
         'success': True, 
         'message': 'Заказ успешно создан',
-        'order_id': order_id
+        'order_id': order['order_id'],
+        'total_price': order['total_price']
     })
 
-@app.route('/api/orders', methods=['GET'])
+@bp.route('/api/orders', methods=['GET'])
 def get_orders():
-    """Получение заказов текущего пользователя"""
+    """Получение заказов текущего пользователя; ?archived=1 - вместе с архивными"""
     user = get_current_user()
     if not user:
         return jsonify({'success': False, 'message': 'Необходима авторизация'}), 401
     
-    orders = db.get_user_orders(user['id'])
+    include_archived = request.args.get('archived') in ('1', 'true')
+    orders = to_dicts(db.get_user_orders(user['id'], include_archived=include_archived))
     return jsonify({'success': True, 'orders': orders})
 
 # ========== API ДЛЯ РАБОТЫ С ЗАПИСЯМИ ==========
 
-@app.route('/api/appointments', methods=['POST'])
+@bp.route('/api/appointments', methods=['POST'])
 def create_appointment():
     """Создание новой записи на ТО"""
     user = get_current_user()
@@ -173,7 +340,12 @@ def create_appointment():
         if field not in data:
             return jsonify({'success': False, 'message': f'Поле {field} обязательно'}), 400
     
-    appointment_id = db.create_appointment(user['id'], data)
+    try:
+        appointment_id = db.create_appointment(user['id'], data)
+    except BookingError as e:
+        return jsonify({'success': False, 'message': str(e)}), 409
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     
     return jsonify({
         'success': True,
@@ -181,17 +353,29 @@ def create_appointment():
         'appointment_id': appointment_id
     })
 
-@app.route('/api/appointments', methods=['GET'])
+@bp.route('/api/appointments', methods=['GET'])
 def get_appointments():
     """Получение записей текущего пользователя"""
     user = get_current_user()
     if not user:
         return jsonify({'success': False, 'message': 'Необходима авторизация'}), 401
     
-    appointments = db.get_user_appointments(user['id'])
+    appointments = to_dicts(db.get_user_appointments(user['id']))
     return jsonify({'success': True, 'appointments': appointments})
 
-@app.route('/api/appointments/<int:appointment_id>', methods=['DELETE'])
+@bp.route('/api/appointments/slots', methods=['GET'])
+def get_appointment_slots():
+    """Свободное время для записи: ?service=oil&from=YYYY-MM-DD&to=YYYY-MM-DD"""
+    args = request.args
+    date_from = args.get('from', datetime.now().strftime('%Y-%m-%d'))
+    date_to = args.get('to', date_from)
+    try:
+        days = db.get_available_slots(args.get('service'), date_from, date_to)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, 'days': days})
+
+@bp.route('/api/appointments/<int:appointment_id>', methods=['DELETE'])
 def cancel_appointment(appointment_id):
     """Отмена записи"""
     user = get_current_user()
@@ -206,17 +390,17 @@ def cancel_appointment(appointment_id):
 
 # ========== API ДЛЯ РАБОТЫ С АВТОМОБИЛЯМИ ==========
 
-@app.route('/api/user/cars', methods=['GET'])
+@bp.route('/api/user/cars', methods=['GET'])
 def get_user_cars():
     """Получение автомобилей пользователя"""
     user = get_current_user()
     if not user:
         return jsonify({'success': False, 'message': 'Необходима авторизация'}), 401
     
-    cars = db.get_user_cars(user['id'])
+    cars = to_dicts(db.get_user_cars(user['id']))
     return jsonify({'success': True, 'cars': cars})
 
-@app.route('/api/user/cars', methods=['POST'])
+@bp.route('/api/user/cars', methods=['POST'])
 def add_user_car():
     """Добавление автомобиля"""
     user = get_current_user()
@@ -239,7 +423,7 @@ def add_user_car():
         'car_id': car_id
     })
 
-@app.route('/api/user/cars/<int:car_id>', methods=['DELETE'])
+@bp.route('/api/user/cars/<int:car_id>', methods=['DELETE'])
 def delete_user_car(car_id):
     """Удаление автомобиля"""
     user = get_current_user()
@@ -252,9 +436,35 @@ def delete_user_car(car_id):
         return jsonify({'success': True, 'message': 'Автомобиль удален'})
     return jsonify({'success': False, 'message': 'Автомобиль не найден'}), 404
 
+# ========== API ЛИЧНОГО КАБИНЕТА ==========
+
+@bp.route('/api/user/dashboard', methods=['GET'])
+def get_user_dashboard():
+    """Заказы, записи, автомобили, непрочитанные и сводка одним запросом
+    
+    ?sections=cars,summary - только перечисленные разделы (по умолчанию все).
+    """
+    user = get_current_user()
+    if not user:
+        return jsonify({'success': False, 'message': 'Необходима авторизация'}), 401
+    
+    sections = request.args.get('sections')
+    if sections is not None:
+        sections = [s.strip() for s in sections.split(',') if s.strip()]
+    
+    try:
+        dashboard = db.get_user_dashboard(user['id'], sections)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    for section in ('orders', 'appointments', 'cars'):
+        if section in dashboard:
+            dashboard[section] = to_dicts(dashboard[section])
+    return jsonify({'success': True, **dashboard})
+
 # ========== API ДЛЯ РАБОТЫ С ЧАТОМ ==========
 
-@app.route('/api/chat/messages', methods=['POST'])
+@bp.route('/api/chat/messages', methods=['POST'])
 def send_chat_message():
     """Отправка сообщения в чат"""
     user = get_current_user()
@@ -267,43 +477,85 @@ def send_chat_message():
     user_id = user['id'] if user else None
     user_name = user['name'] if user else 'Гость'
     
-    # Сохраняем сообщение пользователя
-    db.save_chat_message(user_id, user_name, message, is_support=False)
-    
-    # Генерируем автоматический ответ
+    # Сообщение и автоответ ставятся в очередь записи вместе и обычно
+    # попадают в одну транзакцию; ждем коммита обоих
     auto_response = get_auto_response(message)
+    try:
+        saved = db.submit_chat_message(user_id, user_name, message, is_support=False)
+    except ChatQueueFull as e:
+        return jsonify({'success': False, 'message': str(e)}), 503
+    reply = None
     if auto_response:
-        db.save_chat_message(user_id, 'Система', auto_response, is_support=True)
+        # Сообщение клиента уже принято: ошибка 503 заставила бы отправить
+        # его повторно, поэтому без места в очереди автоответ пропускаем
+        try:
+            reply = db.submit_chat_message(user_id, 'Система', auto_response, is_support=True)
+        except ChatQueueFull as e:
+            current_app.logger.warning('Автоответ пользователю %s не записан: %s', user_id, e)
+    message_id = saved.result()
+    
+    if reply:
+        auto_response_id = reply.result()
         return jsonify({
             'success': True,
             'message': 'Сообщение отправлено',
-            'auto_response': auto_response
+            'message_id': message_id,
+            'auto_response': auto_response,
+            'auto_response_id': auto_response_id
         })
     
     return jsonify({
         'success': True,
-        'message': 'Сообщение отправлено'
+        'message': 'Сообщение отправлено',
+        'message_id': message_id
     })
 
-@app.route('/api/chat/history', methods=['GET'])
+CHAT_HISTORY_DEFAULT = 50
+CHAT_HISTORY_MAX = 200
+
+@bp.route('/api/chat/history', methods=['GET'])
 def get_chat_history():
-    """Получение истории чата"""
+    """История чата по курсору id сообщения
+    
+    Без параметров - последние сообщения; ?after=N - сообщения новее N
+    (дозагрузка при повторном открытии чата); ?before=N - сообщения
+    старше N (прокрутка назад). has_more - есть ли еще сообщения
+    в том же направлении.
+    """
+    args = request.args
+    limit = args.get('limit', CHAT_HISTORY_DEFAULT, type=int)
+    after_id = args.get('after', type=int)
+    before_id = args.get('before', type=int)
+    if not 1 <= limit <= CHAT_HISTORY_MAX:
+        return jsonify({'success': False, 'message': f'limit должен быть от 1 до {CHAT_HISTORY_MAX}'}), 400
+    if after_id is not None and before_id is not None:
+        return jsonify({'success': False, 'message': 'Укажите только after или только before'}), 400
+    if ('after' in args and after_id is None) or ('before' in args and before_id is None):
+        return jsonify({'success': False, 'message': 'after и before должны быть числами'}), 400
+
     user = get_current_user()
     user_id = user['id'] if user else None
     
     if not user_id:
-        return jsonify({'success': True, 'messages': []})
+        return jsonify({'success': True, 'messages': [], 'has_more': False})
     
     # Получаем историю сообщений
-    messages = db.get_chat_history(user_id)
-    
-    # Отмечаем сообщения как прочитанные
-    if messages:
+    if after_id is not None:
+        messages = db.get_chat_messages_after(user_id, after_id, limit=limit)
+    else:
+        messages = db.get_chat_history(user_id, limit=limit, before_id=before_id)
+    has_more = len(messages) == limit
+    if not has_more and after_id is None and before_id is None:
+        # Первая страница читается только из основной базы; архив - при прокрутке
+        has_more = db.has_archived_chat(user_id, messages[0].id if messages else None)
+    
+    # Отмечаем сообщения как прочитанные (старые при прокрутке назад уже прочитаны)
+    if messages and before_id is None:
         db.mark_messages_as_read(user_id)
     
-    return jsonify({'success': True, 'messages': messages})
+    return jsonify({'success': True, 'messages': to_dicts(messages), 'has_more': has_more})
 
-@app.route('/api/chat/unread', methods=['GET'])
+@bp.route('/api/chat/unread', methods=['GET'])
 def get_unread_count():
     """Получение количества непрочитанных сообщений"""
     user = get_current_user()
@@ -313,7 +565,86 @@ def get_unread_count():
     count = db.get_unread_messages(user['id'])
     return jsonify({'success': True, 'count': count})
 
-@app.route('/api/chat/read', methods=['POST'])
+CHAT_HEARTBEAT_SECONDS = 15
+CHAT_STREAM_BATCH = 100
+
+def sse_event(event, data, event_id=None):
+    """Одно событие в формате text/event-stream"""
+    lines = [] if event_id is None else [f'id: {event_id}']
+    lines.append(f'event: {event}')
+    lines.append('data: ' + json.dumps(data, ensure_ascii=False))
+    return '\n'.join(lines) + '\n\n'
+
+@bp.route('/api/chat/stream', methods=['GET'])
+def chat_stream():
+    """Поток событий чата (Server-Sent Events) вместо опроса /api/chat/unread
+    
+    События: message (новое сообщение, id события = id сообщения) и unread
+    (число непрочитанных). После обрыва браузер переподключается с
+    Last-Event-ID и получает пропущенные сообщения из базы.
+    """
+    user = get_current_user()
+    if not user:
+        return jsonify({'success': False, 'message': 'Необходима авторизация'}), 401
+    
+    user_id = user['id']
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = request.args.get('last_id', type=int)
+    
+    # Подписка до чтения базы, чтобы не потерять сообщения между ними
+    subscription = db.chat_hub.subscribe(user_id)
+    
+    def generate():
+        nonlocal last_id
+        
+        def new_messages():
+            # Событие от хаба - только сигнал: сами сообщения читаем из базы
+            # по id, так порядок и полнота не зависят от порядка публикации
+            nonlocal last_id
+            while True:
+                messages = db.get_chat_messages_after(user_id, last_id, limit=CHAT_STREAM_BATCH)
+                for m in messages:
+                    last_id = m.id
+                    yield sse_event('message', m.to_dict(), m.id)
+                if len(messages) < CHAT_STREAM_BATCH:
+                    return
+        
+        try:
+            yield 'retry: 3000\n\n'
+            yield sse_event('unread', {'count': db.get_unread_messages(user_id)})
+            if last_id is None:
+                last_id = db.get_last_chat_message_id(user_id)
+            else:
+                yield from new_messages()
+            
+            while not subscription.closed:
+                item = subscription.get(timeout=CHAT_HEARTBEAT_SECONDS)
+                if item is None:
+                    # Heartbeat; заодно подбираем сообщения, сохраненные
+                    # другими процессами (хаб работает внутри одного процесса)
+                    sent = last_id
+                    yield from new_messages()
+                    if last_id == sent:
+                        yield ': ping\n\n'
+                    continue
+                
+                event, data, event_id = item
+                if event == 'message':
+                    if event_id > last_id:
+                        yield from new_messages()
+                else:
+                    yield sse_event(event, data)
+        finally:
+            db.chat_hub.unsubscribe(subscription)
+    
+    # stream_with_context: generate обращается к db уже после выхода из маршрута
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@bp.route('/api/chat/read', methods=['POST'])
 def mark_chat_read():
     """Отметить сообщения как прочитанные"""
     user = get_current_user()
@@ -322,65 +653,319 @@ def mark_chat_read():
     return jsonify({'success': True})
 
 def get_auto_response(message):
-    """Автоматические ответы на частые вопросы"""
-    message = message.lower()
-    
-    # Словарь с ответами на ключевые слова
-    responses = {
-        'записаться': 'Вы можете записаться через форму на сайте в разделе "Запись" или по телефону +7 (999) 123-45-67',
-        'запись': 'Для записи на ТО перейдите в раздел "Запись" на сайте или позвоните нам +7 (999) 123-45-67',
-        'акци': 'Наши текущие акции:\n• Скидка 20% на замену масла\n• Бесплатная диагностика при комплексном ТО\n• Скидка 10% на запчасти при заказе услуг',
-        'скидк': 'Действующие скидки:\n• 20% на замену масла\n• 10% на запчасти\n• Бесплатная диагностика',
-        'цена': 'Стоимость услуг:\n• Замена масла - от 1500₽\n• Диагностика - от 1000₽\n• Ремонт тормозов - от 2000₽\n• Ремонт подвески - от 2500₽\n• Заправка кондиционера - от 1800₽\n• Комплексное ТО - от 5000₽',
-        'стоимост': 'Цены на услуги:\n• Замена масла - от 1500₽\n• Диагностика - от 1000₽\n• ТО - от 5000₽',
-        'время': 'Мы работаем:\n• Пн-Пт: 9:00 - 20:00\n• Сб: 10:00 - 18:00\n• Вс: 10:00 - 16:00',
-        'график': 'Режим работы:\nПн-Пт 9:00-20:00\nСб-Вс 10:00-18:00',
-        'адрес': 'Наш адрес: г. Москва, ул. Автомобильная, д. 10 (метро "Автозаводская")',
-        'телефон': 'Наш телефон: +7 (999) 123-45-67\nWhatsApp/Telegram: +7 (999) 123-45-67',
-        'контакт': 'Связаться с нами:\n• Телефон: +7 (999) 123-45-67\n• Email: info@autoservice.ru\n• Адрес: ул. Автомобильная, д. 10',
-        'спасибо': 'Пожалуйста! Обращайтесь еще 😊 Рады помочь!',
-        'пасиб': 'Всегда пожалуйста! 😊',
-        'благодар': 'Спасибо за добрые слова! Будем рады видеть вас снова!',
-        'привет': 'Здравствуйте! Чем могу помочь?',
-        'здравствуй': 'Добрый день! Чем я могу вам помочь?',
-        'добрый': 'Здравствуйте! Какой у вас вопрос?',
-        'работа': 'Режим работы:\nПн-Пт: 9:00 - 20:00\nСб-Вс: 10:00 - 18:00',
-        'масло': 'Замена масла от 1500₽. Используем масла ведущих производителей: Mobil, Shell, Castrol. Работа занимает около 1 часа.',
-        'диагностик': 'Компьютерная диагностика от 1000₽. Проверка всех систем автомобиля, выявление ошибок, рекомендации по ремонту.',
-        'тормоз': 'Ремонт тормозной системы от 2000₽:\n• Замена колодок\n• Замена дисков\n• Прокачка тормозов\n• Замена жидкости',
-        'подвеск': 'Ремонт подвески от 2500₽:\n• Замена амортизаторов\n• Замена шаровых опор\n• Замена сайлентблоков\n• Сход-развал',
-        'кондиционер': 'Заправка кондиционера от 1800₽. Включает диагностику системы, проверку на утечки, заправку фреоном.',
-        'то': 'Комплексное ТО от 5000₽:\n• Замена масла и фильтров\n• Проверка всех систем\n• Диагностика\n• Рекомендации',
-        'запчасти': 'В нашем каталоге более 5000 запчастей в наличии. Оригинальные и качественные аналоги. Доставка по Москбесплатно при заказе от 3000₽.',
-        'доставка': 'Доставка запчастей:\n• По Москве - бесплатно от 3000₽\n• Доставка курьером - 300₽\n• Самовывоз из магазина',
-        'гарантия': 'На все работы гарантия 1 год. На запчасти - гарантия производителя (от 6 месяцев до 2 лет).',
-        'оплат': 'Способы оплаты:\n• Наличные\n• Банковская карта\n• Перевод на карту\n• Безналичный расчет для юрлиц',
-        'выходн': 'Мы работаем без выходных! В субботу и воскресенье с 10:00 до 18:00'
-    }
-    
-    # Ищем ключевые слова в сообщении
-    for key, response in responses.items():
-        if key in message:
-            return response
+    """Автоматические ответы на частые вопросы
     
+    Правила лежат в data/auto_responses.json и собираются в KeywordMatcher
+    один раз в create_app.
+    """
     # Если ничего не найдено, возвращаем None (оператор ответит позже)
-    return None
+    return current_app.extensions['auto_responder'].match(message)
+
+# ========== API ОПЕРАТОРА ЧАТА ==========
+
+CONVERSATIONS_PAGE_DEFAULT = 50
+CONVERSATIONS_PAGE_MAX = 200
+OPERATOR_NAME_DEFAULT = 'Поддержка'
+
+def operator_only(view):
+    """Маршрут оператора: нужен OPERATOR_TOKEN в Authorization: Bearer <токен>"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        error = check_bearer_token('OPERATOR_TOKEN', 'Входящие оператора выключены',
+                                   'Неверный токен оператора')
+        return error or view(*args, **kwargs)
+    return wrapper
+
+@bp.route('/api/operator/conversations', methods=['GET'])
+@operator_only
+def get_conversations():
+    """Входящие: разговоры с клиентами, новые сверху
+    
+    ?unread=1 - только с непрочитанными сообщениями клиента; дальше по
+    next_cursor (?cursor=...). Список читается из сводки chat_conversations.
+    """
+    args = request.args
+    limit = args.get('limit', CONVERSATIONS_PAGE_DEFAULT, type=int)
+    if not 1 <= limit <= CONVERSATIONS_PAGE_MAX:
+        return jsonify({'success': False, 'message': f'limit должен быть от 1 до {CONVERSATIONS_PAGE_MAX}'}), 400
+    try:
+        page = db.get_conversations(unread_only=args.get('unread') in ('1', 'true'),
+                                    limit=limit, cursor=args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, 'conversations': to_dicts(page['conversations']),
+                    'next_cursor': page['next_cursor']})
+
+@bp.route('/api/operator/conversations/<int:user_id>/messages', methods=['GET'])
+@operator_only
+def get_conversation_messages(user_id):
+    """Переписка с клиентом по курсору: ?before=N - сообщения старше N"""
+    limit = request.args.get('limit', CHAT_HISTORY_DEFAULT, type=int)
+    if not 1 <= limit <= CHAT_HISTORY_MAX:
+        return jsonify({'success': False, 'message': f'limit должен быть от 1 до {CHAT_HISTORY_MAX}'}), 400
+    conversation = db.get_conversation(user_id)
+    if not conversation:
+        return jsonify({'success': False, 'message': 'Разговор не найден'}), 404
+    messages = db.get_chat_history(user_id, limit=limit, before_id=request.args.get('before', type=int))
+    return jsonify({'success': True, 'conversation': conversation.to_dict(),
+                    'messages': to_dicts(messages), 'has_more': len(messages) == limit})
+
+@bp.route('/api/operator/conversations/<int:user_id>/messages', methods=['POST'])
+@operator_only
+def reply_to_conversation(user_id):
+    """Ответ оператора клиенту (is_support=1); клиент получит его через /api/chat/stream"""
+    data = request.json or {}
+    message = (data.get('message') or '').strip()
+    if not message:
+        return jsonify({'success': False, 'message': 'Сообщение не может быть пустым'}), 400
+    if not db.get_conversation(user_id):
+        return jsonify({'success': False, 'message': 'Разговор не найден'}), 404
+    
+    try:
+        message_id = db.save_chat_message(user_id, data.get('operator') or OPERATOR_NAME_DEFAULT,
+                                          message, is_support=True)
+    except ChatQueueFull as e:
+        return jsonify({'success': False, 'message': str(e)}), 503
+    return jsonify({'success': True, 'message': 'Ответ отправлен', 'message_id': message_id})
+
+@bp.route('/api/operator/conversations/<int:user_id>/read', methods=['POST'])
+@operator_only
+def mark_conversation_read(user_id):
+    """Отметить сообщения клиента прочитанными: {"up_to": id последнего увиденного}"""
+    up_to = (request.get_json(silent=True) or {}).get('up_to')
+    if up_to is not None and (not isinstance(up_to, int) or isinstance(up_to, bool)):
+        return jsonify({'success': False, 'message': 'up_to должен быть id сообщения'}), 400
+    marked = db.mark_conversation_read(user_id, up_to)
+    return jsonify({'success': True, 'marked': marked})
+
+# ========== API ВЫГРУЗКИ ==========
+
+PART_EXPORT_COLUMNS = ['id', 'sku', 'name', 'category', 'brand', 'price', 'description', 'image', 'in_stock']
+ORDER_EXPORT_COLUMNS = ['order_id', 'created_at', 'status', 'total_price', 'part_id', 'name', 'price', 'quantity']
+CHAT_EXPORT_COLUMNS = ['id', 'created_at', 'user_name', 'is_support', 'is_read', 'message']
+
+def export_response(name, records, columns, csv_rows):
+    """Потоковый ответ с выгрузкой: ?format=ndjson (по умолчанию) или csv
+    
+    records - генератор записей из Database.export_*: строки читаются из
+    курсора по мере отправки, поэтому память не зависит от размера таблицы.
+    csv_rows(record) - строки CSV для одной записи.
+    """
+    file_format = request.args.get('format', 'ndjson')
+    if file_format not in EXPORT_FORMATS:
+        return jsonify({'success': False, 'message': f'Формат должен быть одним из: {", ".join(EXPORT_FORMATS)}'}), 400
+    
+    mimetype, extension = EXPORT_FORMATS[file_format]
+    if file_format == 'csv':
+        chunks = csv_chunks(columns, (row for record in records for row in csv_rows(record)))
+    else:
+        chunks = ndjson_chunks(record.to_dict() for record in records)
+    
+    filename = f'{name}-{datetime.now().strftime("%Y%m%d")}.{extension}'
+    return Response(chunks, content_type=f'{mimetype}; charset=utf-8', headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Cache-Control': 'no-store',
+        'X-Accel-Buffering': 'no'
+    })
+
+def order_csv_rows(order):
+    # Строка на позицию; заказ без позиций - одна строка с пустыми полями
+    if not order.items:
+        yield [order.id, order.created_at, order.status, order.total_price, None, None, None, None]
+    for item in order.items:
+        yield [order.id, order.created_at, order.status, order.total_price,
+               item.id, item.name, item.price, item.quantity]
+
+@bp.route('/api/export/parts', methods=['GET'])
+def export_parts():
+    """Выгрузка каталога"""
+    return export_response('parts', db.export_parts(), PART_EXPORT_COLUMNS,
+                           lambda part: [[getattr(part, c) for c in PART_EXPORT_COLUMNS]])
+
+@bp.route('/api/export/orders', methods=['GET'])
+def export_orders():
+    """Выгрузка заказов текущего пользователя"""
+    user = get_current_user()
+    if not user:
+        return jsonify({'success': False, 'message': 'Необходима авторизация'}), 401
+    
+    return export_response('orders', db.export_orders(user['id']), ORDER_EXPORT_COLUMNS, order_csv_rows)
+
+@bp.route('/api/export/chat', methods=['GET'])
+def export_chat():
+    """Выгрузка переписки текущего пользователя"""
+    user = get_current_user()
+    if not user:
+        return jsonify({'success': False, 'message': 'Необходима авторизация'}), 401
+    
+    return export_response('chat', db.export_chat(user['id']), CHAT_EXPORT_COLUMNS,
+                           lambda message: [[getattr(message, c) for c in CHAT_EXPORT_COLUMNS]])
 
 # ========== API ДЛЯ СТАТИСТИКИ ==========
 
-@app.route('/api/stats', methods=['GET'])
+@bp.route('/api/stats', methods=['GET'])
 def get_stats():
-    """Получение статистики"""
+    """Статистика для главной страницы (снимок счетчиков, см. Database.get_counters)"""
+    counters = db.get_counters()
     stats = {
-        'clients': '2,500+',
-        'works': '3,200+',
-        'parts': '5,000+',
+        'clients': counters['users'],
+        'works': counters['appointments'],
+        'parts': counters['parts_in_stock'],
+        'orders': counters['orders'],
         'support': '24/7'
     }
     return jsonify({'success': True, 'stats': stats})
 
+# ========== API ОТЧЕТОВ ==========
+
+REPORT_DAYS_DEFAULT = 30
+REPORT_DAYS_MAX = 366
+
+def check_reports_access():
+    """Отчеты о выручке - только с REPORTS_TOKEN"""
+    return check_bearer_token('REPORTS_TOKEN', 'Отчеты выключены', 'Неверный токен отчетов')
+
+def report_period():
+    """(from, to) из ?from=YYYY-MM-DD&to=YYYY-MM-DD; по умолчанию последние 30 дней"""
+    date_to = parse_date(request.args['to']) if 'to' in request.args else datetime.now().date()
+    date_from = (parse_date(request.args['from']) if 'from' in request.args
+                 else date_to - timedelta(days=REPORT_DAYS_DEFAULT - 1))
+    if date_from > date_to:
+        raise ValueError('Дата начала позже даты окончания')
+    if (date_to - date_from).days >= REPORT_DAYS_MAX:
+        raise ValueError(f'Период отчета - не более {REPORT_DAYS_MAX} дней')
+    return date_from.isoformat(), date_to.isoformat()
+
+def report_response(build):
+    """Отчет за период из ?from/to: build(from, to) -> данные отчета
+    
+    Отчеты читают только дневные агрегаты; updated - до какой строки
+    источников они обновлены (flask --app app refresh-rollups).
+    """
+    error = check_reports_access()
+    if error:
+        return error
+    try:
+        date_from, date_to = report_period()
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, 'from': date_from, 'to': date_to,
+                    'updated': db.get_rollup_watermarks(), **build(date_from, date_to)})
+
+@bp.route('/api/reports/sales', methods=['GET'])
+def sales_report():
+    """Заказы и выручка по дням"""
+    def build(date_from, date_to):
+        days = db.get_sales_report(date_from, date_to)
+        return {'days': days, 'total': {'orders': sum(d['orders'] for d in days),
+                                        'revenue': sum(d['revenue'] for d in days)}}
+    return report_response(build)
+
+@bp.route('/api/reports/parts', methods=['GET'])
+def parts_report():
+    """Самые продаваемые запчасти: ?limit=20"""
+    limit = max(1, min(request.args.get('limit', 20, type=int), PARTS_PAGE_MAX))
+    return report_response(lambda date_from, date_to: {
+        'parts': db.get_part_sales_report(date_from, date_to, limit)})
+
+@bp.route('/api/reports/categories', methods=['GET'])
+def categories_report():
+    """Продажи по категориям"""
+    return report_response(lambda date_from, date_to: {
+        'categories': db.get_category_sales_report(date_from, date_to)})
+
+@bp.route('/api/reports/appointments', methods=['GET'])
+def appointments_report():
+    """Записи на обслуживание по дням и услугам"""
+    return report_response(lambda date_from, date_to: {
+        'days': db.get_appointments_report(date_from, date_to)})
+
+# ========== ФАБРИКА ПРИЛОЖЕНИЯ ==========
+
+def create_app(config=None):
+    """Приложение Flask с настройками из config.py (config - поверх них)
+    
+    Создание дешевое: база открывается при первом запросе (get_db),
+    схема и начальные данные готовятся один раз командой bootstrap.
+    """
+    app = Flask(__name__)
+    load_config(app, config)
+    # Кириллица в JSON - как есть в UTF-8, а не \uXXXX (вдвое короче)
+    app.json.ensure_ascii = False
+    
+    # Метрики (/metrics) - первыми, чтобы их after_request выполнялся
+    # последним и время ответа включало сжатие
+    Metrics(app)
+    # Правила автоответов чата
+    app.extensions['auto_responder'] = KeywordMatcher.from_file()
+    # Сжатие ответов gzip/brotli (настройки COMPRESS_* в app.config)
+    Compressor(app)
+    # Собранная статика (python assets.py): asset_url в шаблонах и /assets/
+    Assets(app)
+    
+    app.register_blueprint(bp)
+    app.cli.add_command(bootstrap_command)
+    app.cli.add_command(refresh_rollups_command)
+    app.cli.add_command(archive_command)
+    return app
+
+def bootstrap(app, seed=True):
+    """Миграции схемы и тестовый каталог - один раз при развертывании"""
+    database = open_database(app.config)
+    try:
+        database.init_database()
+        if seed:
+            database.init_parts_data()
+    finally:
+        database.close()
+
+@click.command('bootstrap')
+@click.option('--seed/--no-seed', default=True, help='Заполнить пустой каталог тестовыми запчастями')
+@with_appcontext
+def bootstrap_command(seed):
+    """Подготовка базы перед запуском рабочих процессов"""
+    bootstrap(current_app, seed)
+
+@click.command('refresh-rollups')
+@click.option('--rebuild', is_flag=True, help='Пересчитать агрегаты с нуля')
+@with_appcontext
+def refresh_rollups_command(rebuild):
+    """Дообработать новые заказы и записи в агрегатах отчетов (запускать по cron)"""
+    database = open_database(current_app.config)
+    try:
+        database.check_schema()
+        processed = database.rebuild_rollups() if rebuild else database.refresh_rollups()
+    finally:
+        database.close()
+    click.echo(', '.join(f'{source}: {count}' for source, count in processed.items()))
+
+@click.command('archive')
+@click.option('--days', type=int, help='Переносить строки старше стольких дней (по умолчанию ARCHIVE_AFTER_DAYS)')
+@with_appcontext
+def archive_command(days):
+    """Перенести старую переписку и закрытые заказы в помесячный архив (запускать по cron)"""
+    config = current_app.config
+    database = open_database(config)
+    try:
+        database.check_schema()
+        moved = database.archive_history(days or config['ARCHIVE_AFTER_DAYS'],
+                                         order_statuses=config['ARCHIVE_ORDER_STATUSES'],
+                                         batch_size=config['ARCHIVE_BATCH_SIZE'],
+                                         vacuum_pages=config['ARCHIVE_VACUUM_PAGES'])
+        stats = database.get_archive_stats()
+    finally:
+        database.close()
+    click.echo(', '.join(f'{name}: {count}' for name, count in moved.items()))
+    click.echo(f"База: {stats['pages'] * stats['page_size'] // 1024} КБ, свободно страниц {stats['free_pages']}; "
+               f"архив: {len(stats['archive_months'])} мес., {stats['archive_bytes'] // 1024} КБ")
+
 # ========== ЗАПУСК ПРИЛОЖЕНИЯ ==========
 
+# flask --app app bootstrap; gunicorn 'app:create_app()' или app:app
+app = create_app()
+
 if __name__ == '__main__':
+    # Сервер разработки - один процесс, базу готовим здесь же
+    bootstrap(app)
     app.run(debug=True, port=5000)
     
\ No newline at end of file
@@ -0,0 +1,116 @@
+"""Помесячные архивы старой переписки и закрытых заказов
+
+Database.archive_history переносит строки старше заданного возраста из
+основной базы в отдельные файлы SQLite по месяцам создания строки
+(<папка>/2024-05.db) с теми же колонками. Основная база остается
+маленькой и помещается в кэш, а архив читается только по запросу:
+прокрутка истории чата назад, заказы с ?archived=1, выгрузки. Какие
+месяцы есть у пользователя, хранит таблица archive_index основной базы,
+поэтому чтение открывает только нужные файлы.
+"""
+import os
+import re
+import sqlite3
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+# Имя основной базы в соединении, к которому подключен файл архива
+SCHEMA = 'archive'
+
+# Архивируемые таблицы: колонки копируются в этом порядке
+COLUMNS = {
+    'chat_messages': 'id, user_id, user_name, message, is_support, is_read, created_at',
+    'orders': 'id, user_id, order_data, total_price, status, created_at',
+    'order_items': 'id, order_id, part_id, name, price, image, quantity',
+}
+
+# Схема файла архива: колонки как в основной базе, без AUTOINCREMENT и
+# внешних ключей; индексы - под чтение по пользователю
+ARCHIVE_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS {schema}.chat_messages (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER,
+        user_name TEXT,
+        message TEXT NOT NULL,
+        is_support BOOLEAN DEFAULT 0,
+        is_read BOOLEAN DEFAULT 0,
+        created_at TIMESTAMP
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS {schema}.idx_chat_user_id ON chat_messages (user_id, id)',
+    '''
+    CREATE TABLE IF NOT EXISTS {schema}.orders (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER,
+        order_data TEXT NOT NULL,
+        total_price INTEGER NOT NULL,
+        status TEXT,
+        created_at TIMESTAMP
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS {schema}.idx_orders_user_created ON orders (user_id, created_at)',
+    '''
+    CREATE TABLE IF NOT EXISTS {schema}.order_items (
+        id INTEGER PRIMARY KEY,
+        order_id INTEGER NOT NULL,
+        part_id INTEGER,
+        name TEXT,
+        price INTEGER NOT NULL,
+        image TEXT,
+        quantity INTEGER NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS {schema}.idx_order_items_order ON order_items (order_id)',
+]
+
+MONTH_RE = re.compile(r'^\d{4}-\d{2}$')
+
+
+class MonthlyArchive:
+    """Папка с файлами архива, по одному на месяц"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, month):
+        if not MONTH_RE.match(month or ''):
+            raise ValueError(f'Некорректный месяц архива: {month!r}')
+        return os.path.join(self.directory, f'{month}.db')
+
+    def months(self):
+        """Месяцы, для которых есть файлы, по возрастанию"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-3] for name in os.listdir(self.directory)
+                      if name.endswith('.db') and MONTH_RE.match(name[:-3]))
+
+    def size(self):
+        """Суммарный размер файлов архива в байтах"""
+        return sum(os.path.getsize(self.path(month)) for month in self.months())
+
+    @contextmanager
+    def attached(self, conn, month):
+        """Файл месяца подключен к conn как archive.* (создается при первой записи)
+
+        ATTACH и DETACH нельзя выполнять внутри транзакции: транзакции
+        открываются уже внутри блока with.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        conn.execute(f'ATTACH DATABASE ? AS {SCHEMA}', (self.path(month),))
+        try:
+            for sql in ARCHIVE_SCHEMA:
+                conn.execute(sql.format(schema=SCHEMA))
+            yield conn
+        finally:
+            conn.execute(f'DETACH DATABASE {SCHEMA}')
+
+    @contextmanager
+    def reader(self, month):
+        """Соединение только для чтения с файлом месяца"""
+        uri = 'file:' + pathname2url(os.path.abspath(self.path(month))) + '?mode=ro'
+        conn = sqlite3.connect(uri, uri=True)
+        try:
+            yield conn
+        finally:
+            conn.close()
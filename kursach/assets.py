@@ -0,0 +1,307 @@
+"""Сборка статики: минификация, имена с хэшем содержимого и предварительное сжатие
+
+Исходники (ASSET_SOURCES в static/) собираются в static/dist/: файл
+получает в имени хэш содержимого (app.3f9c0a1b2e.js), рядом кладутся
+.gz и .br (если установлен пакет brotli). manifest.json сопоставляет
+исходник и собранный файл. Собранные файлы не меняются никогда, поэтому
+отдаются с Cache-Control: immutable на год; новая версия - новое имя.
+
+Без сборки (или в режиме отладки) asset_url ведет на исходники в static/.
+
+Запуск из папки kursach:
+    python assets.py
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import sys
+
+from flask import abort, current_app, request, send_file, url_for
+
+from compression import brotli, negotiate
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_FOLDER = os.path.join(BASE_DIR, 'static')
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+ASSET_SOURCES = ('css/style.css', 'js/app.js')
+ASSETS_URL = '/assets'
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Кодировка -> расширение сжатого файла, в порядке предпочтения
+PRECOMPRESSED = {'br': '.br', 'gzip': '.gz'}
+
+# ========== МИНИФИКАЦИЯ ==========
+
+CSS_TOKEN_RE = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|/\*.*?\*/', re.S)
+CSS_STRING_RE = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')')
+
+
+def minify_css(source):
+    """Без комментариев и лишних пробелов; строки в кавычках не трогаются"""
+    source = CSS_TOKEN_RE.sub(lambda m: m.group(1) or '', source)
+    parts = CSS_STRING_RE.split(source)
+    for index in range(0, len(parts), 2):
+        part = re.sub(r'\s+', ' ', parts[index])
+        part = re.sub(r' ?([{};,>]) ?', r'\1', part)
+        part = re.sub(r': ', ':', part)
+        parts[index] = part.replace(';}', '}')
+    return ''.join(parts).strip() + '\n'
+
+
+# После этих символов и слов / начинает регулярное выражение, а не деление
+REGEX_AFTER = set('(,=:[!&|?{};+-*%<>~^')
+REGEX_KEYWORDS = {'return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'new',
+                  'delete', 'void', 'throw', 'instanceof', 'yield', 'await'}
+
+
+def _is_word(char):
+    return char.isalnum() or char in '_$'
+
+
+def _skip_quoted(source, start, quote):
+    """Индекс за концом строки в кавычках, начатой в start"""
+    i = start + 1
+    while source[i] != quote:
+        i += 2 if source[i] == '\\' else 1
+    return i + 1
+
+
+def _skip_regex(source, start):
+    """Индекс за концом регулярного выражения /.../флаги, начатого в start"""
+    i = start + 1
+    in_class = False
+    while True:
+        char = source[i]
+        if char == '\\':
+            i += 2
+            continue
+        if char == '[':
+            in_class = True
+        elif char == ']':
+            in_class = False
+        elif char == '/' and not in_class:
+            break
+        i += 1
+    i += 1
+    while i < len(source) and _is_word(source[i]):
+        i += 1
+    return i
+
+
+def minify_js(source):
+    """Удаляет комментарии, отступы и пробелы, не разделяющие слова
+
+    Переводы строк сохраняются - на них опирается автоматическая вставка
+    точки с запятой. Строки, шаблонные строки (с вложенными ${...})
+    и регулярные выражения копируются как есть.
+    """
+    out = []
+    templates = []  # глубина фигурных скобок в каждой открытой подстановке ${...}
+    pending = ''    # пробел или перевод строки, еще не записанный в out
+    last = ''       # последний значимый символ кода
+    word = ''       # последнее слово кода, если за ним ничего не было
+    i, n = 0, len(source)
+
+    def emit(text):
+        nonlocal pending
+        if pending and out:
+            prev, following = out[-1][-1], text[0]
+            if (pending == '\n' or (_is_word(prev) and _is_word(following))
+                    or (prev in '+-' and following == prev)):
+                out.append(pending)
+        pending = ''
+        out.append(text)
+
+    while i < n:
+        char = source[i]
+        if char.isspace():
+            j = i
+            while j < n and source[j].isspace():
+                j += 1
+            if '\n' in source[i:j] or pending == '\n':
+                pending = '\n'
+            else:
+                pending = ' '
+            i = j
+        elif source.startswith('//', i):
+            j = source.find('\n', i)
+            i = n if j < 0 else j
+        elif source.startswith('/*', i):
+            j = source.index('*/', i + 2) + 2
+            if '\n' in source[i:j] or pending == '\n':
+                pending = '\n'
+            elif not pending:
+                pending = ' '
+            i = j
+        elif char == '`' or (char == '}' and templates and templates[-1] == 0):
+            # Кусок шаблонной строки до закрывающей ` или до следующей ${
+            if char == '}':
+                templates.pop()
+            j = i + 1
+            while source[j] != '`' and not source.startswith('${', j):
+                j += 2 if source[j] == '\\' else 1
+            if source[j] == '`':
+                j += 1
+                last = '`'
+            else:
+                j += 2
+                templates.append(0)
+                last = '{'
+            emit(source[i:j])
+            word = ''
+            i = j
+        elif char in '\'"':
+            j = _skip_quoted(source, i, char)
+            emit(source[i:j])
+            last, word = char, ''
+            i = j
+        elif char == '/' and (last in REGEX_AFTER or not last or word in REGEX_KEYWORDS):
+            j = _skip_regex(source, i)
+            emit(source[i:j])
+            last, word = ')', ''
+            i = j
+        elif _is_word(char):
+            j = i
+            while j < n and _is_word(source[j]):
+                j += 1
+            word = source[i:j]
+            emit(word)
+            last = word[-1]
+            i = j
+        else:
+            if templates and char == '{':
+                templates[-1] += 1
+            elif templates and char == '}':
+                templates[-1] -= 1
+            emit(char)
+            last, word = char, ''
+            i += 1
+    return ''.join(out) + '\n'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+# ========== СБОРКА ==========
+
+def hashed_name(name, content):
+    """css/style.css -> css/style.<10 знаков sha256>.css"""
+    root, ext = os.path.splitext(name)
+    digest = hashlib.sha256(content).hexdigest()[:10]
+    return f'{root}.{digest}{ext}'
+
+
+def build(static_folder=STATIC_FOLDER, sources=ASSET_SOURCES):
+    """Собрать статику в static/dist; возвращает [(исходник, собранный, {вариант: байт})]"""
+    dist = os.path.join(static_folder, DIST_DIR)
+    for root, _, files in os.walk(dist):
+        for filename in files:
+            os.remove(os.path.join(root, filename))
+
+    manifest = {}
+    report = []
+    for name in sources:
+        with open(os.path.join(static_folder, name), encoding='utf-8') as f:
+            source = f.read()
+        minify = MINIFIERS.get(os.path.splitext(name)[1])
+        content = (minify(source) if minify else source).encode('utf-8')
+        built = hashed_name(name, content)
+        path = os.path.join(dist, built)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        variants = {'source': len(source.encode('utf-8')), 'min': len(content)}
+        outputs = {path: content,
+                   path + PRECOMPRESSED['gzip']: gzip.compress(content, compresslevel=9, mtime=0)}
+        if brotli:
+            outputs[path + PRECOMPRESSED['br']] = brotli.compress(content, quality=11)
+        for output, data in outputs.items():
+            with open(output, 'wb') as f:
+                f.write(data)
+        variants.update((encoding, len(outputs[path + ext])) for encoding, ext in PRECOMPRESSED.items()
+                        if path + ext in outputs)
+
+        manifest[name] = built
+        report.append((name, built, variants))
+
+    with open(os.path.join(dist, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return report
+
+
+# ========== ОТДАЧА ==========
+
+class Assets:
+    """Ссылки на собранную статику (asset_url в шаблонах) и маршрут /assets/
+
+    Для каждого собранного файла отдается лучший из сжатых вариантов,
+    который принимает клиент; вариант выбирается по Accept-Encoding.
+    """
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        self.files = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.dist_folder = os.path.join(app.static_folder, DIST_DIR)
+        self.load_manifest()
+        app.add_url_rule(f'{ASSETS_URL}/<path:filename>', 'assets', self.serve)
+        app.jinja_env.globals['asset_url'] = self.url
+        app.extensions['assets'] = self
+
+    def load_manifest(self):
+        """Прочитать manifest.json сборки; без сборки ссылки ведут на исходники"""
+        path = os.path.join(self.dist_folder, MANIFEST)
+        if not os.path.exists(path):
+            self.manifest, self.files = {}, {}
+            return
+        with open(path, encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        # Собранный файл -> кодировки, для которых есть сжатый вариант
+        self.files = {
+            built: [encoding for encoding, ext in PRECOMPRESSED.items()
+                    if os.path.exists(os.path.join(self.dist_folder, built + ext))]
+            for built in self.manifest.values()
+        }
+
+    def url(self, name):
+        """Адрес статики для шаблона: собранный файл, если он есть"""
+        built = None if current_app.debug else self.manifest.get(name)
+        if built:
+            return url_for('assets', filename=built)
+        return url_for('static', filename=name)
+
+    def serve(self, filename):
+        encodings = self.files.get(filename)
+        if encodings is None:
+            abort(404)
+        encoding = negotiate(request.accept_encodings, encodings)
+        path = os.path.join(self.dist_folder, filename)
+        if encoding:
+            path += PRECOMPRESSED[encoding]
+        response = send_file(path, mimetype=mimetypes.guess_type(filename)[0],
+                             max_age=IMMUTABLE_MAX_AGE, conditional=True)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+
+def main():
+    report = build()
+    print(f'{"исходник":<16}{"собран":<28}{"байт":>8}{"мин.":>8}{"gzip":>8}{"br":>8}')
+    for name, built, variants in report:
+        print(f'{name:<16}{built:<28}{variants["source"]:>8}{variants["min"]:>8}'
+              f'{variants.get("gzip", "-"):>8}{variants.get("br", "-"):>8}')
+    print(f'Манифест: {os.path.join(STATIC_FOLDER, DIST_DIR, MANIFEST)}')
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
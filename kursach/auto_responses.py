@@ -0,0 +1,79 @@
+"""Автоответы чата: сопоставление сообщения с ключевыми словами за один проход"""
+import json
+import os
+import re
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'auto_responses.json')
+
+# Слово с дефисами считается одним токеном: "что-то" не совпадает с "то"
+TOKEN_RE = re.compile(r'\w+(?:-\w+)*')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower().replace('ё', 'е'))
+
+
+class KeywordMatcher:
+    """Поиск автоответа по набору правил
+
+    Правило задаёт ответ, приоритет и ключевые слова двух видов:
+    stems совпадают с началом слова ("скидк" -> "скидку", "скидки"),
+    words - только со словом целиком ("то" не совпадает с "тормоз").
+    Ключевое слово из нескольких слов совпадает с подряд идущими словами
+    сообщения; основой может быть только последнее из них.
+
+    Все ключевые слова собираются в словари один раз, поэтому стоимость
+    сообщения зависит от его длины, а не от числа правил. Если совпало
+    несколько правил, побеждает большее priority, затем более длинное
+    ключевое слово, затем совпадение ближе к началу сообщения, затем
+    правило, стоящее в списке раньше.
+    """
+
+    def __init__(self, rules):
+        self._words = {}
+        self._stems = {}
+        for order, rule in enumerate(rules):
+            response = rule['response']
+            priority = rule.get('priority', 0)
+            for index, keywords in ((self._words, rule.get('words', ())),
+                                    (self._stems, rule.get('stems', ()))):
+                for keyword in keywords:
+                    key = tuple(tokenize(keyword))
+                    if not key:
+                        raise ValueError(f'Пустое ключевое слово в правиле {order}')
+                    rank = (priority, len(' '.join(key)), -order)
+                    if key not in index or index[key][0] < rank:
+                        index[key] = (rank, response)
+
+        self._phrase_lengths = sorted({len(key) for key in self._words} | {len(key) for key in self._stems})
+        self._stem_lengths = sorted({len(key[-1]) for key in self._stems})
+        self.rules_count = len(rules)
+
+    @classmethod
+    def from_file(cls, path=RULES_PATH):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f)['rules'])
+
+    def match(self, message):
+        """Ответ лучшего совпавшего правила или None"""
+        tokens = tokenize(message)
+        best = None
+        for position in range(len(tokens)):
+            for length in self._phrase_lengths:
+                if position + length > len(tokens):
+                    break
+                head = tuple(tokens[position:position + length - 1])
+                last = tokens[position + length - 1]
+                candidates = [self._words.get(head + (last,))]
+                for stem_length in self._stem_lengths:
+                    if stem_length > len(last):
+                        break
+                    candidates.append(self._stems.get(head + (last[:stem_length],)))
+                for found in candidates:
+                    if found is None:
+                        continue
+                    (priority, keyword_length, order), response = found
+                    score = (priority, keyword_length, -position, order)
+                    if best is None or score > best[0]:
+                        best = (score, response)
+        return best[1] if best else None
@@ -0,0 +1,454 @@
+"""Нагрузочный прогон всех маршрутов /api/*: задержки p50/p95/p99 и пропускная способность
+
+Синтетическая база заданного размера (пользователи, сообщения чата,
+заказы с позициями, каталог, автомобили, записи) заполняется с
+фиксированным seed, поэтому прогоны воспроизводимы. Каждый маршрут
+нагружается --clients потоками, у каждого свой тестовый клиент Flask
+и свой вошедший пользователь. Подготовка запроса (выбор свободного
+слота, создание удаляемой записи и т. п.) в замер не входит.
+
+Результаты можно сохранить как базовые (--save-baseline) и сравнивать
+с ними следующие прогоны (--baseline): если p95 маршрута вырос или
+пропускная способность упала больше чем на --threshold, скрипт
+завершается с кодом 1. Базовые значения зависят от машины - сравнивать
+имеет смысл прогоны на одной и той же машине с тем же размером базы.
+
+Запуск из папки kursach:
+    python benchmarks/bench_api.py --save-baseline baseline.json
+    python benchmarks/bench_api.py --baseline baseline.json
+    python benchmarks/bench_api.py --users 100000 --messages 1000000 --orders 500000 \\
+        --parts 100000 --db /tmp/kursach-large.db
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database, BookingError
+from bench_search import fill_parts, QUERIES, CATEGORIES
+
+CHUNK = 50000
+CHAT_TEXTS = ['Здравствуйте, когда будет готова машина?', 'Сколько стоит замена масла?',
+              'Хочу записаться на диагностику', 'Есть ли в наличии тормозные колодки?',
+              'Спасибо!', 'Где вы находитесь?', 'Можно оплатить картой?']
+CAR_BRANDS = [('Toyota', 'Camry'), ('Kia', 'Rio'), ('Hyundai', 'Solaris'),
+              ('Lada', 'Vesta'), ('Renault', 'Logan'), ('Skoda', 'Octavia')]
+
+
+# ========== СИНТЕТИЧЕСКИЕ ДАННЫЕ ==========
+
+def chunked(rows, size=CHUNK):
+    iterator = iter(rows)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def timestamp(rnd, days=365):
+    """Случайный момент за последние days дней в формате CURRENT_TIMESTAMP"""
+    moment = datetime.now() - timedelta(seconds=rnd.randint(0, days * 86400))
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def timeline(index, count, days=365):
+    """Время index-й из count строк за days дней: растет вместе с id, как у CURRENT_TIMESTAMP"""
+    moment = datetime.now() - timedelta(seconds=(count - index) * days * 86400 / max(count, 1))
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def fill_dataset(db, users, messages, orders, parts, seed=42):
+    """Заполнить пустую базу; сообщения, заказы, автомобили и записи - у случайных пользователей"""
+    rnd = random.Random(seed)
+    fill_parts(db, parts, seed=seed)
+    with db.connection() as conn:
+        prices = dict(conn.execute('SELECT id, price FROM parts'))
+
+    def user_rows():
+        for i in range(users):
+            yield (f'Клиент {i}', phone(i), f'client{i}@example.com', timestamp(rnd))
+
+    def message_rows():
+        for i in range(messages):
+            user_id = rnd.randint(1, users)
+            is_support = rnd.random() < 0.4
+            yield (user_id, 'Поддержка' if is_support else f'Клиент {user_id - 1}', rnd.choice(CHAT_TEXTS),
+                   is_support, rnd.random() < 0.9, timeline(i, messages))
+
+    recent = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d %H:%M:%S')
+
+    def order_rows():
+        for order_id in range(1, orders + 1):
+            items = [{'id': part_id, 'name': f'Запчасть {part_id}', 'price': prices[part_id],
+                      'image': '', 'quantity': rnd.randint(1, 3)}
+                     for part_id in rnd.sample(range(1, parts + 1), min(parts, rnd.randint(1, 3)))]
+            total = sum(item['price'] * item['quantity'] for item in items)
+            created_at = timeline(order_id - 1, orders)
+            # Старые заказы выполнены, в работе - только последние
+            status = rnd.choice(('new', 'processing', 'done')) if created_at >= recent else 'done'
+            yield order_id, rnd.randint(1, users), items, total, status, created_at
+
+    def car_rows():
+        for _ in range(users // 2):
+            brand, model = rnd.choice(CAR_BRANDS)
+            yield rnd.randint(1, users), brand, model, rnd.randint(2005, 2024), timestamp(rnd)
+
+    def appointment_rows():
+        # Прошедшие визиты: слоты будущих дат остаются свободными для замера записи
+        for _ in range(users // 4):
+            brand, model = rnd.choice(CAR_BRANDS)
+            day = date.today() - timedelta(days=rnd.randint(1, 365))
+            yield (rnd.randint(1, users), brand, model, 2015, rnd.choice(('oil', 'diagnostic', 'brake')),
+                   day.isoformat(), '10:00', 'done', timestamp(rnd))
+
+    for chunk in chunked(user_rows()):
+        with db.transaction() as conn:
+            conn.executemany('INSERT INTO users (name, phone, email, created_at) VALUES (?, ?, ?, ?)', chunk)
+    for chunk in chunked(message_rows()):
+        with db.transaction() as conn:
+            conn.executemany('''
+                INSERT INTO chat_messages (user_id, user_name, message, is_support, is_read, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', chunk)
+    for chunk in chunked(order_rows()):
+        with db.transaction() as conn:
+            conn.executemany('''
+                INSERT INTO orders (id, user_id, order_data, total_price, status, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', [(order_id, user_id, json.dumps(items, ensure_ascii=False), total, status, created_at)
+                  for order_id, user_id, items, total, status, created_at in chunk])
+            db._insert_order_items(conn, [(order_id, item) for order_id, _, items, _, _, _ in chunk
+                                          for item in items])
+    for chunk in chunked(car_rows()):
+        with db.transaction() as conn:
+            conn.executemany('''
+                INSERT INTO user_cars (user_id, brand, model, year, created_at) VALUES (?, ?, ?, ?, ?)
+            ''', chunk)
+    for chunk in chunked(appointment_rows()):
+        with db.transaction() as conn:
+            conn.executemany('''
+                INSERT INTO appointments (user_id, car_brand, car_model, car_year, service_type,
+                                          appointment_date, appointment_time, status, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', chunk)
+    db.rebuild_appointment_slots()
+    db.rebuild_chat_conversations()
+    db.refresh_rollups()
+    with db.transaction() as conn:
+        conn.execute('ANALYZE')
+
+
+def phone(index):
+    return f'+7{9000000000 + index}'
+
+
+def dataset_size(db):
+    with db.connection() as conn:
+        return {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                for table in ('users', 'chat_messages', 'orders', 'parts')}
+
+
+# ========== СЦЕНАРИИ ==========
+
+class Session:
+    """Клиент одного потока: тестовый клиент Flask, вошедший пользователь, свой генератор"""
+
+    def __init__(self, app, db, size, seed):
+        self.client = app.test_client()
+        self.db = db
+        self.rnd = random.Random(seed)
+        self.users = size['users']
+        self.parts = size['parts']
+        self.login()
+
+    def login(self):
+        index = self.rnd.randrange(self.users)
+        response = self.client.post('/api/user', json={'name': f'Клиент {index}', 'phone': phone(index)})
+        self.user_id = response.get_json()['user']['id']
+
+    def free_slot(self):
+        """(услуга, дата, время) свободного слота в пределах горизонта записи"""
+        schedule = self.db.schedule
+        for _ in range(100):
+            service = self.rnd.choice(list(schedule.services))
+            day = (date.today() + timedelta(days=self.rnd.randint(1, schedule.horizon_days))).isoformat()
+            slots = self.db.get_available_slots(service, day, day)[0]['slots']
+            if slots:
+                return service, day, self.rnd.choice(slots)['time']
+        raise RuntimeError('Нет свободных слотов для записи')
+
+    def appointment(self):
+        service, day, time_ = self.free_slot()
+        return {'carBrand': 'Lada', 'carModel': 'Vesta', 'carYear': 2020,
+                'serviceType': service, 'date': day, 'time': time_}
+
+    def booked_appointment(self):
+        while True:
+            try:
+                return self.db.create_appointment(self.user_id, self.appointment())
+            except BookingError:
+                continue
+
+
+def logout(s):
+    s.login()
+    return {'method': 'POST', 'path': '/api/user/logout'}
+
+
+def cancel_appointment(s):
+    return {'method': 'DELETE', 'path': f'/api/appointments/{s.booked_appointment()}'}
+
+
+def delete_car(s):
+    car_id = s.db.add_user_car(s.user_id, {'brand': 'Kia', 'model': 'Rio'})
+    return {'method': 'DELETE', 'path': f'/api/user/cars/{car_id}'}
+
+
+def slots(s):
+    day = date.today() + timedelta(days=s.rnd.randint(1, 7))
+    return {'path': '/api/appointments/slots',
+            'query_string': {'service': s.rnd.choice(list(s.db.schedule.services)),
+                             'from': day.isoformat(), 'to': (day + timedelta(days=6)).isoformat()}}
+
+
+# Маршрут -> (подготовка запроса: Session -> аргументы client.open, допустимые статусы)
+SCENARIOS = {
+    'GET /api/parts': (lambda s: {'path': '/api/parts'}, {200}),
+    'GET /api/parts?filters': (lambda s: {'path': '/api/parts', 'query_string': {
+        'category': s.rnd.choice(CATEGORIES), 'sort': 'price_asc', 'min_price': 1000}}, {200}),
+    'GET /api/parts/search': (lambda s: {'path': '/api/parts/search',
+                                         'query_string': {'q': s.rnd.choice(QUERIES)}}, {200}),
+    'GET /api/parts/<id>': (lambda s: {'path': f'/api/parts/{s.rnd.randint(1, s.parts)}'}, {200}),
+    'POST /api/user': (lambda s: {'method': 'POST', 'path': '/api/user', 'json': {
+        'name': f'Клиент {s.user_id - 1}', 'phone': phone(s.user_id - 1)}}, {200}),
+    'GET /api/user': (lambda s: {'path': '/api/user'}, {200}),
+    'POST /api/user/logout': (logout, {200}),
+    'PUT /api/user/profile': (lambda s: {'method': 'PUT', 'path': '/api/user/profile', 'json': {
+        'name': f'Клиент {s.user_id - 1}', 'email': f'client{s.user_id - 1}@example.com'}}, {200}),
+    'POST /api/orders': (lambda s: {'method': 'POST', 'path': '/api/orders', 'json': {'items': [
+        {'id': s.rnd.randint(1, s.parts), 'quantity': s.rnd.randint(1, 3)}
+        for _ in range(s.rnd.randint(1, 3))]}}, {200}),
+    'GET /api/orders': (lambda s: {'path': '/api/orders'}, {200}),
+    'GET /api/orders?archived': (lambda s: {'path': '/api/orders', 'query_string': {'archived': 1}}, {200}),
+    # Свободный слот мог занять другой поток между подготовкой и запросом - тогда 409
+    'POST /api/appointments': (lambda s: {'method': 'POST', 'path': '/api/appointments',
+                                          'json': s.appointment()}, {200, 409}),
+    'GET /api/appointments': (lambda s: {'path': '/api/appointments'}, {200}),
+    'GET /api/appointments/slots': (slots, {200}),
+    'DELETE /api/appointments/<id>': (cancel_appointment, {200}),
+    'GET /api/user/cars': (lambda s: {'path': '/api/user/cars'}, {200}),
+    'POST /api/user/cars': (lambda s: {'method': 'POST', 'path': '/api/user/cars', 'json': {
+        'brand': 'Toyota', 'model': 'Camry', 'year': 2018}}, {200}),
+    'DELETE /api/user/cars/<id>': (delete_car, {200}),
+    'GET /api/user/dashboard': (lambda s: {'path': '/api/user/dashboard'}, {200}),
+    'POST /api/chat/messages': (lambda s: {'method': 'POST', 'path': '/api/chat/messages',
+                                           'json': {'message': s.rnd.choice(CHAT_TEXTS)}}, {200}),
+    'GET /api/chat/history': (lambda s: {'path': '/api/chat/history'}, {200}),
+    'GET /api/chat/unread': (lambda s: {'path': '/api/chat/unread'}, {200}),
+    # Поток бесконечный: замеряется время до первых двух событий (retry и unread)
+    'GET /api/chat/stream': (lambda s: {'path': '/api/chat/stream', 'buffered': False}, {200}),
+    'POST /api/chat/read': (lambda s: {'method': 'POST', 'path': '/api/chat/read'}, {200}),
+    'GET /api/export/parts': (lambda s: {'path': '/api/export/parts'}, {200}),
+    'GET /api/export/orders': (lambda s: {'path': '/api/export/orders', 'query_string': {'format': 'csv'}}, {200}),
+    'GET /api/export/chat': (lambda s: {'path': '/api/export/chat'}, {200}),
+    'GET /api/stats': (lambda s: {'path': '/api/stats'}, {200}),
+}
+
+STREAM_EVENTS = 2
+REPORTS_TOKEN = OPERATOR_TOKEN = 'bench'
+REPORTS_HEADERS = OPERATOR_HEADERS = {'Authorization': f'Bearer {REPORTS_TOKEN}'}
+
+# Отчеты за 30 дней (по умолчанию) и за год
+for report in ('sales', 'parts', 'categories', 'appointments'):
+    SCENARIOS[f'GET /api/reports/{report}'] = (
+        lambda s, report=report: {'path': f'/api/reports/{report}', 'headers': REPORTS_HEADERS}, {200})
+SCENARIOS['GET /api/reports/sales?year'] = (lambda s: {
+    'path': '/api/reports/sales', 'headers': REPORTS_HEADERS,
+    'query_string': {'from': (date.today() - timedelta(days=364)).isoformat()}}, {200})
+
+
+def conversation(s):
+    """Адрес разговора случайного клиента, писавшего в чат"""
+    with s.db.connection() as conn:
+        user_id = conn.execute('''
+            SELECT COALESCE((SELECT user_id FROM chat_conversations WHERE user_id >= ? ORDER BY user_id LIMIT 1),
+                            (SELECT MIN(user_id) FROM chat_conversations))
+        ''', (s.rnd.randint(1, s.users),)).fetchone()[0]
+    return f'/api/operator/conversations/{user_id}'
+
+
+SCENARIOS.update({
+    'GET /api/operator/conversations': (lambda s: {'path': '/api/operator/conversations',
+                                                   'headers': OPERATOR_HEADERS}, {200}),
+    'GET /api/operator/conv...?unread': (lambda s: {
+        'path': '/api/operator/conversations', 'headers': OPERATOR_HEADERS,
+        'query_string': {'unread': 1}}, {200}),
+    'GET /api/operator/.../messages': (lambda s: {'path': conversation(s) + '/messages',
+                                                  'headers': OPERATOR_HEADERS}, {200}),
+    'POST /api/operator/.../messages': (lambda s: {'method': 'POST', 'path': conversation(s) + '/messages',
+                                                   'headers': OPERATOR_HEADERS,
+                                                   'json': {'message': 'Здравствуйте!'}}, {200}),
+    'POST /api/operator/.../read': (lambda s: {'method': 'POST', 'path': conversation(s) + '/read',
+                                               'headers': OPERATOR_HEADERS}, {200}),
+})
+
+
+def timed_request(client, kwargs):
+    """Секунды на запрос и статус; тело читается целиком (у потока - первые события)"""
+    started = time.perf_counter()
+    response = client.open(**kwargs)
+    if kwargs.get('buffered') is False:
+        for _ in itertools.islice(response.response, STREAM_EVENTS):
+            pass
+        response.close()
+    else:
+        response.get_data()
+    return time.perf_counter() - started, response.status_code
+
+
+# ========== ПРОГОН ==========
+
+def percentile(sorted_values, p):
+    """Значение с рангом p% (ближайший ранг)"""
+    index = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(app, db, size, prepare, expected, clients, requests, seed):
+    """Нагрузить маршрут clients потоками, requests запросов на всех вместе"""
+    sessions = [Session(app, db, size, seed + i) for i in range(clients)]
+    barrier = threading.Barrier(clients + 1)
+    timings = [[] for _ in range(clients)]
+    errors = [[] for _ in range(clients)]
+
+    def worker(index):
+        session = sessions[index]
+        barrier.wait()
+        for _ in range(requests // clients + (index < requests % clients)):
+            seconds, status = timed_request(session.client, prepare(session))
+            timings[index].append(seconds)
+            if status not in expected:
+                errors[index].append(status)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    values = sorted(t for thread_timings in timings for t in thread_timings)
+    return {
+        'requests': len(values),
+        'errors': sum(len(e) for e in errors),
+        'p50_ms': percentile(values, 50) * 1000,
+        'p95_ms': percentile(values, 95) * 1000,
+        'p99_ms': percentile(values, 99) * 1000,
+        # Время подготовки запросов входит в wall - это нижняя оценка пропускной способности
+        'rps': len(values) / wall,
+    }
+
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """Маршруты, где p95 или пропускная способность хуже базовых больше чем на threshold"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline['endpoints'].get(name)
+        if base is None:
+            continue
+        if (result['p95_ms'] > base['p95_ms'] * (1 + threshold)
+                and result['p95_ms'] - base['p95_ms'] > min_delta_ms):
+            regressions.append(f'{name}: p95 {base["p95_ms"]:.2f} -> {result["p95_ms"]:.2f} мс')
+        if result['rps'] < base['rps'] / (1 + threshold):
+            regressions.append(f'{name}: {base["rps"]:.0f} -> {result["rps"]:.0f} запросов/с')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--orders', type=int, default=10000)
+    parser.add_argument('--parts', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--db', help='файл базы; если в нем уже есть данные, они используются как есть')
+    parser.add_argument('--clients', type=int, default=4, help='одновременных клиентов на маршрут')
+    parser.add_argument('--requests', type=int, default=200, help='запросов на маршрут')
+    parser.add_argument('--only', nargs='*', help='подстроки названий маршрутов, например "chat" "GET /api/parts"')
+    parser.add_argument('--baseline', help='JSON с базовыми результатами для сравнения')
+    parser.add_argument('--save-baseline', help='сохранить результаты прогона в JSON')
+    parser.add_argument('--threshold', type=float, default=0.25, help='допустимое ухудшение, доля')
+    parser.add_argument('--min-delta-ms', type=float, default=0.5,
+                        help='меньший рост p95 не считается регрессией (шум на быстрых маршрутах)')
+    args = parser.parse_args()
+
+    from app import create_app
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db or os.path.join(tmp, 'bench.db')
+        db = Database(path)
+        db.init_database()
+        if not dataset_size(db)['users']:
+            started = time.perf_counter()
+            fill_dataset(db, args.users, args.messages, args.orders, args.parts, args.seed)
+            print(f'База заполнена за {time.perf_counter() - started:.1f} с')
+        size = dataset_size(db)
+        print('Размер базы: ' + ', '.join(f'{table} {count}' for table, count in size.items()))
+
+        app = create_app({'DATABASE_PATH': path, 'REPORTS_TOKEN': REPORTS_TOKEN,
+                          'OPERATOR_TOKEN': OPERATOR_TOKEN})
+        scenarios = {name: scenario for name, scenario in SCENARIOS.items()
+                     if not args.only or any(part in name for part in args.only)}
+
+        print(f'{"маршрут":<32}{"p50, мс":>9}{"p95, мс":>9}{"p99, мс":>9}{"запр/с":>9}{"ошибки":>8}')
+        results = {}
+        for name, (prepare, expected) in scenarios.items():
+            result = results[name] = run_scenario(app, db, size, prepare, expected,
+                                                  args.clients, args.requests, args.seed)
+            print(f'{name:<32}{result["p50_ms"]:>9.2f}{result["p95_ms"]:>9.2f}{result["p99_ms"]:>9.2f}'
+                  f'{result["rps"]:>9.0f}{result["errors"]:>8}')
+        db.close()
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.platform(),
+        'dataset': size,
+        'clients': args.clients,
+        'requests': args.requests,
+        'endpoints': results,
+    }
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f'Базовые результаты сохранены: {args.save_baseline}')
+
+    failed = any(result['errors'] for result in results.values())
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline['dataset'] != size or baseline['clients'] != args.clients:
+            print('Внимание: размер базы или число клиентов отличаются от базового прогона')
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        for line in regressions:
+            print(f'Регрессия: {line}')
+        if not regressions:
+            print(f'Регрессий больше {args.threshold:.0%} нет')
+        failed = failed or bool(regressions)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Помесячный архив: размер основной базы и проверка, что история не потерялась
+
+Синтетическая база (bench_api.fill_dataset) архивируется
+Database.archive_history. До и после сравниваются: полная история чата
+с прокруткой назад, выгрузки чата и заказов, заказы с архивными, счетчики
+/api/stats, агрегаты отчетов (и их полный пересчет с архивом) и сводка
+разговоров оператора. При расхождении скрипт завершается с кодом 1.
+Печатаются размер базы и время типичных чтений до и после.
+
+Запуск из папки kursach:
+    python benchmarks/bench_archive.py --messages 500000 --orders 200000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database, ROLLUP_TABLES
+from models import to_dicts
+from bench_api import fill_dataset
+
+
+def full_history(db, user_id, page=50):
+    """Вся переписка пользователя прокруткой назад, как в /api/chat/history"""
+    messages = db.get_chat_history(user_id, limit=page)
+    has_more = len(messages) == page or db.has_archived_chat(user_id, messages[0].id if messages else None)
+    while has_more:
+        chunk = db.get_chat_history(user_id, limit=page, before_id=messages[0].id)
+        messages = chunk + messages
+        has_more = len(chunk) == page
+    return to_dicts(messages)
+
+
+def user_snapshot(db, user_id):
+    return {
+        'history': full_history(db, user_id),
+        'export_chat': to_dicts(db.export_chat(user_id)),
+        'export_orders': to_dicts(db.export_orders(user_id)),
+        'orders': to_dicts(db.get_user_orders(user_id, include_archived=True)),
+    }
+
+
+def rollups(db):
+    with db.connection() as conn:
+        return {table: sorted(conn.execute(f'SELECT * FROM {table}').fetchall()) for table in ROLLUP_TABLES}
+
+
+def conversations_mismatch(db):
+    """Сводка разговоров против пересчета по сообщениям основной базы"""
+    with db.connection() as conn:
+        stored = set(conn.execute('SELECT * FROM chat_conversations').fetchall())
+        expected = set(conn.execute('''
+            SELECT user_id, MAX(id), SUM(is_support = 0 AND is_read = 0), SUM(is_support = 1 AND is_read = 0)
+            FROM chat_messages WHERE user_id IS NOT NULL GROUP BY user_id
+        ''').fetchall())
+    return stored != expected
+
+
+def db_size(db):
+    """(КБ файла после контрольной точки WAL, строк чата, строк заказов)"""
+    with db.connection() as conn:
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        messages = conn.execute('SELECT COUNT(*) FROM chat_messages').fetchone()[0]
+        orders = conn.execute('SELECT COUNT(*) FROM orders').fetchone()[0]
+    return os.path.getsize(db.db_name) // 1024, messages, orders
+
+
+def reads(db, users, repeat):
+    """Мкс на типичные чтения по случайным пользователям: (последняя страница чата, заказы)"""
+    rnd = random.Random(7)
+    sample = [rnd.choice(users) for _ in range(repeat)]
+    timings = []
+    for func in (lambda user_id: db.get_chat_history(user_id),
+                 lambda user_id: db.get_user_orders(user_id)):
+        started = time.perf_counter()
+        for user_id in sample:
+            func(user_id)
+        timings.append((time.perf_counter() - started) / repeat * 1e6)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--orders', type=int, default=100000)
+    parser.add_argument('--parts', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=90, help='возраст архивируемых строк')
+    parser.add_argument('--check-users', type=int, default=200, help='пользователей для сверки истории')
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    failed = False
+
+    def check(title, ok):
+        nonlocal failed
+        failed = failed or not ok
+        print(f'{title}: {"совпадает" if ok else "РАСХОЖДЕНИЕ"}')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'))
+        db.init_database()
+        fill_dataset(db, args.users, args.messages, args.orders, args.parts)
+        users = random.Random(1).sample(range(1, args.users + 1), min(args.check_users, args.users))
+
+        before = {user_id: user_snapshot(db, user_id) for user_id in users}
+        rollups_before, counters_before = rollups(db), db.get_counters()
+        size_before = db_size(db)
+        reads_before = reads(db, users, args.repeat)
+
+        started = time.perf_counter()
+        moved = db.archive_history(args.days)
+        elapsed = time.perf_counter() - started
+        print(f'Перенесено за {elapsed:.1f} с: ' + ', '.join(f'{name} {count}' for name, count in moved.items()))
+
+        size_after = db_size(db)
+        reads_after = reads(db, users, args.repeat)
+        after = {user_id: user_snapshot(db, user_id) for user_id in users}
+        for key in ('history', 'export_chat', 'export_orders', 'orders'):
+            check(f'{key} ({len(users)} пользователей)',
+                  all(before[user_id][key] == after[user_id][key] for user_id in users))
+        db._counters = (0.0, None)
+        check('счетчики /api/stats', db.get_counters() == counters_before)
+        check('агрегаты отчетов', rollups(db) == rollups_before)
+        db.rebuild_rollups()
+        check('агрегаты после rebuild_rollups с архивом', rollups(db) == rollups_before)
+        check('сводка разговоров', not conversations_mismatch(db))
+
+        stats = db.get_archive_stats()
+        print()
+        print(f'{"":<32}{"до":>12}{"после":>12}')
+        for title, index in (('основная база, КБ', 0), ('сообщений чата', 1), ('заказов', 2)):
+            print(f'{title:<32}{size_before[index]:>12}{size_after[index]:>12}')
+        for title, index in (('последняя страница чата, мкс', 0), ('заказы пользователя, мкс', 1)):
+            print(f'{title:<32}{reads_before[index]:>12.1f}{reads_after[index]:>12.1f}')
+        print(f'Архив: {len(stats["archive_months"])} файлов, {stats["archive_bytes"] // 1024} КБ; '
+              f'свободных страниц в базе {stats["free_pages"]}')
+        db.close()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Время подбора автоответа в зависимости от числа правил
+
+Сравниваются прежний перебор (проверка каждого ключевого слова подстрокой
+в сообщении) и KeywordMatcher (словари, собранные один раз). Реальные
+правила из data/auto_responses.json дополняются синтетическими.
+
+Запуск из папки kursach:
+    python benchmarks/bench_auto_response.py
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auto_responses import KeywordMatcher, RULES_PATH
+
+MESSAGES = [
+    'Здравствуйте! Подскажите, сколько стоит замена масла и фильтров на моей машине?',
+    'Добрый вечер, хотел бы уточнить, есть ли у вас в наличии колодки',
+    'спасибо',
+    'Мне нужно что-то сделать с подвеской, стучит спереди справа уже неделю',
+    'ок',
+]
+LETTERS = 'абвгдежзиклмнопрстуфхцчшщэюя'
+
+
+def synthetic_rules(count, seed=1):
+    rng = random.Random(seed)
+    return [{'priority': rng.randint(0, 30),
+             'stems': [''.join(rng.choice(LETTERS) for _ in range(rng.randint(4, 9)))],
+             'response': f'Ответ {i}'}
+            for i in range(count)]
+
+
+def legacy_response(responses, message):
+    """Путь до изменений: подстрока на каждое ключевое слово"""
+    message = message.lower()
+    for key, response in responses.items():
+        if key in message:
+            return response
+    return None
+
+
+def measure(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    with open(RULES_PATH, encoding='utf-8') as f:
+        base_rules = json.load(f)['rules']
+
+    print(f'{"правил":>8}{"сборка, мс":>12}{"было, мкс":>12}{"стало, мкс":>12}')
+    for extra in (0, 300, 3000, 30000):
+        rules = base_rules + synthetic_rules(extra)
+        started = time.perf_counter()
+        matcher = KeywordMatcher(rules)
+        build = (time.perf_counter() - started) * 1000
+        responses = {}
+        for rule in rules:
+            for keyword in rule.get('stems', []) + rule.get('words', []):
+                responses.setdefault(keyword, rule['response'])
+
+        before = measure(lambda: [legacy_response(responses, m) for m in MESSAGES], args.repeat) / len(MESSAGES)
+        after = measure(lambda: [matcher.match(m) for m in MESSAGES], args.repeat) / len(MESSAGES)
+        print(f'{len(rules):>8}{build:>12.1f}{before:>12.1f}{after:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Одновременная запись на одно и то же время: проверка отсутствия перебронирования
+
+Несколько процессов (у каждого свой экземпляр Database и свой пул
+соединений) одновременно пытаются записаться на один слот каждой услуги.
+Успешных записей должно быть ровно столько, сколько у услуги постов,
+а счетчик в appointment_slots должен совпасть с числом записей.
+
+Запуск из папки kursach:
+    python benchmarks/bench_booking.py
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database, BookingError
+
+
+def next_working_day(db, service):
+    day = date.today() + timedelta(days=1)
+    while not db.schedule.start_times(service, day):
+        day += timedelta(days=1)
+    return day
+
+
+def worker(db_name, barrier, jobs, attempts, results):
+    db = Database(db_name, pool_size=2)
+    user = db.get_or_create_user(f'Клиент {os.getpid()}', f'+7{os.getpid():010d}')
+    barrier.wait()
+    booked = rejected = 0
+    started = time.perf_counter()
+    for _ in range(attempts):
+        for service_type, day, time_ in jobs:
+            try:
+                db.create_appointment(user.id, {
+                    'carBrand': 'Lada', 'carModel': 'Vesta', 'carYear': 2020,
+                    'serviceType': service_type, 'date': day, 'time': time_
+                })
+                booked += 1
+            except BookingError:
+                rejected += 1
+    results.put((booked, rejected, time.perf_counter() - started))
+    db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--attempts', type=int, default=20, help='попыток на слот в каждом процессе')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, 'bench.db')
+        db = Database(db_name)
+        db.init_database()
+        jobs = []
+        for service in db.schedule.services.values():
+            day = next_working_day(db, service)
+            jobs.append((service.code, day.isoformat(), next(iter(db.schedule.start_times(service, day)))))
+
+        barrier = multiprocessing.Barrier(args.workers)
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=worker, args=(db_name, barrier, jobs, args.attempts, results))
+                     for _ in range(args.workers)]
+        for p in processes:
+            p.start()
+        outcomes = [results.get() for _ in processes]
+        for p in processes:
+            p.join()
+
+        booked = sum(o[0] for o in outcomes)
+        rejected = sum(o[1] for o in outcomes)
+        elapsed = max(o[2] for o in outcomes)
+        print(f'процессов: {args.workers}, попыток: {booked + rejected}, '
+              f'записано: {booked}, отказов: {rejected}, {(booked + rejected) / elapsed:.0f} попыток/с')
+
+        ok = True
+        with db.connection() as conn:
+            for service_type, day, time_ in jobs:
+                service = db.schedule.service(service_type)
+                count = conn.execute('''
+                    SELECT COUNT(*) FROM appointments
+                    WHERE service_type = ? AND appointment_date = ? AND appointment_time = ?
+                ''', (service_type, day, time_)).fetchone()[0]
+                slots = conn.execute('''
+                    SELECT slot_time, booked FROM appointment_slots
+                    WHERE service_type = ? AND slot_date = ?
+                ''', (service_type, day)).fetchall()
+                valid = count == service.bays and all(b == count for _, b in slots) \
+                    and len(slots) == service.slots
+                ok = ok and valid
+                print(f'{service_type:>12}: постов {service.bays}, записей {count}, '
+                      f'слоты {dict(slots)} {"OK" if valid else "ОШИБКА"}')
+        db.close()
+
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Запись сообщений чата: коммит на каждое сообщение против групповой записи (ChatWriter)
+
+--threads потоков, как обработчики запросов, сохраняют по --messages
+сообщений через Database.save_chat_message и ждут коммита. Сравниваются
+запись без очереди и ChatWriter с разными окнами, при synchronous=NORMAL
+(WAL без fsync на коммит) и synchronous=FULL (fsync на каждый коммит).
+
+Запуск из папки kursach:
+    python benchmarks/bench_chat_writer.py
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+
+def run(path, synchronous, window_ms, threads, messages):
+    """(сообщений в секунду, p50 и p99 ожидания save_chat_message в мс, средний размер пачки)"""
+    db = Database(path, pool_size=threads + 1, pragmas={'synchronous': synchronous})
+    if window_ms is not None:
+        db.start_chat_writer(flush_interval=window_ms / 1000)
+    # У каждого потока свой пользователь, как у разных посетителей чата
+    users = [db.get_or_create_user(f'Клиент {i}', f'+7999{i:07d}') for i in range(threads)]
+    barrier = threading.Barrier(threads + 1)
+    timings = [[] for _ in range(threads)]
+
+    def worker(index):
+        user = users[index]
+        barrier.wait()
+        for i in range(messages):
+            started = time.perf_counter()
+            db.save_chat_message(user.id, user.name, f'Сообщение {i}', is_support=i % 2)
+            timings[index].append(time.perf_counter() - started)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    stats = db.chat_writer.stats() if db.chat_writer else {'written': 1, 'batches': 1}
+    db.close()
+    values = sorted(t for thread_timings in timings for t in thread_timings)
+    return (len(values) / elapsed, values[len(values) // 2] * 1000,
+            values[int(len(values) * 0.99)] * 1000, stats['written'] / stats['batches'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--messages', type=int, default=200, help='сообщений на поток')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        db = Database(path)
+        db.init_database()
+        db.close()
+
+        print(f'{args.threads} потоков по {args.messages} сообщений')
+        print(f'{"synchronous":<13}{"запись":<22}{"сообщ/с":>9}{"p50, мс":>9}{"p99, мс":>9}{"пачка":>7}{"выигрыш":>9}')
+        for synchronous in ('NORMAL', 'FULL'):
+            baseline = None
+            for title, window_ms in (('коммит на сообщение', None), ('ChatWriter, окно 0', 0),
+                                     ('ChatWriter, окно 2 мс', 2), ('ChatWriter, окно 5 мс', 5)):
+                rate, p50, p99, batch = run(path, synchronous, window_ms, args.threads, args.messages)
+                baseline = baseline or rate
+                print(f'{synchronous:<13}{title:<22}{rate:>9.0f}{p50:>9.2f}{p99:>9.2f}{batch:>7.1f}'
+                      f'{rate / baseline:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
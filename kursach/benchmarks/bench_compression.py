@@ -0,0 +1,118 @@
+"""Сколько байт экономит сжатие ответов API по эндпоинтам
+
+Ответы тех же форм, что отдает app.py (страница каталога, поиск,
+карточка, история чата, заказы), проходят через compression.Compressor
+на отдельном Flask-приложении с временной базой. Для каждой кодировки
+печатается размер до/после, время сжатия и время повторной отдачи
+из кэша сжатых тел (для ответов с ETag).
+
+Запуск из папки kursach:
+    python benchmarks/bench_compression.py
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify, make_response
+from database import Database
+from models import to_dicts
+from compression import Compressor, available_encodings
+from bench_search import WORDS, fill_parts
+
+
+def build_app(db):
+    app = Flask(__name__)
+    app.json.ensure_ascii = False
+    app.config['COMPRESS_MIN_SIZE'] = 0
+    compressor = Compressor(app)
+
+    def with_etag(name, payload):
+        response = make_response(jsonify(payload))
+        response.set_etag(f'{name}-v{db.catalog_version()}')
+        return response
+
+    @app.route('/api/parts/<int:limit>')
+    def get_parts(limit):
+        page = db.get_parts_page(limit=limit)
+        return with_etag('parts', {'success': True, 'parts': to_dicts(page['parts']),
+                                   'total': page['total'], 'next_cursor': page['next_cursor']})
+
+    @app.route('/api/parts/search')
+    def search_parts():
+        return with_etag('search', {'success': True, 'parts': to_dicts(db.search_parts('торм', limit=20))})
+
+    @app.route('/api/parts/part')
+    def get_part():
+        return with_etag('part-1', {'success': True, 'part': db.get_part_by_id(1).to_dict()})
+
+    @app.route('/api/chat/history')
+    def chat_history():
+        messages = db.get_chat_history(app.config['USER_ID'], limit=50)
+        return jsonify({'success': True, 'messages': to_dicts(messages), 'has_more': True})
+
+    @app.route('/api/orders')
+    def get_orders():
+        return jsonify({'success': True, 'orders': to_dicts(db.get_user_orders(app.config['USER_ID']))})
+
+    return app, compressor
+
+
+def fill_user(db, messages):
+    user = db.get_or_create_user('Иван Петров', '+79990001122')
+    for i in range(messages):
+        db.save_chat_message(user.id, user.name, ' '.join(WORDS[i % 20:i % 20 + 8]).capitalize() + '?',
+                             is_support=i % 2)
+    for size in (1, 3, 5):
+        db.place_order(user.id, [{'id': part_id, 'quantity': 1} for part_id in range(1, size + 1)])
+    return user.id
+
+
+def measure(client, url, encoding, repeat):
+    """(размер тела, мс на запрос)"""
+    headers = {'Accept-Encoding': encoding} if encoding else {}
+    size = len(client.get(url, headers=headers).data)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        client.get(url, headers=headers)
+    return size, (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--parts', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'))
+        db.init_database()
+        fill_parts(db, args.parts)
+        app, compressor = build_app(db)
+        app.config['USER_ID'] = fill_user(db, 50)
+        client = app.test_client()
+
+        urls = ['/api/parts/24', '/api/parts/100', '/api/parts/search', '/api/parts/part',
+                '/api/chat/history', '/api/orders']
+        print(f'{"эндпоинт":<20}{"кодировка":>10}{"байт":>9}{"сжато":>9}{"экономия":>10}{"мс/запрос":>11}')
+        for url in urls:
+            raw, raw_time = measure(client, url, None, args.repeat)
+            print(f'{url:<20}{"-":>10}{raw:>9}{raw:>9}{"":>10}{raw_time:>11.3f}')
+            for encoding in available_encodings():
+                size, elapsed = measure(client, url, encoding, args.repeat)
+                print(f'{"":<20}{encoding:>10}{raw:>9}{size:>9}{1 - size / raw:>9.0%}{elapsed:>11.3f}')
+        db.close()
+
+    print()
+    print('Итого по эндпоинтам (Compressor.stats):')
+    for endpoint, stats in compressor.stats().items():
+        print(f'  {endpoint:<16} ответов {stats["responses"]:>5}, '
+              f'сэкономлено {stats["saved"] / stats["responses"]:>8.0f} байт на ответ')
+    print(f'Кэш сжатых тел: {compressor.cache.stats()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Память при потоковой выгрузке каталога в зависимости от размера таблицы
+
+Каталог заполняется синтетическими запчастями (10 тыс., 100 тыс., 1 млн)
+через Database.import_parts, затем выгружается в NDJSON и CSV тем же
+путем, что и /api/export/parts: Database.export_parts -> exports.*_chunks.
+Пиковая память Python (tracemalloc) не должна зависеть от числа строк
+и превышать --ceiling; иначе скрипт завершается с кодом 1.
+
+Запуск из папки kursach:
+    python benchmarks/bench_export.py
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from exports import ndjson_chunks, csv_chunks
+from bench_search import WORDS, CATEGORIES, BRANDS
+
+COLUMNS = ['id', 'sku', 'name', 'category', 'brand', 'price', 'description', 'image', 'in_stock']
+
+
+def synthetic_parts(start, count, seed=42):
+    """Поток строк для import_parts, без списка в памяти"""
+    rnd = random.Random(seed + start)
+    for i in range(start, start + count):
+        yield (f'BENCH-{i:07d}', ' '.join(rnd.sample(WORDS, 3)).capitalize(),
+               rnd.choice(CATEGORIES), rnd.choice(BRANDS), rnd.randint(100, 50000),
+               ' '.join(rnd.sample(WORDS, 6)), None, 1)
+
+
+def measure_export(db, file_format):
+    """(байт выгружено, секунд, пик памяти в МБ)"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    if file_format == 'csv':
+        chunks = csv_chunks(COLUMNS, ([getattr(p, c) for c in COLUMNS] for p in db.export_parts()))
+    else:
+        chunks = ndjson_chunks(p.to_dict() for p in db.export_parts())
+    size = sum(len(chunk.encode('utf-8')) for chunk in chunks)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, elapsed, peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--ceiling', type=float, default=16.0, help='допустимый пик памяти, МБ')
+    args = parser.parse_args()
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'))
+        db.init_database()
+        loaded = 0
+        print(f'{"строк":>9}{"формат":>8}{"МБ выгрузки":>13}{"секунд":>9}{"строк/с":>10}{"пик, МБ":>9}')
+        for size in (int(s) for s in args.sizes.split(',')):
+            db.import_parts(synthetic_parts(loaded, size - loaded), batch_size=10000)
+            loaded = size
+            for file_format in ('ndjson', 'csv'):
+                exported, elapsed, peak = measure_export(db, file_format)
+                ok = ok and peak <= args.ceiling
+                print(f'{size:>9}{file_format:>8}{exported / 1024 / 1024:>13.1f}{elapsed:>9.1f}'
+                      f'{size / elapsed:>10.0f}{peak:>9.2f}')
+        db.close()
+
+    print('Пик памяти в пределах ограничения' if ok else f'Пик памяти выше {args.ceiling} МБ')
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Накладные расходы метрик: вызовы Database и запросы к API с метриками и без
+
+Одна и та же временная база открывается дважды: обычной Database и
+Database с Metrics.instrument и InstrumentedConnection. Затем тот же путь
+через Flask: create_app с METRICS_ENABLED и без. Печатается время на вызов
+и разница в микросекундах и процентах.
+
+Запуск из папки kursach:
+    python benchmarks/bench_metrics.py
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from metrics import Metrics
+from bench_search import fill_parts
+
+
+def per_call(plain, instrumented, repeat, rounds=5):
+    """Микросекунды на вызов без метрик и с ними, лучший из rounds прогонов
+
+    Прогоны вариантов чередуются, чтобы фон машины влиял на оба одинаково.
+    """
+    best = [None, None]
+    for _ in range(rounds):
+        for index, func in enumerate((plain, instrumented)):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                func()
+            elapsed = (time.perf_counter() - started) / repeat * 1e6
+            best[index] = elapsed if best[index] is None else min(best[index], elapsed)
+    return best
+
+
+def fill_user(db, messages):
+    user = db.get_or_create_user('Иван Петров', '+79990001122')
+    for i in range(messages):
+        db.save_chat_message(user.id, user.name, f'Сообщение {i}', is_support=i % 2)
+    for size in (1, 3, 5):
+        db.place_order(user.id, [{'id': part_id, 'quantity': 1} for part_id in range(1, size + 1)])
+    return user
+
+
+def print_row(title, timings):
+    plain, instrumented = timings
+    overhead = instrumented - plain
+    print(f'{title:<28}{plain:>10.1f}{instrumented:>12.1f}{overhead:>10.1f}{overhead / plain:>9.1%}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    from app import create_app
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        db = Database(path)
+        db.init_database()
+        fill_parts(db, 5000)
+        user = fill_user(db, 100)
+        metrics = Metrics()
+        traced = metrics.instrument(Database(path, connection_factory=Metrics.connection_factory))
+
+        print(f'{"мкс на вызов":<28}{"без":>10}{"с метриками":>12}{"разница":>10}{"":>9}')
+        calls = {
+            'get_chat_history(50)': lambda d: d.get_chat_history(user.id, limit=50),
+            'get_user_orders': lambda d: d.get_user_orders(user.id),
+            'get_unread_messages': lambda d: d.get_unread_messages(user.id),
+            'get_user_dashboard': lambda d: d.get_user_dashboard(user.id),
+            'get_parts_page (кэш)': lambda d: d.get_parts_page(limit=24),
+        }
+        for title, call in calls.items():
+            print_row(title, per_call(lambda: call(db), lambda: call(traced), args.repeat))
+        traced.close()
+        db.close()
+
+        print()
+        print(f'{"мкс на запрос":<28}{"без":>10}{"с метриками":>12}{"разница":>10}{"":>9}')
+        apps = {}
+        for enabled in (False, True):
+            app = create_app({'DATABASE_PATH': path, 'METRICS_ENABLED': enabled})
+            client = app.test_client()
+            client.post('/api/user', json={'name': user.name, 'phone': user.phone})
+            apps[enabled] = client
+        for url in ('/api/stats', '/api/parts', '/api/chat/history', '/api/user/dashboard'):
+            print_row(url, per_call(lambda: apps[False].get(url), lambda: apps[True].get(url), args.repeat // 4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Память и время разбора строк: словари против моделей с __slots__
+
+Строки запчастей и сообщений чата читаются из базы один раз, затем
+раскладываются прежним способом (словарь по позициям) и через
+Model.from_row. Память - прирост tracemalloc на удержание всего списка
+результатов (сами строки sqlite3 в замер не входят).
+
+Запуск из папки kursach:
+    python benchmarks/bench_models.py
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database, PART_COLUMNS, CHAT_COLUMNS
+from models import Part, ChatMessage
+from bench_search import fill_parts
+
+
+def part_to_dict(p):
+    """Разбор строки до моделей"""
+    return {
+        'id': p[0],
+        'name': p[1],
+        'category': p[2],
+        'brand': p[3],
+        'price': p[4],
+        'description': p[5],
+        'image': p[6],
+        'in_stock': bool(p[7]),
+        'sku': p[8]
+    }
+
+
+def chat_message_to_dict(m):
+    return {
+        'id': m[0],
+        'user_id': m[1],
+        'user_name': m[2],
+        'message': m[3],
+        'is_support': bool(m[4]),
+        'is_read': bool(m[5]),
+        'created_at': m[6]
+    }
+
+
+def measure(mapper, rows):
+    """(нс на строку, байт на строку)"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    result = [mapper(row) for row in rows]
+    elapsed = time.perf_counter() - started
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del result
+    # Время отдельно, без накладных расходов tracemalloc
+    started = time.perf_counter()
+    [mapper(row) for row in rows]
+    elapsed = time.perf_counter() - started
+    return elapsed / len(rows) * 1e9, size / len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'))
+        db.init_database()
+        fill_parts(db, args.rows)
+        with db.transaction() as conn:
+            conn.executemany('''
+                INSERT INTO chat_messages (user_id, user_name, message, is_support)
+                VALUES (?, ?, ?, ?)
+            ''', ((i % 100, 'Клиент', f'Сообщение номер {i}', i % 2) for i in range(args.rows)))
+        with db.connection() as conn:
+            part_rows = conn.execute(f'SELECT {PART_COLUMNS} FROM parts').fetchall()
+            chat_rows = conn.execute(f'SELECT {CHAT_COLUMNS} FROM chat_messages').fetchall()
+        db.close()
+
+    print(f'{"":>14}{"нс/строку":>12}{"байт/строку":>14}')
+    for title, rows, old, new in (('parts', part_rows, part_to_dict, Part.from_row),
+                                  ('chat_messages', chat_rows, chat_message_to_dict, ChatMessage.from_row)):
+        old_time, old_size = measure(old, rows)
+        new_time, new_size = measure(new, rows)
+        print(title)
+        print(f'{"  словарь":<14}{old_time:>12.0f}{old_size:>14.0f}')
+        print(f'{"  __slots__":<14}{new_time:>12.0f}{new_size:>14.0f}')
+        print(f'{"  выигрыш":<14}{old_time / new_time:>11.1f}x{old_size / new_size:>13.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Время оформления заказа в зависимости от размера корзины
+
+Сравниваются прежний путь (get_part_by_id на каждую позицию, каждый раз
+с новым соединением, затем create_order) и Database.place_order
+(одна транзакция, один запрос за всеми запчастями).
+
+Запуск из папки kursach:
+    python benchmarks/bench_orders.py
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from bench_search import fill_parts
+
+
+def legacy_order(db_name, user_id, items):
+    """Путь до изменений: соединение на каждый запрос"""
+    for item in items:
+        conn = sqlite3.connect(db_name)
+        row = conn.execute('SELECT * FROM parts WHERE id = ?', (item['id'],)).fetchone()
+        conn.close()
+        if not row:
+            raise ValueError(item['id'])
+    conn = sqlite3.connect(db_name)
+    conn.execute('INSERT INTO orders (user_id, order_data, total_price, status) VALUES (?, ?, ?, ?)',
+                 (user_id, json.dumps(items, ensure_ascii=False), 0, 'new'))
+    conn.commit()
+    conn.close()
+
+
+def measure(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--parts', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=30)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'))
+        db.init_database()
+        fill_parts(db, args.parts)
+        user = db.get_or_create_user('Бенчмарк', '+70000000000')
+
+        print(f'{"позиций":>8}{"было, мс":>12}{"стало, мс":>12}{"ускорение":>12}')
+        for size in (1, 5, 10, 30, 100):
+            items = [{'id': i * 7 + 1, 'quantity': 1} for i in range(size)]
+            before = measure(lambda: legacy_order(db.db_name, user.id, items), args.repeat)
+            after = measure(lambda: db.place_order(user.id, items), args.repeat)
+            print(f'{size:>8}{before:>12.2f}{after:>12.2f}{before / after:>11.1f}x')
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
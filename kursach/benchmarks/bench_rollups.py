@@ -0,0 +1,199 @@
+"""Дневные агрегаты отчетов: проверка инкрементального обновления и время отчетов
+
+Синтетическая база (bench_api.fill_dataset) обновляется несколькими
+раундами: новые заказы и записи, отмена части записей, refresh_rollups
+маленькими пачками. После каждого раунда агрегаты сравниваются с
+независимым пересчетом по orders/order_items/appointments; при
+расхождении скрипт завершается с кодом 1. Затем сравнивается время
+отчета по агрегатам, по исходным таблицам и по разбору order_data.
+
+Запуск из папки kursach:
+    python benchmarks/bench_rollups.py --orders 500000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database, BookingError
+from bench_api import fill_dataset, Session
+
+# Независимый пересчет агрегатов с нуля: таблица -> запрос
+RECOMPUTE = {
+    'daily_sales': '''
+        SELECT date(created_at), COUNT(*), SUM(total_price) FROM orders GROUP BY 1
+    ''',
+    'daily_part_sales': '''
+        SELECT date(o.created_at), COALESCE(i.part_id, 0), SUM(i.quantity), SUM(i.price * i.quantity)
+        FROM orders o JOIN order_items i ON i.order_id = o.id GROUP BY 1, 2
+    ''',
+    'monthly_part_sales': '''
+        SELECT strftime('%Y-%m', o.created_at), COALESCE(i.part_id, 0), SUM(i.quantity), SUM(i.price * i.quantity)
+        FROM orders o JOIN order_items i ON i.order_id = o.id GROUP BY 1, 2
+    ''',
+    'daily_category_sales': '''
+        SELECT date(o.created_at), COALESCE(p.category, ''), SUM(i.quantity), SUM(i.price * i.quantity)
+        FROM orders o JOIN order_items i ON i.order_id = o.id LEFT JOIN parts p ON p.id = i.part_id
+        GROUP BY 1, 2
+    ''',
+    'daily_appointments': '''
+        SELECT appointment_date, service_type, COUNT(*) FROM appointments GROUP BY 1, 2
+    ''',
+}
+
+
+def mismatches(db):
+    """Таблицы, где агрегаты расходятся с пересчетом: {таблица: (лишние, недостающие)}"""
+    result = {}
+    with db.connection() as conn:
+        for table, sql in RECOMPUTE.items():
+            stored = set(conn.execute(f'SELECT * FROM {table}').fetchall())
+            expected = set(conn.execute(sql).fetchall())
+            if stored != expected:
+                result[table] = (len(stored - expected), len(expected - stored))
+    return result
+
+
+def part_report_mismatch(db, date_from, date_to):
+    """Отчет по запчастям (месяцы + края по дням) против подсчета по order_items"""
+    report = {p['part_id']: (p['units'], p['revenue'])
+              for p in db.get_part_sales_report(date_from, date_to, limit=10 ** 9)}
+    with db.connection() as conn:
+        expected = {part_id: (units, revenue) for part_id, units, revenue in conn.execute('''
+            SELECT COALESCE(i.part_id, 0), SUM(i.quantity), SUM(i.price * i.quantity)
+            FROM orders o JOIN order_items i ON i.order_id = o.id
+            WHERE date(o.created_at) BETWEEN ? AND ? GROUP BY 1
+        ''', (date_from, date_to))}
+    return report != expected
+
+
+def traffic_round(db, session, orders, appointments, cancel_share, booked):
+    """Новые заказы и записи; часть записей (и новых, и уже учтенных) отменяется"""
+    rnd = session.rnd
+    for _ in range(orders):
+        user_id = rnd.randint(1, session.users)
+        db.place_order(user_id, [{'id': rnd.randint(1, session.parts), 'quantity': rnd.randint(1, 3)}
+                                 for _ in range(rnd.randint(1, 3))])
+    for _ in range(appointments):
+        try:
+            booked.append(db.create_appointment(session.user_id, session.appointment()))
+        except BookingError:
+            pass
+    rnd.shuffle(booked)
+    for _ in range(int(len(booked) * cancel_share)):
+        db.cancel_appointment(booked.pop(), session.user_id)
+
+
+def report_from_json(db, date_from, date_to):
+    """Прежний путь: выручка по дням и штуки по запчастям разбором order_data"""
+    revenue, units = Counter(), Counter()
+    with db.connection() as conn:
+        for created_at, total, order_data in conn.execute('''
+            SELECT created_at, total_price, order_data FROM orders WHERE date(created_at) BETWEEN ? AND ?
+        ''', (date_from, date_to)):
+            revenue[created_at[:10]] += total
+            for item in json.loads(order_data):
+                units[item.get('id')] += item.get('quantity') or 1
+    return revenue, units.most_common(20)
+
+
+def report_from_tables(db, date_from, date_to):
+    """Те же цифры запросами по orders/order_items без агрегатов"""
+    with db.connection() as conn:
+        days = conn.execute('''
+            SELECT date(created_at), COUNT(*), SUM(total_price) FROM orders
+            WHERE date(created_at) BETWEEN ? AND ? GROUP BY 1
+        ''', (date_from, date_to)).fetchall()
+        parts = conn.execute('''
+            SELECT i.part_id, SUM(i.quantity) FROM orders o JOIN order_items i ON i.order_id = o.id
+            WHERE date(o.created_at) BETWEEN ? AND ? GROUP BY 1 ORDER BY 2 DESC LIMIT 20
+        ''', (date_from, date_to)).fetchall()
+    return days, parts
+
+
+def report_from_rollups(db, date_from, date_to):
+    return (db.get_sales_report(date_from, date_to), db.get_part_sales_report(date_from, date_to),
+            db.get_category_sales_report(date_from, date_to), db.get_appointments_report(date_from, date_to))
+
+
+def measure(func, repeat):
+    """Медиана, мс"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--orders', type=int, default=100000)
+    parser.add_argument('--parts', type=int, default=5000)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--round-orders', type=int, default=500)
+    parser.add_argument('--round-appointments', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    from app import create_app
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        db = Database(path)
+        db.init_database()
+        started = time.perf_counter()
+        fill_dataset(db, args.users, 0, args.orders, args.parts)
+        print(f'База заполнена и агрегаты построены за {time.perf_counter() - started:.1f} с')
+
+        session = Session(create_app({'DATABASE_PATH': path}), db,
+                          {'users': args.users, 'parts': args.parts}, seed=1)
+        booked = []
+        for number in range(1, args.rounds + 1):
+            traffic_round(db, session, args.round_orders, args.round_appointments, 0.3, booked)
+            started = time.perf_counter()
+            processed = db.refresh_rollups(batch_size=97)
+            elapsed = (time.perf_counter() - started) * 1000
+            problems = mismatches(db)
+            failed = failed or bool(problems)
+            print(f'Раунд {number}: обработано {processed} за {elapsed:.1f} мс, '
+                  + (f'РАСХОЖДЕНИЯ {problems}' if problems else 'совпадает с пересчетом'))
+
+        started = time.perf_counter()
+        db.rebuild_rollups()
+        elapsed = time.perf_counter() - started
+        problems = mismatches(db)
+        failed = failed or bool(problems)
+        print(f'Полный пересчет за {elapsed:.1f} с: '
+              + (f'РАСХОЖДЕНИЯ {problems}' if problems else 'совпадает с пересчетом'))
+
+        today = date.today()
+        for days in (20, 75, 365):
+            period = ((today - timedelta(days=days - 1)).isoformat(), today.isoformat())
+            if part_report_mismatch(db, *period):
+                failed = True
+                print(f'Отчет по запчастям за {days} дней расходится с order_items')
+
+        print()
+        print(f'{"мс на отчет":<34}{"30 дней":>10}{"365 дней":>10}')
+        periods = [((today - timedelta(days=days - 1)).isoformat(), today.isoformat()) for days in (30, 365)]
+        for title, report in (('разбор order_data (JSON)', report_from_json),
+                              ('запросы к orders/order_items', report_from_tables),
+                              ('агрегаты (4 отчета)', report_from_rollups)):
+            timings = [measure(lambda: report(db, *period), args.repeat) for period in periods]
+            print(f'{title:<34}{timings[0]:>10.1f}{timings[1]:>10.1f}')
+        db.close()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Сравнение поиска по каталогу: FTS5 (parts_fts) против сканирования LIKE
+
+Запуск из папки kursach:
+    python benchmarks/bench_search.py --parts 100000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+WORDS = [
+    'масло', 'моторное', 'фильтр', 'масляный', 'воздушный', 'салонный', 'тормозные',
+    'колодки', 'диски', 'передние', 'задние', 'ремень', 'грм', 'свечи', 'зажигания',
+    'помпа', 'водяная', 'амортизатор', 'шаровая', 'опора', 'сайлентблок', 'рычага',
+    'аккумулятор', 'генератор', 'стартер', 'фара', 'бампер', 'зеркало', 'стойка',
+    'стабилизатора', 'подшипник', 'ступицы', 'радиатор', 'термостат', 'датчик',
+]
+CATEGORIES = ['oil', 'brake', 'engine', 'suspension', 'electrics', 'bodywork']
+BRANDS = ['toyota', 'nissan', 'hyundai', 'kia', 'renault', 'bmw', 'all']
+MODELS = ['camry', 'corolla', 'rav4', 'almera', 'qashqai', 'solaris', 'creta', 'rio',
+          'sportage', 'logan', 'duster', 'x5', 'e39', 'octavia', 'polo', 'granta', 'vesta']
+# Частые префиксы (тысячи совпадений) и редкие слова/артикулы
+QUERIES = ['торм', 'колодки пер', 'фильтр сал camry', 'амортизатор rio',
+           'ступ vesta', 'a12345', 'a9999']
+
+
+def fill_parts(db, count, seed=42):
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(count):
+        name = ' '.join(rnd.sample(WORDS, 3)).capitalize()
+        name += f' {rnd.choice(MODELS)} a{rnd.randint(10000, 99999)}'
+        description = ' '.join(rnd.sample(WORDS, 6))
+        rows.append((name, rnd.choice(CATEGORIES), rnd.choice(BRANDS),
+                     rnd.randint(100, 50000), description, '', 1))
+    with db.transaction() as conn:
+        conn.executemany('''
+            INSERT INTO parts (name, category, brand, price, description, image, in_stock)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+
+
+def like_page(db, text, limit=20):
+    """Прежний вариант поиска: подстрока в названии/описании, полный проход по таблице"""
+    words = text.split()
+    conditions = ' AND '.join('(name LIKE ? OR description LIKE ?)' for _ in words)
+    params = [f'%{word}%' for word in words for _ in range(2)]
+    with db.connection() as conn:
+        total = conn.execute(f'SELECT COUNT(*) FROM parts WHERE {conditions}', params).fetchone()[0]
+        rows = conn.execute(f'SELECT id FROM parts WHERE {conditions} ORDER BY id LIMIT ?',
+                            params + [limit]).fetchall()
+    return total, rows
+
+
+def measure(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--parts', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'))
+        db.init_database()
+        started = time.perf_counter()
+        fill_parts(db, args.parts)
+        print(f'Загружено {args.parts} запчастей за {time.perf_counter() - started:.1f} с\n')
+
+        # Страница каталога с общим количеством (как /api/parts?search=)
+        # и ранжированный поиск /api/parts/search
+        print(f'{"запрос":<18}{"LIKE, мс":>10}{"FTS, мс":>10}{"ускорение":>11}{"bm25, мс":>10}')
+        for query in QUERIES:
+            like_ms = measure(lambda: like_page(db, query), args.repeat)
+            fts_ms = measure(lambda: db.get_parts_page(search=query, limit=20), args.repeat)
+            ranked_ms = measure(lambda: db.search_parts(query), args.repeat)
+            print(f'{query:<18}{like_ms:>10.2f}{fts_ms:>10.2f}{like_ms / fts_ms:>10.1f}x{ranked_ms:>10.2f}')
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Холодный старт рабочего процесса: импорт app и первый запрос
+
+Каждый замер - --workers новых процессов Python, запущенных одновременно,
+как рабочие процессы prefork-сервера. База один раз готовится командой bootstrap. Для сравнения прежний путь:
+рабочий процесс сам проверяет миграции и заполняет каталог
+(bootstrap при импорте). Если медиана "импорт + первый запрос" выше
+--max-ms, скрипт завершается с кодом 1 - так старт проверяется на регрессии.
+
+Запуск из папки kursach:
+    python benchmarks/bench_startup.py
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Код рабочего процесса; печатает JSON с длительностями этапов в мс
+WORKER = '''
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+import app
+imported = time.perf_counter()
+if {eager!r}:
+    app.bootstrap(app.app)
+ready = time.perf_counter()
+response = app.app.test_client().get('/api/parts')
+assert response.status_code == 200, response.status_code
+served = time.perf_counter()
+print(json.dumps({{'import': (imported - started) * 1000, 'init': (ready - imported) * 1000,
+                  'first_request': (served - ready) * 1000, 'total': (served - started) * 1000}}))
+'''
+
+
+def run_workers(env, eager, count):
+    """Запустить count процессов разом: [(этапы из процесса, мс от запуска до выхода)]"""
+    started = time.perf_counter()
+    processes = [subprocess.Popen([sys.executable, '-c', WORKER.format(root=ROOT, eager=eager)],
+                                  env=env, cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                  text=True)
+                 for _ in range(count)]
+    results = []
+    for process in processes:
+        stdout, stderr = process.communicate()
+        if process.returncode:
+            raise RuntimeError(stderr)
+        wall = (time.perf_counter() - started) * 1000
+        results.append((json.loads(stdout.strip().splitlines()[-1]), wall))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=1, help='процессов, стартующих одновременно')
+    parser.add_argument('--max-ms', type=float, default=1000.0,
+                        help='допустимая медиана "импорт + первый запрос", мс')
+    args = parser.parse_args()
+
+    from app import create_app, bootstrap
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, KURSACH_DATABASE_PATH=os.path.join(tmp, 'bench.db'))
+        bootstrap(create_app({'DATABASE_PATH': env['KURSACH_DATABASE_PATH']}))
+
+        # Прогрев: байт-код модулей и файл базы в кэше ОС
+        run_workers(env, False, 1)
+        # Варианты чередуются, чтобы фон машины влиял на оба одинаково
+        runs = {False: [], True: []}
+        for _ in range(args.runs):
+            for eager in runs:
+                runs[eager].extend(run_workers(env, eager, args.workers))
+
+        print(f'{"":<34}{"импорт":>8}{"init":>8}{"запрос":>8}{"итого":>8}{"процесс":>9}')
+        medians = {}
+        for title, eager in (('ленивый (create_app + get_db)', False),
+                             ('прежний (bootstrap в процессе)', True)):
+            row = {stage: statistics.median(r[0][stage] for r in runs[eager])
+                   for stage in ('import', 'init', 'first_request', 'total')}
+            row['wall'] = statistics.median(r[1] for r in runs[eager])
+            medians[eager] = row
+            print(f'{title:<34}{row["import"]:>8.1f}{row["init"]:>8.1f}{row["first_request"]:>8.1f}'
+                  f'{row["total"]:>8.1f}{row["wall"]:>9.1f}')
+
+    total = medians[False]['total']
+    ok = total <= args.max_ms
+    print(f'Медиана холодного старта {total:.1f} мс '
+          + ('в пределах ограничения' if ok else f'выше {args.max_ms:.0f} мс'))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Статистика /api/stats: COUNT(*) по таблицам против счетчиков stats_counters
+
+На синтетической базе (bench_api.fill_dataset) сравниваются подсчет
+строк при каждом запросе, чтение счетчиков, которые ведут триггеры,
+и снимок в памяти (Database.get_counters). Отдельно - цена триггеров
+для записи: вставка пользователей с ними и без них.
+
+Запуск из папки kursach:
+    python benchmarks/bench_stats.py --users 100000 --orders 500000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from migrations import STATS_COUNTERS
+from bench_api import fill_dataset
+
+
+def count_rows(db):
+    """Прежний способ: полный подсчет по каждой таблице"""
+    with db.connection() as conn:
+        return {name: conn.execute(f'SELECT COALESCE(SUM({expression.format(row="")}), 0) FROM {table}').fetchone()[0]
+                for name, (table, expression, _) in STATS_COUNTERS.items()}
+
+
+def read_counters(db):
+    with db.connection() as conn:
+        return dict(conn.execute('SELECT name, value FROM stats_counters').fetchall())
+
+
+def per_call(func, repeat):
+    """Микросекунды на вызов, лучший из трех прогонов"""
+    best = None
+    for _ in range(3):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        elapsed = (time.perf_counter() - started) / repeat * 1e6
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def insert_users(db, start, count):
+    """Микросекунды на вставку одного пользователя отдельной транзакцией"""
+    started = time.perf_counter()
+    for i in range(start, start + count):
+        with db.transaction() as conn:
+            conn.execute('INSERT INTO users (name, phone) VALUES (?, ?)', (f'Новый {i}', f'+7888{i:07d}'))
+    return (time.perf_counter() - started) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--orders', type=int, default=100000)
+    parser.add_argument('--parts', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--inserts', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'))
+        db.init_database()
+        fill_dataset(db, args.users, args.messages, args.orders, args.parts)
+        assert count_rows(db) == read_counters(db), 'счетчики разошлись с COUNT(*)'
+        print('Счетчики: ' + ', '.join(f'{name} {value}' for name, value in read_counters(db).items()))
+
+        print(f'{"мкс на запрос статистики":<34}{"мкс":>10}')
+        for title, func in (('COUNT(*) по таблицам', lambda: count_rows(db)),
+                            ('stats_counters', lambda: read_counters(db)),
+                            ('get_counters (снимок в памяти)', db.get_counters)):
+            print(f'{title:<34}{per_call(func, args.repeat):>10.1f}')
+
+        print()
+        with_triggers = insert_users(db, 0, args.inserts)
+        with db.transaction() as conn:
+            for suffix in ('insert', 'delete'):
+                conn.execute(f'DROP TRIGGER users_counter_{suffix}')
+        without_triggers = insert_users(db, args.inserts, args.inserts)
+        print(f'Вставка пользователя: {without_triggers:.1f} мкс без триггеров, '
+              f'{with_triggers:.1f} мкс с ними ({with_triggers - without_triggers:+.1f} мкс)')
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
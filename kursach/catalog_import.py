@@ -0,0 +1,181 @@
+"""Загрузка прайс-листа поставщика в каталог (CSV или JSONL)
+
+Файл читается построчно и не загружается в память целиком. Строки
+проверяются, ошибочные пропускаются с указанием номера строки, остальные
+передаются в Database.import_parts пачками.
+
+Запуск из папки kursach:
+    python catalog_import.py прайс.csv --db autoservice.db --batch-size 5000
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+
+REQUIRED_FIELDS = ('sku', 'name', 'category', 'brand', 'price')
+IN_STOCK_VALUES = {'1': 1, 'true': 1, 'yes': 1, 'да': 1, '': 1,
+                   '0': 0, 'false': 0, 'no': 0, 'нет': 0}
+MAX_ERRORS_SHOWN = 20
+
+# Снимать индексы и триггеры выгодно, только если файл сопоставим по размеру
+# с каталогом: иначе их перестройка дольше самой загрузки
+DEFER_MIN_SHARE = 0.2
+
+
+def read_csv(f, delimiter=None):
+    """Строки CSV как (номер строки, словарь); разделитель определяется по заголовку"""
+    if delimiter is None:
+        header = f.readline()
+        delimiter = ';' if header.count(';') > header.count(',') else ','
+        f.seek(0)
+    reader = csv.DictReader(f, delimiter=delimiter)
+    for record in reader:
+        yield reader.line_num, record
+
+
+def read_jsonl(f):
+    """Строки JSONL как (номер строки, словарь); пустые строки пропускаются"""
+    for line_num, line in enumerate(f, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_num, ValueError(f'некорректный JSON: {e.msg}')
+            continue
+        yield line_num, record
+
+
+def validate_part(record):
+    """Словарь строки прайс-листа -> кортеж в порядке PART_IMPORT_COLUMNS"""
+    if not isinstance(record, dict):
+        raise ValueError('строка должна быть объектом')
+    values = {key.strip().lower(): value for key, value in record.items() if key}
+
+    for field in REQUIRED_FIELDS:
+        if values.get(field) in (None, ''):
+            raise ValueError(f'не заполнено поле {field}')
+
+    try:
+        price = round(float(str(values['price']).replace(',', '.').replace(' ', '')))
+    except ValueError:
+        raise ValueError(f"некорректная цена: {values['price']}")
+    if price < 0:
+        raise ValueError('отрицательная цена')
+
+    in_stock = values.get('in_stock', 1)
+    if not isinstance(in_stock, (bool, int)):
+        in_stock = str(in_stock).strip().lower()
+        if in_stock not in IN_STOCK_VALUES:
+            raise ValueError(f'некорректное значение in_stock: {in_stock}')
+        in_stock = IN_STOCK_VALUES[in_stock]
+
+    return (
+        str(values['sku']).strip(),
+        str(values['name']).strip(),
+        str(values['category']).strip().lower(),
+        str(values['brand']).strip().lower(),
+        price,
+        str(values.get('description') or '').strip(),
+        str(values.get('image') or '').strip() or None,
+        1 if in_stock else 0,
+    )
+
+
+def estimate_rows(path, sample_size=65536):
+    """Примерное число строк файла по средней длине строки в начале файла"""
+    with open(path, 'rb') as f:
+        sample = f.read(sample_size)
+    lines = sample.count(b'\n')
+    if not lines:
+        return 1
+    return int(os.path.getsize(path) / (len(sample) / lines))
+
+
+def should_defer(db, path):
+    with db.connection() as conn:
+        parts = conn.execute('SELECT COUNT(*) FROM parts').fetchone()[0]
+    return estimate_rows(path) >= parts * DEFER_MIN_SHARE
+
+
+def import_file(db, path, file_format=None, batch_size=1000, progress=None, defer_maintenance=None):
+    """Загрузить файл в каталог; возвращает статистику import_parts и список ошибок
+    
+    defer_maintenance=None - решить по размеру файла относительно каталога.
+    """
+    if file_format is None:
+        file_format = 'csv' if path.lower().endswith('.csv') else 'jsonl'
+    if defer_maintenance is None:
+        defer_maintenance = should_defer(db, path)
+    errors = []
+    invalid = 0
+
+    def valid_rows(records):
+        nonlocal invalid
+        for line_num, record in records:
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                yield validate_part(record)
+            except ValueError as e:
+                invalid += 1
+                if len(errors) < MAX_ERRORS_SHOWN:
+                    errors.append(f'строка {line_num}: {e}')
+
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        records = read_csv(f) if file_format == 'csv' else read_jsonl(f)
+        stats = db.import_parts(valid_rows(records), batch_size=batch_size,
+                                progress=progress, defer_maintenance=defer_maintenance)
+    stats['invalid'] = invalid
+    return stats, errors
+
+
+def print_progress(stats):
+    rate = stats['rows'] / stats['seconds'] if stats['seconds'] else 0
+    print(f"\r{stats['rows']} строк, {rate:.0f} строк/с "
+          f"(новых {stats['inserted']}, обновлено {stats['updated']}, без изменений {stats['unchanged']})",
+          end='', flush=True)
+
+
+def main():
+    from database import Database
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', help='файл .csv или .jsonl')
+    parser.add_argument('--db', default=os.environ.get('KURSACH_DATABASE_PATH'), help='путь к базе данных')
+    parser.add_argument('--format', choices=('csv', 'jsonl'), default=None)
+    parser.add_argument('--batch-size', type=int, default=1000, help='строк в одной транзакции')
+    parser.add_argument('--defer', choices=('auto', 'yes', 'no'), default='auto',
+                        help='снимать индексы и триггеры на время загрузки '
+                             '(auto - если файл сопоставим по размеру с каталогом)')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        parser.error(f'файл не найден: {args.path}')
+
+    db = Database(args.db)
+    try:
+        db.check_schema()
+    except RuntimeError as e:
+        parser.error(str(e))
+    defer = {'auto': None, 'yes': True, 'no': False}[args.defer]
+    stats, errors = import_file(db, args.path, args.format, args.batch_size,
+                                progress=print_progress, defer_maintenance=defer)
+    db.close()
+
+    print()
+    rate = stats['rows'] / stats['seconds'] if stats['seconds'] else 0
+    print(f"Загружено строк: {stats['rows']} за {stats['seconds']:.1f} с ({rate:.0f} строк/с)")
+    print(f"Новых: {stats['inserted']}, обновлено: {stats['updated']}, "
+          f"без изменений: {stats['unchanged']}, повторов артикула: {stats['duplicates']}, "
+          f"с ошибками: {stats['invalid']}")
+    for error in errors:
+        print(f'  {error}')
+    if stats['invalid'] > len(errors):
+        print(f"  ... и еще {stats['invalid'] - len(errors)}")
+    sys.exit(1 if stats['invalid'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Внутрипроцессная рассылка событий чата подписчикам (Server-Sent Events)"""
+import queue
+import threading
+
+
+class Subscription:
+    """Подписка одного клиента: ограниченная очередь событий"""
+
+    def __init__(self, user_id, max_queue):
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.closed = False
+
+    def get(self, timeout):
+        """Следующее событие или None, если за timeout событий не было"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class ChatHub:
+    """Публикация событий чата подписчикам одного пользователя
+    
+    Очередь каждого подписчика ограничена: если клиент не успевает
+    забирать события, подписка закрывается, и клиент переподключается
+    с Last-Event-ID, дочитывая пропущенное из базы.
+    """
+
+    def __init__(self, max_queue=100):
+        self.max_queue = max_queue
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._stats = {'published': 0, 'delivered': 0, 'dropped': 0}
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id, self.max_queue)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.closed = True
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def publish(self, user_id, event, data, event_id=None):
+        """Отправить событие всем подпискам пользователя"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+            self._stats['published'] += 1
+        
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait((event, data, event_id))
+                delivered = True
+            except queue.Full:
+                delivered = False
+                self.unsubscribe(subscription)
+            with self._lock:
+                self._stats['delivered' if delivered else 'dropped'] += 1
+
+    def stats(self):
+        with self._lock:
+            result = dict(self._stats)
+            result['subscribers'] = sum(len(s) for s in self._subscribers.values())
+        return result
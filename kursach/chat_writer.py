@@ -0,0 +1,150 @@
+"""Групповая запись сообщений чата: одна транзакция на пачку сообщений
+
+Запросы кладут сообщения в ограниченную очередь и получают Future с id.
+Фоновый поток забирает первое сообщение, добирает пачку тем, что уже
+лежит в очереди или придет за окно flush_interval (не больше max_batch
+штук), и записывает ее одним коммитом. Пока идет коммит, очередь
+копится - под нагрузкой пачки растут и без окна.
+
+Если очередь полна дольше put_timeout, submit бросает ChatQueueFull:
+запросы не копятся в памяти быстрее, чем их успевает записать база.
+close() записывает все принятое и останавливает поток; после него submit
+бросает ChatWriterClosed (тоже ChatQueueFull - маршруты отвечают 503).
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Метка остановки в очереди
+_STOP = object()
+
+
+class ChatQueueFull(RuntimeError):
+    """Очередь записи чата переполнена"""
+
+
+class ChatWriterClosed(ChatQueueFull):
+    """Очередь записи чата закрыта (процесс останавливается)"""
+
+
+class ChatWriter:
+    """Фоновая запись сообщений пачками
+
+    write(items) записывает список сообщений одной транзакцией и
+    возвращает их id в том же порядке (Database.write_chat_messages).
+    """
+
+    def __init__(self, write, max_batch=256, flush_interval=0.0, max_queue=10000, put_timeout=1.0):
+        self.write = write
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, 'written': 0, 'failed': 0, 'rejected': 0,
+                       'batches': 0, 'largest_batch': 0}
+        self._thread = threading.Thread(target=self._run, name='chat-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """Поставить сообщение в очередь; Future получит его id после коммита"""
+        if self._closed:
+            raise ChatWriterClosed('Чат временно недоступен, повторите попытку позже')
+        future = Future()
+        try:
+            self._queue.put((item, future), timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise ChatQueueFull('Слишком много сообщений, повторите попытку позже') from None
+        with self._lock:
+            self._stats['submitted'] += 1
+        return future
+
+    def close(self, timeout=None):
+        """Записать принятые сообщения и остановить поток"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            # submit, успевший проверить _closed до close, мог положить сообщение после _STOP
+            self._drain()
+
+    def stats(self):
+        with self._lock:
+            result = dict(self._stats)
+        result['queued'] = self._queue.qsize()
+        return result
+
+    # ========== ФОНОВЫЙ ПОТОК ==========
+
+    def _run(self):
+        while True:
+            entry = self._queue.get()
+            if entry is _STOP:
+                break
+            batch = [entry]
+            stop = self._fill(batch, time.monotonic() + self.flush_interval)
+            self._flush(batch)
+            if stop:
+                break
+        self._drain()
+
+    def _fill(self, batch, deadline):
+        """Добрать пачку до max_batch или до конца окна; True, если встретилась остановка"""
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                # После окна забираем только то, что уже лежит в очереди
+                entry = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                return False
+            if entry is _STOP:
+                return True
+            batch.append(entry)
+        return False
+
+    def _drain(self):
+        """Записать все, что осталось в очереди, без ожидания"""
+        while True:
+            batch = []
+            while len(batch) < self.max_batch:
+                try:
+                    entry = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is not _STOP:
+                    batch.append(entry)
+            if not batch:
+                return
+            self._flush(batch)
+
+    def _flush(self, batch):
+        # Отмененные Future не записываем
+        batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+        if batch:
+            self._write(batch)
+
+    def _write(self, batch):
+        try:
+            ids = self.write([item for item, _ in batch])
+        except Exception as e:
+            if len(batch) > 1:
+                # Одно ошибочное сообщение не должно отменять всю пачку
+                for entry in batch:
+                    self._write([entry])
+                return
+            batch[0][1].set_exception(e)
+            with self._lock:
+                self._stats['failed'] += 1
+            return
+        for (_, future), message_id in zip(batch, ids):
+            future.set_result(message_id)
+        with self._lock:
+            self._stats['written'] += len(batch)
+            self._stats['batches'] += 1
+            self._stats['largest_batch'] = max(self._stats['largest_batch'], len(batch))
@@ -0,0 +1,177 @@
+"""Сжатие ответов Flask по Accept-Encoding: gzip и brotli (если установлен пакет brotli)
+
+Сжимаются только готовые тела текстовых типов (JSON, HTML, CSS, JS)
+не короче COMPRESS_MIN_SIZE; потоковые ответы (SSE, выгрузки) и файлы
+с direct_passthrough отдаются как есть. Ответы с ETag (каталог) кэшируются
+уже сжатыми: пока ETag тот же, тело не сжимается повторно.
+"""
+import gzip
+import threading
+from collections import OrderedDict
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    'application/json',
+    'application/javascript',
+    'application/x-ndjson',
+    'image/svg+xml',
+    'text/css',
+    'text/csv',
+    'text/html',
+    'text/javascript',
+    'text/plain',
+}
+
+DEFAULTS = {
+    'COMPRESS_MIN_SIZE': 500,       # байт; меньше - выигрыш съедают заголовки
+    'COMPRESS_LEVEL': 6,            # уровень gzip, 1-9
+    'COMPRESS_BR_LEVEL': 4,         # качество brotli, 0-11
+    'COMPRESS_CACHE_SIZE': 256,     # сжатых тел в кэше
+}
+
+
+def available_encodings():
+    """Поддерживаемые кодировки в порядке предпочтения"""
+    return ('br', 'gzip') if brotli else ('gzip',)
+
+
+def negotiate(accept_encodings, encodings=None):
+    """Кодировка из encodings по Accept-Encoding или None
+
+    При равном q выигрывает кодировка, стоящая в encodings раньше.
+    """
+    best, best_quality = None, 0
+    for encoding in available_encodings() if encodings is None else encodings:
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class CompressedCache:
+    """LRU-кэш сжатых тел по (адрес, ETag, кодировка)
+
+    ETag каталога меняется вместе с версией каталога, поэтому устаревшие
+    записи просто перестают запрашиваться и вытесняются.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return body
+
+    def put(self, key, body):
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def stats(self):
+        with self._lock:
+            result = dict(self._stats)
+            result['size'] = len(self._entries)
+        return result
+
+
+class Compressor:
+    """Обработчик after_request, сжимающий ответы приложения
+
+    Настройки берутся из app.config (см. DEFAULTS). По каждому эндпоинту
+    считается, сколько байт было до и после сжатия - stats().
+    """
+
+    def __init__(self, app=None):
+        self.cache = None
+        self._lock = threading.Lock()
+        self._stats = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        for name, value in DEFAULTS.items():
+            app.config.setdefault(name, value)
+        self.config = app.config
+        self.cache = CompressedCache(app.config['COMPRESS_CACHE_SIZE'])
+        app.extensions['compressor'] = self
+        app.after_request(self.after_request)
+
+    def compress(self, body, encoding):
+        if encoding == 'br':
+            return brotli.compress(body, quality=self.config['COMPRESS_BR_LEVEL'])
+        # mtime=0 - одинаковое тело дает одинаковые байты
+        return gzip.compress(body, compresslevel=self.config['COMPRESS_LEVEL'], mtime=0)
+
+    def after_request(self, response):
+        if response.mimetype not in COMPRESSIBLE_TYPES and response.status_code != 304:
+            return response
+        response.vary.add('Accept-Encoding')
+        if 'no-transform' in response.cache_control:
+            return response
+        encoding = negotiate(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        etag, weak = response.get_etag()
+        if response.status_code == 304:
+            # Клиент держит сжатое представление - его ETag был ослаблен
+            if etag and not weak:
+                response.set_etag(etag, weak=True)
+            return response
+        if (response.status_code != 200 or response.is_streamed
+                or response.direct_passthrough or 'Content-Encoding' in response.headers):
+            return response
+
+        body = response.get_data()
+        if len(body) < self.config['COMPRESS_MIN_SIZE']:
+            return response
+
+        cacheable = etag and 'no-store' not in response.cache_control
+        key = (request.full_path, etag, encoding)
+        compressed = self.cache.get(key) if cacheable else None
+        if compressed is None:
+            compressed = self.compress(body, encoding)
+            if cacheable:
+                self.cache.put(key, compressed)
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        if etag:
+            # Сжатое тело побайтно отличается от исходного - строгий ETag
+            # становится слабым, как это делает nginx
+            response.set_etag(etag, weak=True)
+        self._count(request.endpoint, len(body), len(compressed))
+        return response
+
+    def _count(self, endpoint, original, compressed):
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, {'responses': 0, 'bytes_in': 0, 'bytes_out': 0})
+            stats['responses'] += 1
+            stats['bytes_in'] += original
+            stats['bytes_out'] += compressed
+
+    def stats(self):
+        """{эндпоинт: {'responses', 'bytes_in', 'bytes_out', 'saved'}}"""
+        with self._lock:
+            result = {endpoint: dict(stats) for endpoint, stats in self._stats.items()}
+        for stats in result.values():
+            stats['saved'] = stats['bytes_in'] - stats['bytes_out']
+        return result
@@ -0,0 +1,66 @@
+"""Настройки приложения
+
+Порядок (последующие перекрывают предыдущие):
+    1. DEFAULTS ниже;
+    2. JSON-файл из переменной окружения KURSACH_CONFIG;
+    3. переменные окружения KURSACH_<КЛЮЧ>, значение разбирается как JSON,
+       вложенные ключи через __: KURSACH_DATABASE_PRAGMAS__cache_size=-32000;
+    4. словарь, переданный в create_app(config).
+
+Пример:
+    KURSACH_DATABASE_PATH=/var/lib/kursach/autoservice.db flask --app app bootstrap
+"""
+import copy
+import json
+import os
+
+from database import DEFAULT_DB_PATH
+
+ENV_PREFIX = 'KURSACH'
+CONFIG_FILE_ENV = 'KURSACH_CONFIG'
+
+DEFAULTS = {
+    'SECRET_KEY': 'your-secret-key-here-12345',  # Измените на свой секретный ключ
+    'SESSION_TYPE': 'filesystem',
+    'SESSION_PERMANENT': False,
+    'SESSION_USE_SIGNER': True,
+    'DATABASE_PATH': DEFAULT_DB_PATH,
+    'DATABASE_POOL_SIZE': 8,
+    'DATABASE_CACHE_SIZE': 1024,
+    # Дополнительно к database.DEFAULT_PRAGMAS: {"cache_size": -32000, ...}
+    'DATABASE_PRAGMAS': {},
+    # Сколько секунд /api/stats отдает снимок счетчиков из памяти процесса
+    'STATS_TTL_SECONDS': 10,
+    # Токен для /api/reports/* (Authorization: Bearer ...); None - отчеты выключены
+    'REPORTS_TOKEN': None,
+    # Токен для /api/operator/* (входящие чата поддержки); None - выключены
+    'OPERATOR_TOKEN': None,
+    # Помесячный архив (flask --app app archive): папка (None - <база>-archive),
+    # возраст переносимых строк, статусы закрытых заказов, строк за пачку
+    # и страниц incremental_vacuum за шаг
+    'ARCHIVE_DIR': None,
+    'ARCHIVE_AFTER_DAYS': 365,
+    'ARCHIVE_ORDER_STATUSES': ['done', 'cancelled'],
+    'ARCHIVE_BATCH_SIZE': 500,
+    'ARCHIVE_VACUUM_PAGES': 512,
+    # Групповая запись сообщений чата (chat_writer.py): пачка до BATCH
+    # сообщений за окно WINDOW_MS, в очереди не больше QUEUE. При 0 в пачку
+    # идет накопленное за время прошлого коммита - ожидание окна задерживает
+    # каждый ответ, а пачки крупнее не делает, пока обработчики ждут коммита
+    'CHAT_WRITER_ENABLED': True,
+    'CHAT_WRITER_BATCH': 256,
+    'CHAT_WRITER_WINDOW_MS': 0,
+    'CHAT_WRITER_QUEUE': 10000,
+}
+
+
+def load_config(app, overrides=None):
+    """Заполнить app.config по порядку, описанному в начале модуля"""
+    # deepcopy: from_prefixed_env меняет вложенные словари на месте
+    app.config.from_mapping(copy.deepcopy(DEFAULTS))
+    config_file = os.environ.get(CONFIG_FILE_ENV)
+    if config_file:
+        app.config.from_file(os.path.abspath(config_file), load=json.load)
+    app.config.from_prefixed_env(ENV_PREFIX)
+    if overrides:
+        app.config.from_mapping(overrides)
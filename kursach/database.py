@@ -1,157 +1,540 @@
 import os
 import sqlite3
 import json
-from datetime import datetime
+import base64
+import re
+import queue
+import threading
+import time
+import heapq
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from archive import MonthlyArchive, COLUMNS as ARCHIVE_COLUMNS
+from chat_hub import ChatHub
+from chat_writer import ChatWriter
+from migrations import migrate, schema_version, pending_hooks, LATEST_VERSION, STATS_COUNTERS
+from models import User, Part, Order, OrderItem, Appointment, Car, ChatMessage, Conversation
+from schedule import SlotSchedule, parse_date
+
+# База по умолчанию - рядом с модулем (в приложении путь задается DATABASE_PATH)
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'autoservice.db')
+
+# Настройки соединений SQLite: WAL позволяет читателям не ждать писателя,
+# synchronous=NORMAL в режиме WAL безопасен и не делает fsync на каждый коммит.
+# auto_vacuum - первым: у новой базы он действует, только если задан до WAL
+# и до создания таблиц (существующую переводит миграция 13)
+DEFAULT_PRAGMAS = {
+    'auto_vacuum': 'INCREMENTAL',
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -16000,        # ~16 МБ страничного кэша на соединение
+    'mmap_size': 268435456,      # 256 МБ отображения файла в память
+    'temp_store': 'MEMORY',
+}
+
+# Сортировки каталога: (колонка ключа, направление)
+PART_SORTS = {
+    'default': ('id', 'ASC'),
+    'price_asc': ('price', 'ASC'),
+    'price_desc': ('price', 'DESC'),
+    'name': ('name', 'ASC'),
+}
+
+PART_COLUMNS = Part.sql_columns()
+
+# Дневные агрегаты отчетов: источник -> запросы, добавляющие к таблицам
+# daily_* строки источника с id в диапазоне (?, ?]. Сумма заказа и позиции
+# берутся из orders и order_items, JSON order_data не разбирается.
+# {schema} - main или archive (пересчет по файлам архива)
+ROLLUP_QUERIES = {
+    'orders': [
+        '''
+        INSERT INTO daily_sales (day, orders, revenue)
+        SELECT date(created_at), COUNT(*), SUM(total_price)
+        FROM {schema}.orders WHERE id > ? AND id <= ?
+        GROUP BY date(created_at)
+        ON CONFLICT (day) DO UPDATE SET
+            orders = orders + excluded.orders,
+            revenue = revenue + excluded.revenue
+        ''',
+        '''
+        INSERT INTO daily_part_sales (day, part_id, units, revenue)
+        SELECT date(o.created_at), COALESCE(i.part_id, 0), SUM(i.quantity), SUM(i.price * i.quantity)
+        FROM {schema}.orders o JOIN {schema}.order_items i ON i.order_id = o.id
+        WHERE o.id > ? AND o.id <= ?
+        GROUP BY 1, 2
+        ON CONFLICT (day, part_id) DO UPDATE SET
+            units = units + excluded.units,
+            revenue = revenue + excluded.revenue
+        ''',
+        '''
+        INSERT INTO monthly_part_sales (month, part_id, units, revenue)
+        SELECT strftime('%Y-%m', o.created_at), COALESCE(i.part_id, 0), SUM(i.quantity), SUM(i.price * i.quantity)
+        FROM {schema}.orders o JOIN {schema}.order_items i ON i.order_id = o.id
+        WHERE o.id > ? AND o.id <= ?
+        GROUP BY 1, 2
+        ON CONFLICT (month, part_id) DO UPDATE SET
+            units = units + excluded.units,
+            revenue = revenue + excluded.revenue
+        ''',
+        # Категория - на момент обработки заказа
+        '''
+        INSERT INTO daily_category_sales (day, category, units, revenue)
+        SELECT date(o.created_at), COALESCE(p.category, ''), SUM(i.quantity), SUM(i.price * i.quantity)
+        FROM {schema}.orders o JOIN {schema}.order_items i ON i.order_id = o.id
+        LEFT JOIN main.parts p ON p.id = i.part_id
+        WHERE o.id > ? AND o.id <= ?
+        GROUP BY 1, 2
+        ON CONFLICT (day, category) DO UPDATE SET
+            units = units + excluded.units,
+            revenue = revenue + excluded.revenue
+        ''',
+    ],
+    'appointments': [
+        '''
+        INSERT INTO daily_appointments (day, service_type, appointments)
+        SELECT appointment_date, service_type, COUNT(*)
+        FROM {schema}.appointments WHERE id > ? AND id <= ?
+        GROUP BY 1, 2
+        ON CONFLICT (day, service_type) DO UPDATE SET
+            appointments = appointments + excluded.appointments
+        ''',
+    ],
+}
+ROLLUP_TABLES = ('daily_sales', 'daily_part_sales', 'monthly_part_sales', 'daily_category_sales',
+                 'daily_appointments')
+
+
+def split_months(date_from, date_to):
+    """Период по дням -> ((первый, последний) полный месяц 'YYYY-MM' или None, [(от, до) дней вне них])"""
+    start, end = parse_date(date_from), parse_date(date_to)
+    first = start if start.day == 1 else (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    last = end if (end + timedelta(days=1)).day == 1 else end.replace(day=1) - timedelta(days=1)
+    if first > last:
+        return None, [(date_from, date_to)]
+    days = []
+    if start < first:
+        days.append((date_from, (first - timedelta(days=1)).isoformat()))
+    if last < end:
+        days.append(((last + timedelta(days=1)).isoformat(), date_to))
+    return (first.isoformat()[:7], last.isoformat()[:7]), days
+
+CHAT_COLUMNS = ChatMessage.sql_columns()
+
+# Разговор (Conversation.COLUMNS): сводка, клиент и последнее сообщение
+CONVERSATION_SELECT = '''
+    SELECT c.user_id, u.name, u.phone, c.last_message_id, m.message, m.is_support, m.created_at,
+           c.unread_by_operator
+    FROM chat_conversations c
+    LEFT JOIN users u ON u.id = c.user_id
+    LEFT JOIN chat_messages m ON m.id = c.last_message_id
+'''
+
+# Заказ (Order.COLUMNS) и его позиция (OrderItem.COLUMNS) в одной строке JOIN
+ORDER_ITEM_COLUMNS = f'{Order.sql_columns("o")}, i.part_id, i.name, i.price, i.image, i.quantity'
+ORDER_COLUMNS_COUNT = len(Order.COLUMNS)
+
+# Строк за один fetchmany при потоковой выгрузке
+EXPORT_FETCH_SIZE = 500
+
+# Колонки загрузки каталога (Database.import_parts), sku - артикул поставщика
+PART_IMPORT_COLUMNS = ('sku', 'name', 'category', 'brand', 'price', 'description', 'image', 'in_stock')
+PART_UPSERT_SQL = f'''
+    INSERT INTO parts ({', '.join(PART_IMPORT_COLUMNS)})
+    VALUES ({', '.join('?' * len(PART_IMPORT_COLUMNS))})
+    ON CONFLICT (sku) DO UPDATE SET
+        {', '.join(f'{c} = excluded.{c}' for c in PART_IMPORT_COLUMNS[1:])}
+'''
+
+# Ограничение SQLite на число параметров в одном запросе - ищем пачками
+IDS_CHUNK_SIZE = 500
+
+# Оформление заказа: штук одного товара в заказе и предел суммы заказа
+# (INTEGER в SQLite - 64 бита, большее значение не запишется)
+MAX_ITEM_QUANTITY = 999
+MAX_ORDER_TOTAL = 2 ** 63 - 1
+
+# Архив (archive.py): закрытые заказы с этими статусами, строк за одну
+# пару транзакций (не больше IDS_CHUNK_SIZE), страниц incremental_vacuum за шаг
+ARCHIVE_ORDER_STATUSES = ('done', 'cancelled')
+ARCHIVE_BATCH_SIZE = IDS_CHUNK_SIZE
+ARCHIVE_VACUUM_PAGES = 512
+
+# Разделы личного кабинета (Database.get_user_dashboard)
+DASHBOARD_SECTIONS = ('orders', 'appointments', 'cars', 'unread', 'summary')
+
+
+# Веса колонок parts_fts для bm25: совпадение в названии важнее описания
+FTS_WEIGHTS = (10.0, 2.0, 1.0, 1.0)
+FTS_RANK_CANDIDATES = 2000
+
+_FTS_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def build_fts_query(text):
+    """Поисковая строка -> запрос FTS5, где каждое слово ищется как префикс
+    
+    Слова берутся только из букв и цифр, поэтому синтаксис FTS5
+    (кавычки, NEAR, OR, *) во вводе пользователя не интерпретируется.
+    """
+    tokens = _FTS_TOKEN_RE.findall(text or '')
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def _group_order_rows(rows):
+    """Строки orders LEFT JOIN order_items (ORDER_ITEM_COLUMNS) -> заказы с позициями
+    
+    Строки одного заказа должны идти подряд; заказ отдается, как только
+    начинается следующий, поэтому rows может быть потоком.
+    """
+    order = None
+    for r in rows:
+        if order is None or order.id != r[0]:
+            if order is not None:
+                yield order
+            order = Order.from_row(r[:ORDER_COLUMNS_COUNT])
+        # LEFT JOIN: у заказа без позиций колонки order_items - NULL
+        if r[-1] is not None:
+            order.items.append(OrderItem.from_row(r[ORDER_COLUMNS_COUNT:]))
+    if order is not None:
+        yield order
+
+
+def encode_cursor(values):
+    """Непрозрачный курсор для keyset-пагинации"""
+    raw = json.dumps(values, ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, length):
+    """Разбор курсора из length значений; ValueError, если курсор поврежден
+    
+    Значения идут в параметры запроса и в ключ кэша каталога, поэтому
+    допускаются только числа и строки.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError('Некорректный курсор') from e
+    if not isinstance(values, list) or len(values) != length or not all(
+            isinstance(v, (int, float, str)) and not isinstance(v, bool) for v in values):
+        raise ValueError('Некорректный курсор')
+    return values
+
+
+class ConnectionPool:
+    """Потокобезопасный пул соединений SQLite на основе ограниченной очереди"""
+
+    def __init__(self, db_name, size=8, timeout=10.0, pragmas=None, factory=sqlite3.Connection):
+        self.db_name = db_name
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = DEFAULT_PRAGMAS if pragmas is None else pragmas
+        self.factory = factory
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+        self._stats = {'hits': 0, 'misses': 0, 'waits': 0, 'timeouts': 0, 'wait_time': 0.0}
+
+    def _connect(self):
+        # isolation_level=None: транзакциями управляем явно через Database.transaction()
+        conn = sqlite3.connect(self.db_name, timeout=self.timeout, factory=self.factory,
+                               isolation_level=None, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def acquire(self):
+        """Взять соединение из пула (или создать новое, если лимит не достигнут)"""
+        if self._closed:
+            raise RuntimeError('Пул соединений закрыт')
+        try:
+            conn = self._idle.get_nowait()
+            with self._lock:
+                self._stats['hits'] += 1
+            return conn
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                self._stats['misses'] += 1
+                create = True
+            else:
+                self._stats['waits'] += 1
+                create = False
+
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        started = time.perf_counter()
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise TimeoutError(f'Нет свободных соединений с БД за {self.timeout} с')
+        with self._lock:
+            self._stats['wait_time'] += time.perf_counter() - started
+        return conn
+
+    def release(self, conn):
+        """Вернуть соединение в пул"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Соединение в неисправном состоянии - не возвращаем его в пул
+            self.discard(conn)
+            return
+        if self._closed:
+            self.discard(conn)
+            return
+        self._idle.put_nowait(conn)
+
+    def discard(self, conn):
+        """Закрыть сломанное соединение, освободив место в пуле"""
+        try:
+            conn.close()
+        finally:
+            with self._lock:
+                self._created -= 1
+
+    def close(self):
+        """Закрыть все свободные соединения"""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self.discard(conn)
+
+    def stats(self):
+        """Статистика пула: попадания, ожидания, размер"""
+        with self._lock:
+            result = dict(self._stats)
+            result['size'] = self._created
+            result['max_size'] = self.size
+        result['idle'] = self._idle.qsize()
+        result['in_use'] = result['size'] - result['idle']
+        return result
+
+
+class OrderError(ValueError):
+    """Корзина не прошла проверку при оформлении заказа"""
+
+
+class BookingError(ValueError):
+    """Выбранное время записи занято или дальше горизонта записи"""
+
+
+class CatalogCache:
+    """LRU-кэш чтений каталога, действительный для одной версии каталога
+    
+    Версия хранится в таблице catalog_version и увеличивается триггерами
+    на любое изменение parts, поэтому запись из другого процесса тоже
+    делает кэш устаревшим. Значения отдаются как есть - их нельзя изменять.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get(self, key, version):
+        """Значение для ключа или None, если его нет в кэше этой версии"""
+        with self._lock:
+            if version != self.version:
+                if self._entries:
+                    self._stats['invalidations'] += 1
+                self._entries.clear()
+                self.version = version
+            value = self._entries.get(key)
+            if value is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def put(self, key, version, value):
+        with self._lock:
+            if version != self.version:
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.version = None
+
+    def stats(self):
+        with self._lock:
+            result = dict(self._stats)
+            result['size'] = len(self._entries)
+            result['version'] = self.version
+        return result
+
 
 class Database:
-    def __init__(self, db_name='autoservice.db'):
-        # Указываем полный путь к базе данных
-        self.db_name = r'C:\Users\dimka\OneDrive\Desktop\proj\kursach\autoservice.db'
+    def __init__(self, db_name=None, pool_size=8, cache_size=1024, schedule=None, pragmas=None,
+                 connection_factory=sqlite3.Connection, counters_ttl=10.0, archive_dir=None):
+        """Дешевая инициализация: соединения открываются пулом по требованию
+        
+        Схема здесь не создается - это делает init_database() один раз
+        при развертывании (flask --app app bootstrap), а не каждый процесс.
+        connection_factory - класс соединений (metrics.InstrumentedConnection).
+        counters_ttl - сколько секунд get_counters отдает снимок из памяти.
+        archive_dir - папка помесячных архивов (по умолчанию <база>-archive).
+        """
+        self.db_name = db_name or DEFAULT_DB_PATH
         
         # Создаем папку если её нет
         db_dir = os.path.dirname(self.db_name)
-        if not os.path.exists(db_dir):
-            os.makedirs(db_dir)
-            print(f"Создана папка: {db_dir}")
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
         
-        print(f"База данных будет создана по пути: {self.db_name}")
-        self.init_database()
+        self.pool = ConnectionPool(self.db_name, size=pool_size,
+                                   pragmas={**DEFAULT_PRAGMAS, **(pragmas or {})},
+                                   factory=connection_factory)
+        self.catalog_cache = CatalogCache(max_entries=cache_size)
+        self.chat_hub = ChatHub()
+        self.chat_writer = None
+        self.schedule = schedule or SlotSchedule.from_file()
+        self.counters_ttl = counters_ttl
+        self._counters = (0.0, None)  # (monotonic-время устаревания, снимок)
+        self.archive = MonthlyArchive(archive_dir or os.path.splitext(self.db_name)[0] + '-archive')
     
     def get_connection(self):
-        return sqlite3.connect(self.db_name)
+        """Новое соединение с теми же настройками, что и в пуле (вне пула)"""
+        return self.pool._connect()
     
-    def init_database(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Таблица пользователей
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                phone TEXT UNIQUE NOT NULL,
-                email TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Таблица запчастей
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS parts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                category TEXT NOT NULL,
-                brand TEXT NOT NULL,
-                price INTEGER NOT NULL,
-                description TEXT,
-                image TEXT,
-                in_stock BOOLEAN DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Таблица заказов
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS orders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                order_data TEXT NOT NULL,
-                total_price INTEGER NOT NULL,
-                status TEXT DEFAULT 'new',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        # Таблица записей на ТО
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS appointments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                car_brand TEXT NOT NULL,
-                car_model TEXT NOT NULL,
-                car_year INTEGER NOT NULL,
-                service_type TEXT NOT NULL,
-                appointment_date DATE NOT NULL,
-                appointment_time TEXT NOT NULL,
-                additional_info TEXT,
-                status TEXT DEFAULT 'pending',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        # Таблица автомобилей пользователя
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_cars (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                brand TEXT NOT NULL,
-                model TEXT NOT NULL,
-                year INTEGER,
-                vin TEXT,
-                license_plate TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-            )
-        ''')
-        
-        # Таблица сообщений чата
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS chat_messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                user_name TEXT,
-                message TEXT NOT NULL,
-                is_support BOOLEAN DEFAULT 0,
-                is_read BOOLEAN DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
+    @contextmanager
+    def connection(self):
+        """Соединение из пула на время блока with"""
+        conn = self.pool.acquire()
+        try:
+            yield conn
+        finally:
+            self.pool.release(conn)
+    
+    @contextmanager
+    def transaction(self, mode='DEFERRED', conn=None):
+        """Транзакция на соединении из пула (или на conn): COMMIT при успехе, ROLLBACK при ошибке"""
+        if conn is None:
+            with self.connection() as conn, self.transaction(mode, conn):
+                yield conn
+            return
+        conn.execute(f'BEGIN {mode}')
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
         conn.commit()
-        conn.close()
+    
+    def pool_stats(self):
+        """Статистика пула соединений"""
+        return self.pool.stats()
+    
+    def cache_stats(self):
+        """Статистика кэша каталога"""
+        return self.catalog_cache.stats()
+    
+    def start_chat_writer(self, **options):
+        """Писать сообщения чата пачками в фоновом потоке (см. chat_writer.py)"""
+        if self.chat_writer is None:
+            # lambda: метод берется в момент записи - с оберткой Metrics.instrument
+            self.chat_writer = ChatWriter(lambda messages: self.write_chat_messages(messages), **options)
+        return self.chat_writer
+    
+    def close(self):
+        """Дописать очередь чата и закрыть пул соединений"""
+        if self.chat_writer is not None:
+            self.chat_writer.close()
+        self.pool.close()
+    
+    def init_database(self):
+        """Приведение схемы к актуальной версии (см. migrations.py)"""
+        migrate(self)
+        # Загрузка каталога оборвалась, не вернув индексы и триггеры parts
+        restored = self._resume_parts_maintenance(changed=None)
+        if restored:
+            print(f"Восстановлено индексов и триггеров каталога после прерванной загрузки: {restored}")
         print("База данных успешно инициализирована")
     
+    def check_schema(self):
+        """RuntimeError, если схема базы не последней версии или перенос
+        данных после миграции не завершился
+        
+        PRAGMA user_version и migration_hooks - вместо миграций при старте процесса.
+        """
+        with self.connection() as conn:
+            version = schema_version(conn)
+            pending = pending_hooks(conn)
+        if version < LATEST_VERSION:
+            raise RuntimeError(f'Схема базы {self.db_name} версии {version}, нужна {LATEST_VERSION}: '
+                               f'выполните flask --app app bootstrap')
+        if pending:
+            raise RuntimeError(f'Не завершен перенос данных после миграций {pending} базы {self.db_name}: '
+                               f'выполните flask --app app bootstrap')
+
     # ========== РАБОТА С ПОЛЬЗОВАТЕЛЯМИ ==========
     
     def get_or_create_user(self, name, phone, email=None):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Проверяем существующего пользователя
-        cursor.execute('SELECT * FROM users WHERE phone = ?', (phone,))
-        user = cursor.fetchone()
-        
+        # Обычно пользователь уже есть - хватает чтения без блокировки записи
+        with self.connection() as conn:
+            user = conn.execute(f'SELECT {User.sql_columns()} FROM users WHERE phone = ?', (phone,)).fetchone()
         if user:
-            conn.close()
-            return {'id': user[0], 'name': user[1], 'phone': user[2], 'email': user[3]}
-        else:
+            return User.from_row(user)
+
+        # IMMEDIATE: в режиме WAL читающая транзакция не может стать пишущей,
+        # если базу успел изменить другой писатель (сразу "database is locked")
+        with self.transaction('IMMEDIATE') as conn:
+            cursor = conn.cursor()
+
+            # Проверяем еще раз: пользователя мог создать параллельный запрос
+            cursor.execute(f'SELECT {User.sql_columns()} FROM users WHERE phone = ?', (phone,))
+            user = cursor.fetchone()
+
+            if user:
+                return User.from_row(user)
+
             # Создаем нового пользователя
-            cursor.execute('''
+            cursor.execute(f'''
                 INSERT INTO users (name, phone, email)
                 VALUES (?, ?, ?)
+                RETURNING {User.sql_columns()}
             ''', (name, phone, email))
-            conn.commit()
-            user_id = cursor.lastrowid
-            conn.close()
-            return {'id': user_id, 'name': name, 'phone': phone, 'email': email}
+            return User.from_row(cursor.fetchone())
     
     def update_user_profile(self, user_id, name, email):
         """Обновление профиля пользователя"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE users 
-            SET name = ?, email = ?
-            WHERE id = ?
-        ''', (name, email, user_id))
-        
-        affected = cursor.rowcount
-        conn.commit()
-        conn.close()
+        with self.transaction() as conn:
+            cursor = conn.execute('''
+                UPDATE users
+                SET name = ?, email = ?
+                WHERE id = ?
+            ''', (name, email, user_id))
+            affected = cursor.rowcount
         return affected > 0
     
     # ========== РАБОТА С ЗАПЧАСТЯМИ ==========
@@ -208,305 +591,1230 @@ class Database:
              'description': 'С подогревом', 'image': 'https://avatars.mds.yandex.net/get-mpic/4250892/img_id8865515304351179951.jpeg/orig'}
         ]
         
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Проверяем, есть ли уже данные
-        cursor.execute('SELECT COUNT(*) FROM parts')
-        count = cursor.fetchone()[0]
-        
-        if count == 0:
-            for part in parts:
-                cursor.execute('''
+        with self.transaction('IMMEDIATE') as conn:
+            cursor = conn.cursor()
+
+            # Проверяем, есть ли уже данные
+            cursor.execute('SELECT COUNT(*) FROM parts')
+            count = cursor.fetchone()[0]
+
+            if count == 0:
+                cursor.executemany('''
                     INSERT INTO parts (name, category, brand, price, description, image, in_stock)
                     VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (part['name'], part['category'], part['brand'], part['price'], 
-                      part['description'], part['image'], 1))
+                ''', [(part['name'], part['category'], part['brand'], part['price'],
+                       part['description'], part['image'], 1) for part in parts])
+
+    def import_parts(self, rows, batch_size=1000, progress=None, defer_maintenance=True):
+        """Пакетная загрузка запчастей с обновлением по артикулу поставщика
         
-        conn.commit()
-        conn.close()
+        rows - итерируемый поток кортежей в порядке PART_IMPORT_COLUMNS
+        (уже проверенных, см. catalog_import.py); читается по batch_size
+        строк, каждая пачка - отдельная транзакция с executemany. Новые
+        артикулы добавляются, измененные обновляются, совпадающие
+        пропускаются. progress(stats) вызывается после каждой пачки.
+        
+        С defer_maintenance индексы и триггеры parts (полнотекстовый
+        индекс, версия каталога) на время загрузки снимаются и в конце
+        создаются заново одним проходом; индекс по sku остается, он нужен
+        для UPSERT. Их DDL хранится в parts_suspended_ddl: если процесс
+        упал посреди загрузки, их вернет init_database или следующая загрузка.
+        """
+        stats = {'rows': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0,
+                 'duplicates': 0, 'batches': 0, 'seconds': 0.0}
+        started = time.perf_counter()
+        if defer_maintenance:
+            self._suspend_parts_maintenance()
+        try:
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    self._import_parts_batch(batch, stats, started, progress)
+                    batch = []
+            if batch:
+                self._import_parts_batch(batch, stats, started, progress)
+        finally:
+            if defer_maintenance:
+                self._resume_parts_maintenance(changed=stats['inserted'] + stats['updated'])
+        stats['seconds'] = time.perf_counter() - started
+        return stats
+    
+    def _import_parts_batch(self, batch, stats, started, progress):
+        # Повтор артикула внутри пачки - остается последняя строка
+        by_sku = {row[0]: row for row in batch}
+        stats['duplicates'] += len(batch) - len(by_sku)
+
+        with self.transaction('IMMEDIATE') as conn:
+            existing = {}
+            skus = list(by_sku)
+            for i in range(0, len(skus), IDS_CHUNK_SIZE):
+                chunk = skus[i:i + IDS_CHUNK_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                for r in conn.execute(f'''
+                    SELECT {', '.join(PART_IMPORT_COLUMNS)} FROM parts WHERE sku IN ({placeholders})
+                ''', chunk):
+                    existing[r[0]] = tuple(r)
+
+            changed = [row for sku, row in by_sku.items() if existing.get(sku) != row]
+            conn.executemany(PART_UPSERT_SQL, changed)
+
+        updated = sum(1 for row in changed if row[0] in existing)
+        stats['inserted'] += len(changed) - updated
+        stats['updated'] += updated
+        stats['unchanged'] += len(by_sku) - len(changed)
+        stats['rows'] += len(batch)
+        stats['batches'] += 1
+        stats['seconds'] = time.perf_counter() - started
+        if progress:
+            progress(dict(stats))
+    
+    def _suspend_parts_maintenance(self):
+        """Снять индексы и триггеры parts, сохранив их DDL в parts_suspended_ddl
+        
+        DDL записывается в той же транзакции, что и DROP, поэтому снятые
+        объекты не теряются, даже если загрузка не дойдет до конца.
+        """
+        with self.transaction('IMMEDIATE') as conn:
+            suspended = conn.execute('''
+                SELECT type, name, sql FROM sqlite_master
+                WHERE tbl_name = 'parts' AND type IN ('index', 'trigger')
+                  AND sql IS NOT NULL AND name != 'idx_parts_sku'
+            ''').fetchall()
+            conn.executemany('INSERT OR IGNORE INTO parts_suspended_ddl (type, name, sql) VALUES (?, ?, ?)',
+                             suspended)
+            for object_type, name, _ in suspended:
+                conn.execute(f'DROP {object_type.upper()} IF EXISTS {name}')
+    
+    def _resume_parts_maintenance(self, changed):
+        """Вернуть индексы и триггеры из parts_suspended_ddl, перестроить
+        поиск и сменить версию каталога; возвращает число восстановленных объектов
+        
+        Триггеры stats_counters на время загрузки тоже снимались, поэтому
+        счетчики по parts пересчитываются одним COUNT. changed - сколько
+        запчастей изменила загрузка, None - неизвестно (после сбоя).
+        """
+        with self.transaction('IMMEDIATE') as conn:
+            suspended = conn.execute('SELECT name, sql FROM parts_suspended_ddl').fetchall()
+            if not suspended and not changed:
+                return 0
+            existing = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE tbl_name = 'parts'")}
+            for name, sql in suspended:
+                if name not in existing:
+                    conn.execute(sql)
+            conn.execute('DELETE FROM parts_suspended_ddl')
+            for name, (table, expression, _) in STATS_COUNTERS.items():
+                if table == 'parts':
+                    conn.execute(f'''
+                        UPDATE stats_counters SET value = (
+                            SELECT COALESCE(SUM({expression.format(row='')}), 0) FROM parts
+                        ) WHERE name = ?
+                    ''', (name,))
+            # После сбоя неизвестно, что успело загрузиться, - перестраиваем
+            if changed or (changed is None and suspended):
+                conn.execute("INSERT INTO parts_fts (parts_fts) VALUES ('rebuild')")
+                conn.execute('UPDATE catalog_version SET version = version + 1 WHERE id = 1')
+        return len(suspended)
+
+    def catalog_version(self):
+        """Текущая версия каталога (меняется при любом изменении parts)"""
+        with self.connection() as conn:
+            return self._read_catalog_version(conn)
+    
+    def _read_catalog_version(self, conn):
+        return conn.execute('SELECT version FROM catalog_version WHERE id = 1').fetchone()[0]
+    
+    def _cached_catalog_read(self, key, loader):
+        """Чтение каталога через кэш: версия и данные берутся из одного снимка"""
+        with self.transaction() as conn:
+            version = self._read_catalog_version(conn)
+            value = self.catalog_cache.get(key, version)
+            if value is None:
+                value = loader(conn)
+                self.catalog_cache.put(key, version, value)
+        return value
     
     def get_all_parts(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM parts ORDER BY id')
-        parts = cursor.fetchall()
-        conn.close()
-        
-        return [{
-            'id': p[0],
-            'name': p[1],
-            'category': p[2],
-            'brand': p[3],
-            'price': p[4],
-            'description': p[5],
-            'image': p[6],
-            'in_stock': bool(p[7])
-        } for p in parts]
+        def load(conn):
+            parts = conn.execute(f'SELECT {PART_COLUMNS} FROM parts ORDER BY id').fetchall()
+            return [Part.from_row(p) for p in parts]
+        return self._cached_catalog_read(('all',), load)
     
     def get_part_by_id(self, part_id):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM parts WHERE id = ?', (part_id,))
-        p = cursor.fetchone()
-        conn.close()
+        def load(conn):
+            p = conn.execute(f'SELECT {PART_COLUMNS} FROM parts WHERE id = ?', (part_id,)).fetchone()
+            # False вместо None, чтобы отсутствие запчасти тоже кэшировалось
+            return Part.from_row(p) if p else False
+        return self._cached_catalog_read(('part', part_id), load) or None
+    
+    def get_parts_page(self, category=None, brand=None, min_price=None, max_price=None,
+                       search=None, sort='default', limit=24, cursor=None):
+        """Страница каталога с фильтрами, сортировкой и keyset-пагинацией
+        
+        Возвращает {'parts', 'total', 'next_cursor'}. Запчасти с brand='all'
+        подходят к любой марке, как и в фильтре на клиенте.
+        """
+        if sort not in PART_SORTS:
+            raise ValueError(f'Неизвестная сортировка: {sort}')
+        key, direction = PART_SORTS[sort]
+        
+        where = []
+        params = []
+        if category and category != 'all':
+            where.append('category = ?')
+            params.append(category)
+        if brand and brand != 'all':
+            where.append("brand IN (?, 'all')")
+            params.append(brand)
+        if min_price is not None:
+            where.append('price >= ?')
+            params.append(min_price)
+        if max_price is not None:
+            where.append('price <= ?')
+            params.append(max_price)
+        if search:
+            fts_query = build_fts_query(search)
+            if not fts_query:
+                return {'parts': [], 'total': 0, 'next_cursor': None}
+            where.append('id IN (SELECT rowid FROM parts_fts WHERE parts_fts MATCH ?)')
+            params.append(fts_query)
+        
+        filter_sql = ' WHERE ' + ' AND '.join(where) if where else ''
+        filter_params = list(params)
         
-        if p:
+        # Курсор хранит ключ сортировки и id последней выданной строки
+        if cursor:
+            values = decode_cursor(cursor, 1 if key == 'id' else 2)
+            op = '>' if direction == 'ASC' else '<'
+            if key == 'id':
+                where.append(f'id {op} ?')
+            else:
+                where.append(f'({key}, id) {op} (?, ?)')
+            params.extend(values)
+        
+        page_sql = ' WHERE ' + ' AND '.join(where) if where else ''
+        order_sql = f'{key} {direction}' if key == 'id' else f'{key} {direction}, id {direction}'
+        
+        def load(conn):
+            rows = conn.execute(
+                f'SELECT {PART_COLUMNS} FROM parts{page_sql} ORDER BY {order_sql} LIMIT ?',
+                params + [limit + 1]
+            ).fetchall()
+            total = conn.execute(f'SELECT COUNT(*) FROM parts{filter_sql}', filter_params).fetchone()[0]
+            
+            next_cursor = None
+            if len(rows) > limit:
+                rows = rows[:limit]
+                last = Part.from_row(rows[-1])
+                next_cursor = encode_cursor([last.id] if key == 'id' else [getattr(last, key), last.id])
+            
             return {
-                'id': p[0],
-                'name': p[1],
-                'category': p[2],
-                'brand': p[3],
-                'price': p[4],
-                'description': p[5],
-                'image': p[6],
-                'in_stock': bool(p[7])
+                'parts': [Part.from_row(p) for p in rows],
+                'total': total,
+                'next_cursor': next_cursor
             }
-        return None
+        
+        cache_key = ('page', page_sql, tuple(params), order_sql, limit)
+        return self._cached_catalog_read(cache_key, load)
+    
+    def get_parts_by_ids(self, part_ids, conn=None):
+        """Запчасти по списку id одним запросом: {id: запчасть}"""
+        if conn is None:
+            with self.connection() as conn:
+                return self.get_parts_by_ids(part_ids, conn)
+        
+        ids = list(dict.fromkeys(part_ids))
+        result = {}
+        for start in range(0, len(ids), IDS_CHUNK_SIZE):
+            chunk = ids[start:start + IDS_CHUNK_SIZE]
+            placeholders = ', '.join('?' for _ in chunk)
+            rows = conn.execute(
+                f'SELECT {PART_COLUMNS} FROM parts WHERE id IN ({placeholders})', chunk
+            ).fetchall()
+            for p in rows:
+                result[p[0]] = Part.from_row(p)
+        return result
+    
+    def search_parts(self, text, limit=20):
+        """Полнотекстовый поиск запчастей с ранжированием bm25"""
+        fts_query = build_fts_query(text)
+        if not fts_query:
+            return []
+        
+        weights = ', '.join(str(w) for w in FTS_WEIGHTS)
+        # bm25 считается только для первых FTS_RANK_CANDIDATES совпадений:
+        # короткий префикс вроде "то" совпадает с десятками тысяч строк,
+        # а по мере набора слова выборка сужается и ранжирование становится точным
+        def load(conn):
+            rows = conn.execute(f'''
+                SELECT {Part.sql_columns('p')}
+                FROM (
+                    SELECT rowid, bm25(parts_fts, {weights}) AS score
+                    FROM parts_fts
+                    WHERE parts_fts MATCH ?
+                    LIMIT ?
+                ) f
+                JOIN parts p ON p.id = f.rowid
+                ORDER BY f.score
+                LIMIT ?
+            ''', (fts_query, FTS_RANK_CANDIDATES, limit)).fetchall()
+            return [Part.from_row(p) for p in rows]
+        return self._cached_catalog_read(('search', fts_query, limit), load)
     
     # ========== РАБОТА С ЗАКАЗАМИ ==========
     
     def create_order(self, user_id, items, total_price):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
+        with self.transaction() as conn:
+            return self._insert_order(conn, user_id, items, total_price)
+
+    def _insert_order(self, conn, user_id, items, total_price):
+        # order_data пишется по-прежнему, читается заказ из order_items
         order_data = json.dumps(items, ensure_ascii=False)
-        
-        cursor.execute('''
+        cursor = conn.execute('''
             INSERT INTO orders (user_id, order_data, total_price, status)
             VALUES (?, ?, ?, ?)
         ''', (user_id, order_data, total_price, 'new'))
-        
         order_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        
+        self._insert_order_items(conn, [(order_id, item) for item in items])
         return order_id
+
+    def _insert_order_items(self, conn, rows):
+        """rows: пары (order_id, позиция в формате корзины)"""
+        conn.executemany('''
+            INSERT INTO order_items (order_id, part_id, name, price, image, quantity)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(
+            order_id,
+            item.get('id'),
+            item.get('name'),
+            item.get('price') or 0,
+            item.get('image'),
+            item.get('quantity') or 1
+        ) for order_id, item in rows])
+
+    def migrate_order_items(self, batch_size=500):
+        """Перенос позиций из orders.order_data в order_items
+        
+        Заказы читаются пачками по id, каждая пачка - отдельная транзакция,
+        поэтому память не зависит от размера таблицы, а прерванный перенос
+        можно запустить повторно: уже перенесенные заказы пропускаются.
+        Возвращает число обработанных заказов.
+        """
+        last_id = 0
+        migrated = 0
+        while True:
+            with self.transaction('IMMEDIATE') as conn:
+                orders = conn.execute('''
+                    SELECT id, order_data FROM orders
+                    WHERE id > ?
+                      AND NOT EXISTS (SELECT 1 FROM order_items WHERE order_id = orders.id)
+                    ORDER BY id
+                    LIMIT ?
+                ''', (last_id, batch_size)).fetchall()
+                if not orders:
+                    break
+                
+                rows = []
+                for order_id, order_data in orders:
+                    try:
+                        items = json.loads(order_data)
+                    except ValueError:
+                        print(f"Заказ {order_id}: не удалось разобрать order_data")
+                        continue
+                    rows.extend((order_id, item) for item in items if isinstance(item, dict))
+                self._insert_order_items(conn, rows)
+            
+            last_id = orders[-1][0]
+            migrated += len(orders)
+        return migrated
+
+    def place_order(self, user_id, cart_items):
+        """Оформление заказа одной транзакцией
+        
+        Цены и названия берутся из каталога, а не из корзины клиента.
+        Возвращает {'order_id', 'items', 'total_price'}; при ошибке в
+        корзине бросает OrderError, и заказ не создается.
+        """
+        quantities = {}
+        names = {}
+        for item in cart_items:
+            try:
+                part_id = int(item['id'])
+                quantity = int(item.get('quantity', 1))
+            except (KeyError, TypeError, ValueError, OverflowError):
+                raise OrderError('Некорректная позиция в корзине')
+            if quantity <= 0:
+                raise OrderError('Количество товара должно быть больше нуля')
+            quantities[part_id] = quantities.get(part_id, 0) + quantity
+            if quantities[part_id] > MAX_ITEM_QUANTITY:
+                raise OrderError(f'Количество одного товара не может быть больше {MAX_ITEM_QUANTITY}')
+            names.setdefault(part_id, item.get('name') or f'#{part_id}')
+        
+        if not quantities:
+            raise OrderError('Корзина пуста')
+        
+        # IMMEDIATE: цены читаются и заказ пишется под одной блокировкой записи
+        with self.transaction('IMMEDIATE') as conn:
+            parts = self.get_parts_by_ids(quantities, conn)
+            
+            items = []
+            total_price = 0
+            for part_id, quantity in quantities.items():
+                part = parts.get(part_id)
+                if not part:
+                    raise OrderError(f'Товар {names[part_id]} не найден')
+                if not part.in_stock:
+                    raise OrderError(f'Товара {part.name} нет в наличии')
+                items.append({
+                    'id': part_id,
+                    'name': part.name,
+                    'price': part.price,
+                    'image': part.image,
+                    'quantity': quantity
+                })
+                total_price += part.price * quantity
+            if total_price > MAX_ORDER_TOTAL:
+                raise OrderError('Слишком большая сумма заказа')
+            
+            order_id = self._insert_order(conn, user_id, items, total_price)
+        
+        return {'order_id': order_id, 'items': items, 'total_price': total_price}
+
+    def get_user_orders(self, user_id, include_archived=False):
+        """Заказы пользователя, новые сверху; с include_archived - и из файлов архива"""
+        with self.connection() as conn:
+            orders = self._read_user_orders(conn, user_id)
+            months = self._archive_months(conn, 'orders', user_id) if include_archived else []
+        for month in months:
+            with self.archive.reader(month) as archive_conn:
+                orders.extend(self._read_user_orders(archive_conn, user_id))
+        if months:
+            orders.sort(key=lambda order: (order.created_at, order.id), reverse=True)
+        return orders
     
-    def get_user_orders(self, user_id):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM orders 
-            WHERE user_id = ? 
-            ORDER BY created_at DESC
-        ''', (user_id,))
-        orders = cursor.fetchall()
-        conn.close()
+    def _read_user_orders(self, conn, user_id):
+        rows = conn.execute(f'''
+            SELECT {ORDER_ITEM_COLUMNS}
+            FROM orders o
+            LEFT JOIN order_items i ON i.order_id = o.id
+            WHERE o.user_id = ?
+            ORDER BY o.created_at DESC, o.id DESC, i.id
+        ''', (user_id,)).fetchall()
+        return list(_group_order_rows(rows))
+    
+    # ========== ВЫГРУЗКА ==========
+    
+    def _stream_rows(self, sql, params=(), month=None):
+        """Строки запроса по мере чтения курсора, без списка в памяти
         
-        result = []
-        for o in orders:
-            result.append({
-                'id': o[0],
-                'user_id': o[1],
-                'items': json.loads(o[2]),
-                'total_price': o[3],
-                'status': o[4],
-                'created_at': o[5]
-            })
-        return result
+        Соединение занято, пока генератор не дочитан или не закрыт. Один
+        SELECT в SQLite читает согласованный снимок до своего завершения.
+        month - читать из файла архива за этот месяц.
+        """
+        with self.archive.reader(month) if month else self.connection() as conn:
+            cursor = conn.execute(sql, params)
+            try:
+                while True:
+                    rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+                    if not rows:
+                        return
+                    yield from rows
+            finally:
+                cursor.close()
+    
+    def export_parts(self):
+        """Весь каталог потоком Part"""
+        for p in self._stream_rows(f'SELECT {PART_COLUMNS} FROM parts ORDER BY id'):
+            yield Part.from_row(p)
+    
+    def _archived_streams(self, kind, user_id, sql):
+        """Строки sql из каждого файла архива пользователя и из основной базы"""
+        with self.connection() as conn:
+            months = self._archive_months(conn, kind, user_id)
+        return [self._stream_rows(sql, (user_id,), month) for month in reversed(months)] + [
+            self._stream_rows(sql, (user_id,))]
+
+    def export_orders(self, user_id):
+        """Заказы пользователя потоком, от старых к новым, с позициями (и архивные)"""
+        streams = self._archived_streams('orders', user_id, f'''
+            SELECT {ORDER_ITEM_COLUMNS}
+            FROM orders o
+            LEFT JOIN order_items i ON i.order_id = o.id
+            WHERE o.user_id = ?
+            ORDER BY o.created_at, o.id, i.id
+        ''')
+        return heapq.merge(*map(_group_order_rows, streams), key=lambda order: (order.created_at, order.id))
+    
+    def export_chat(self, user_id):
+        """Переписка пользователя потоком по возрастанию id (и архивная)"""
+        streams = self._archived_streams('chat_messages', user_id, f'''
+            SELECT {CHAT_COLUMNS} FROM chat_messages WHERE user_id = ? ORDER BY id
+        ''')
+        for m in heapq.merge(*streams):
+            yield ChatMessage.from_row(m)
     
     # ========== РАБОТА С ЗАПИСЯМИ ==========
     
     def create_appointment(self, user_id, appointment_data):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO appointments 
-            (user_id, car_brand, car_model, car_year, service_type, 
-             appointment_date, appointment_time, additional_info, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            user_id,
-            appointment_data['carBrand'],
-            appointment_data['carModel'],
-            appointment_data['carYear'],
-            appointment_data['serviceType'],
-            appointment_data['date'],
-            appointment_data['time'],
-            appointment_data.get('additionalInfo', ''),
-            'pending'
-        ))
-        
-        appointment_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        """Запись на обслуживание с занятием слотов расписания
         
+        Слоты занимаются условным UPSERT в транзакции BEGIN IMMEDIATE:
+        счетчик растет, только пока он меньше числа постов, поэтому
+        одновременные запросы не запишут больше машин, чем помещается.
+        Если хотя бы один слот занят, транзакция откатывается с BookingError.
+        Дата дальше horizon_days расписания - тоже BookingError: таких
+        слотов нет и в get_available_slots.
+        """
+        service = self.schedule.service(appointment_data['serviceType'])
+        day = parse_date(appointment_data['date'])
+        time_ = appointment_data['time']
+        slots = self.schedule.booking_slots(service, day, time_)
+        now = datetime.now()
+        if f'{day.isoformat()} {time_}' <= now.strftime('%Y-%m-%d %H:%M'):
+            raise ValueError('Нельзя записаться на прошедшее время')
+        if day > now.date() + timedelta(days=self.schedule.horizon_days):
+            raise BookingError(f'Запись открыта не более чем на {self.schedule.horizon_days} дней вперед')
+
+        with self.transaction('IMMEDIATE') as conn:
+            for slot_time in slots:
+                cursor = conn.execute('''
+                    INSERT INTO appointment_slots (service_type, slot_date, slot_time, booked)
+                    VALUES (?, ?, ?, 1)
+                    ON CONFLICT (service_type, slot_date, slot_time)
+                    DO UPDATE SET booked = booked + 1 WHERE booked < ?
+                ''', (service.code, day.isoformat(), slot_time, service.bays))
+                if cursor.rowcount == 0:
+                    raise BookingError(f'Время {time_} на {day.isoformat()} уже занято, выберите другое')
+
+            cursor = conn.execute('''
+                INSERT INTO appointments
+                (user_id, car_brand, car_model, car_year, service_type,
+                 appointment_date, appointment_time, additional_info, status, duration_slots)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                user_id,
+                appointment_data['carBrand'],
+                appointment_data['carModel'],
+                appointment_data['carYear'],
+                service.code,
+                day.isoformat(),
+                time_,
+                appointment_data.get('additionalInfo', ''),
+                'pending',
+                len(slots)
+            ))
+            appointment_id = cursor.lastrowid
+
         return appointment_id
     
-    def get_user_appointments(self, user_id):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM appointments 
-            WHERE user_id = ? 
-            ORDER BY appointment_date DESC, appointment_time DESC
-        ''', (user_id,))
-        appointments = cursor.fetchall()
-        conn.close()
+    def get_available_slots(self, service_type, date_from, date_to):
+        """Свободное время для услуги по дням: [{date, slots: [{time, free}]}]
         
+        free - сколько машин еще можно записать на это время. Занятость
+        читается из appointment_slots одним диапазоном по первичному ключу.
+        """
+        service = self.schedule.service(service_type)
+        start = parse_date(date_from)
+        end = parse_date(date_to)
+        now = datetime.now()
+        self.schedule.check_range(start, end, now.date())
+
+        with self.connection() as conn:
+            rows = conn.execute('''
+                SELECT slot_date, slot_time, booked FROM appointment_slots
+                WHERE service_type = ? AND slot_date BETWEEN ? AND ?
+            ''', (service.code, start.isoformat(), end.isoformat())).fetchall()
+        booked = {(r[0], r[1]): r[2] for r in rows}
+
         result = []
-        for a in appointments:
-            result.append({
-                'id': a[0],
-                'user_id': a[1],
-                'car_brand': a[2],
-                'car_model': a[3],
-                'car_year': a[4],
-                'service_type': a[5],
-                'appointment_date': a[6],
-                'appointment_time': a[7],
-                'additional_info': a[8],
-                'status': a[9],
-                'created_at': a[10]
-            })
+        day = max(start, now.date())
+        while day <= end:
+            date = day.isoformat()
+            free_slots = []
+            for time_, occupied in self.schedule.start_times(service, day).items():
+                if day == now.date() and time_ <= now.strftime('%H:%M'):
+                    continue
+                free = min(service.bays - booked.get((date, t), 0) for t in occupied)
+                if free > 0:
+                    free_slots.append({'time': time_, 'free': free})
+            result.append({'date': date, 'slots': free_slots})
+            day += timedelta(days=1)
         return result
     
+    def _appointment_slot_times(self, service_type, date, time_, duration):
+        """Слоты, занятые записью (для записей вне сетки - только ее время)"""
+        service = self.schedule.services.get(service_type)
+        if service:
+            try:
+                slots = self.schedule.day_slots(service, parse_date(date))
+            except ValueError:
+                slots = []
+            if time_ in slots:
+                index = slots.index(time_)
+                return slots[index:index + duration]
+        return [time_]
+    
+    def rebuild_appointment_slots(self):
+        """Пересчет appointment_slots по записям со статусом pending"""
+        with self.transaction('IMMEDIATE') as conn:
+            rows = conn.execute('''
+                SELECT service_type, appointment_date, appointment_time, duration_slots
+                FROM appointments WHERE status = 'pending'
+            ''').fetchall()
+            counts = Counter()
+            for service_type, date, time_, duration in rows:
+                for slot_time in self._appointment_slot_times(service_type, date, time_, duration):
+                    counts[(service_type, date, slot_time)] += 1
+            conn.execute('DELETE FROM appointment_slots')
+            conn.executemany('''
+                INSERT INTO appointment_slots (service_type, slot_date, slot_time, booked)
+                VALUES (?, ?, ?, ?)
+            ''', [(*key, count) for key, count in counts.items()])
+        return len(rows)
+
+    def get_user_appointments(self, user_id):
+        with self.connection() as conn:
+            return self._read_user_appointments(conn, user_id)
+    
+    def _read_user_appointments(self, conn, user_id):
+        appointments = conn.execute(f'''
+            SELECT {Appointment.sql_columns()} FROM appointments
+            WHERE user_id = ?
+            ORDER BY appointment_date DESC, appointment_time DESC
+        ''', (user_id,)).fetchall()
+        return [Appointment.from_row(a) for a in appointments]
+    
     def cancel_appointment(self, appointment_id, user_id):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            DELETE FROM appointments 
-            WHERE id = ? AND user_id = ? AND status = 'pending'
-        ''', (appointment_id, user_id))
-        affected = cursor.rowcount
-        conn.commit()
-        conn.close()
-        return affected > 0
+        with self.transaction('IMMEDIATE') as conn:
+            row = conn.execute('''
+                DELETE FROM appointments
+                WHERE id = ? AND user_id = ? AND status = 'pending'
+                RETURNING service_type, appointment_date, appointment_time, duration_slots
+            ''', (appointment_id, user_id)).fetchone()
+            if row:
+                # Освобождаем слоты записи
+                conn.executemany('''
+                    UPDATE appointment_slots SET booked = booked - 1
+                    WHERE service_type = ? AND slot_date = ? AND slot_time = ? AND booked > 0
+                ''', [(row[0], row[1], t) for t in self._appointment_slot_times(*row)])
+        return row is not None
     
     # ========== РАБОТА С АВТОМОБИЛЯМИ ПОЛЬЗОВАТЕЛЯ ==========
     
     def add_user_car(self, user_id, car_data):
         """Добавление автомобиля пользователя"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO user_cars (user_id, brand, model, year, vin, license_plate)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (
-            user_id,
-            car_data.get('brand'),
-            car_data.get('model'),
-            car_data.get('year'),
-            car_data.get('vin'),
-            car_data.get('license_plate')
-        ))
-        
-        car_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        with self.transaction() as conn:
+            cursor = conn.execute('''
+                INSERT INTO user_cars (user_id, brand, model, year, vin, license_plate)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (
+                user_id,
+                car_data.get('brand'),
+                car_data.get('model'),
+                car_data.get('year'),
+                car_data.get('vin'),
+                car_data.get('license_plate')
+            ))
+            car_id = cursor.lastrowid
         return car_id
-    
+
     def get_user_cars(self, user_id):
         """Получение всех автомобилей пользователя"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT * FROM user_cars 
-            WHERE user_id = ? 
+        with self.connection() as conn:
+            return self._read_user_cars(conn, user_id)
+    
+    def _read_user_cars(self, conn, user_id):
+        cars = conn.execute(f'''
+            SELECT {Car.sql_columns()} FROM user_cars
+            WHERE user_id = ?
             ORDER BY created_at DESC
-        ''', (user_id,))
-        
-        cars = cursor.fetchall()
-        conn.close()
-        
-        return [{
-            'id': car[0],
-            'user_id': car[1],
-            'brand': car[2],
-            'model': car[3],
-            'year': car[4],
-            'vin': car[5],
-            'license_plate': car[6],
-            'created_at': car[7]
-        } for car in cars]
+        ''', (user_id,)).fetchall()
+        return [Car.from_row(car) for car in cars]
     
     def delete_user_car(self, car_id, user_id):
         """Удаление автомобиля пользователя"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.transaction() as conn:
+            cursor = conn.execute('''
+                DELETE FROM user_cars
+                WHERE id = ? AND user_id = ?
+            ''', (car_id, user_id))
+            affected = cursor.rowcount
+        return affected > 0
+    
+    # ========== ЛИЧНЫЙ КАБИНЕТ ==========
+    
+    def get_user_dashboard(self, user_id, sections=None):
+        """Данные личного кабинета одним снимком
         
-        cursor.execute('''
-            DELETE FROM user_cars 
-            WHERE id = ? AND user_id = ?
-        ''', (car_id, user_id))
+        Все выборки идут на одном соединении внутри одной транзакции чтения,
+        поэтому разделы согласованы между собой. sections - подмножество
+        DASHBOARD_SECTIONS (None - все разделы).
+        """
+        if sections is None:
+            sections = DASHBOARD_SECTIONS
+        unknown = set(sections) - set(DASHBOARD_SECTIONS)
+        if unknown:
+            raise ValueError(f'Неизвестные разделы: {", ".join(sorted(unknown))}')
+
+        readers = {
+            'orders': self._read_user_orders,
+            'appointments': self._read_user_appointments,
+            'cars': self._read_user_cars,
+            'unread': self._count_unread,
+            'summary': self._read_user_summary,
+        }
+        with self.transaction() as conn:
+            return {name: readers[name](conn, user_id) for name in DASHBOARD_SECTIONS if name in sections}
+    
+    def _read_user_summary(self, conn, user_id):
+        row = conn.execute('''
+            SELECT
+                (SELECT COUNT(*) FROM orders WHERE user_id = :user_id),
+                (SELECT COALESCE(SUM(total_price), 0) FROM orders WHERE user_id = :user_id),
+                (SELECT COUNT(*) FROM appointments WHERE user_id = :user_id),
+                (SELECT COUNT(*) FROM appointments
+                 WHERE user_id = :user_id AND status = 'pending' AND appointment_date >= :today),
+                (SELECT COUNT(*) FROM user_cars WHERE user_id = :user_id)
+        ''', {'user_id': user_id, 'today': datetime.now().strftime('%Y-%m-%d')}).fetchone()
+        return {
+            'orders_count': row[0],
+            'total_spent': row[1],
+            'appointments_count': row[2],
+            'upcoming_appointments': row[3],
+            'cars_count': row[4]
+        }
+    
+    # ========== СТАТИСТИКА ==========
+    
+    def get_counters(self):
+        """Счетчики из stats_counters: {'users': ..., 'orders': ..., ...}
         
-        affected = cursor.rowcount
-        conn.commit()
-        conn.close()
-        return affected > 0
+        Их ведут триггеры (migrations.STATS_COUNTERS), поэтому чтение -
+        несколько строк по первичному ключу при любом размере таблиц. Снимок
+        живет в памяти counters_ttl секунд; одновременное обновление
+        из нескольких потоков безопасно - выигрывает последний.
+        """
+        expires, counters = self._counters
+        now = time.monotonic()
+        if counters is None or now >= expires:
+            with self.connection() as conn:
+                counters = dict(conn.execute('SELECT name, value FROM stats_counters').fetchall())
+            self._counters = (now + self.counters_ttl, counters)
+        return counters
+    
+    # ========== ОТЧЕТЫ ==========
+    
+    def refresh_rollups(self, batch_size=10000):
+        """Добавить к дневным агрегатам заказы и записи новее отметки
+        
+        Обрабатываются только строки с id больше rollup_watermarks.last_id,
+        пачками по batch_size; пачка и сдвиг отметки - одна транзакция,
+        поэтому прерванное обновление продолжается с места остановки.
+        Возвращает {источник: обработано строк}.
+        """
+        processed = {}
+        for source, queries in ROLLUP_QUERIES.items():
+            processed[source] = 0
+            while True:
+                with self.transaction('IMMEDIATE') as conn:
+                    last_id = conn.execute('SELECT last_id FROM rollup_watermarks WHERE name = ?',
+                                           (source,)).fetchone()[0]
+                    upper, count = conn.execute(f'''
+                        SELECT MAX(id), COUNT(*) FROM (
+                            SELECT id FROM {source} WHERE id > ? ORDER BY id LIMIT ?
+                        )
+                    ''', (last_id, batch_size)).fetchone()
+                    if not count:
+                        break
+                    for sql in queries:
+                        conn.execute(sql.format(schema='main'), (last_id, upper))
+                    conn.execute('''
+                        UPDATE rollup_watermarks SET last_id = ?, updated_at = CURRENT_TIMESTAMP
+                        WHERE name = ?
+                    ''', (upper, source))
+                processed[source] += count
+        return processed
+    
+    def rebuild_rollups(self, batch_size=10000):
+        """Пересчитать агрегаты с нуля (после загрузки старых данных)
+        
+        Заказы из файлов архива (archive_history) учитываются тоже: в архив
+        попадают только заказы, уже вошедшие в агрегаты.
+        """
+        with self.transaction('IMMEDIATE') as conn:
+            for table in ROLLUP_TABLES:
+                conn.execute(f'DELETE FROM {table}')
+            conn.execute('UPDATE rollup_watermarks SET last_id = 0, updated_at = NULL')
+        processed = self.refresh_rollups(batch_size)
+        for month in self.archive.months():
+            with self.connection() as conn, self.archive.attached(conn, month), \
+                    self.transaction('IMMEDIATE', conn):
+                upper, count = conn.execute('SELECT MAX(id), COUNT(*) FROM archive.orders').fetchone()
+                if count:
+                    for sql in ROLLUP_QUERIES['orders']:
+                        conn.execute(sql.format(schema='archive'), (0, upper))
+            processed['orders'] += count
+        return processed
+    
+    def get_rollup_watermarks(self):
+        """{источник: {'last_id', 'updated_at'}} - до какой строки обновлены агрегаты"""
+        with self.connection() as conn:
+            rows = conn.execute('SELECT name, last_id, updated_at FROM rollup_watermarks').fetchall()
+        return {name: {'last_id': last_id, 'updated_at': updated_at} for name, last_id, updated_at in rows}
+    
+    def get_sales_report(self, date_from, date_to):
+        """Заказы и выручка по дням периода (даты 'YYYY-MM-DD' включительно)"""
+        with self.connection() as conn:
+            rows = conn.execute('''
+                SELECT day, orders, revenue FROM daily_sales
+                WHERE day BETWEEN ? AND ?
+                ORDER BY day
+            ''', (date_from, date_to)).fetchall()
+        return [{'date': day, 'orders': orders, 'revenue': revenue} for day, orders, revenue in rows]
+    
+    def get_part_sales_report(self, date_from, date_to, limit=20):
+        """Самые продаваемые запчасти периода по числу проданных штук
+        
+        Полные месяцы периода берутся из monthly_part_sales, остальные
+        дни - из daily_part_sales.
+        """
+        months, day_ranges = split_months(date_from, date_to)
+        sources, params = [], []
+        if months:
+            sources.append('SELECT part_id, units, revenue FROM monthly_part_sales WHERE month BETWEEN ? AND ?')
+            params.extend(months)
+        for day_range in day_ranges:
+            sources.append('SELECT part_id, units, revenue FROM daily_part_sales WHERE day BETWEEN ? AND ?')
+            params.extend(day_range)
+        with self.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT s.part_id, p.name, p.category, s.units, s.revenue
+                FROM (
+                    SELECT part_id, SUM(units) AS units, SUM(revenue) AS revenue
+                    FROM ({' UNION ALL '.join(sources)})
+                    GROUP BY part_id
+                    ORDER BY units DESC, revenue DESC
+                    LIMIT ?
+                ) s
+                LEFT JOIN parts p ON p.id = s.part_id
+                ORDER BY s.units DESC, s.revenue DESC
+            ''', params + [limit]).fetchall()
+        return [{'part_id': part_id, 'name': name, 'category': category, 'units': units, 'revenue': revenue}
+                for part_id, name, category, units, revenue in rows]
+    
+    def get_category_sales_report(self, date_from, date_to):
+        """Продажи периода по категориям, по убыванию выручки"""
+        with self.connection() as conn:
+            rows = conn.execute('''
+                SELECT category, SUM(units), SUM(revenue) FROM daily_category_sales
+                WHERE day BETWEEN ? AND ?
+                GROUP BY category
+                ORDER BY 3 DESC
+            ''', (date_from, date_to)).fetchall()
+        return [{'category': category, 'units': units, 'revenue': revenue} for category, units, revenue in rows]
+    
+    def get_appointments_report(self, date_from, date_to):
+        """Записи по дням обслуживания и услугам: [{date, services: {услуга: число}, total}]"""
+        with self.connection() as conn:
+            rows = conn.execute('''
+                SELECT day, service_type, appointments FROM daily_appointments
+                WHERE day BETWEEN ? AND ?
+                ORDER BY day, service_type
+            ''', (date_from, date_to)).fetchall()
+        days = {}
+        for day, service_type, count in rows:
+            entry = days.setdefault(day, {'date': day, 'services': {}, 'total': 0})
+            entry['services'][service_type] = count
+            entry['total'] += count
+        return list(days.values())
     
     # ========== РАБОТА С ЧАТОМ ==========
 
     def save_chat_message(self, user_id, user_name, message, is_support=False):
-        """Сохранение сообщения чата"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        """Сохранение сообщения чата (и рассылка его подписчикам чата); id сообщения"""
+        return self.submit_chat_message(user_id, user_name, message, is_support).result()
+
+    def submit_chat_message(self, user_id, user_name, message, is_support=False):
+        """Future с id сообщения
         
-        cursor.execute('''
-            INSERT INTO chat_messages (user_id, user_name, message, is_support)
-            VALUES (?, ?, ?, ?)
-        ''', (user_id, user_name, message, is_support))
+        С очередью записи (start_chat_writer) сообщение записывается вместе
+        с другими одной транзакцией; без нее - сразу, Future уже выполнен.
+        """
+        item = (user_id, user_name, message, is_support)
+        if self.chat_writer is not None:
+            return self.chat_writer.submit(item)
+        future = Future()
+        future.set_result(self.write_chat_messages([item])[0])
+        return future
+
+    def write_chat_messages(self, messages):
+        """Вставка сообщений [(user_id, user_name, message, is_support)] одной транзакцией
         
-        message_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return message_id
-
-    def get_chat_history(self, user_id, limit=50):
-        """Получение истории чата пользователя"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT * FROM chat_messages 
-            WHERE user_id = ? 
-            ORDER BY created_at ASC
-            LIMIT ?
-        ''', (user_id, limit))
+        Строки вставляются одним executemany: внутри транзакции у вставок
+        подряд идущие id, поэтому сохраненные строки читаются обратно одним
+        диапазоном. В той же транзакции обновляется сводка chat_conversations.
+        После коммита сообщения рассылаются подписчикам чата, а число
+        непрочитанных - один раз на пользователя с ответами поддержки.
+        Возвращает id в порядке messages.
+        """
+        with self.transaction() as conn:
+            conn.executemany('''
+                INSERT INTO chat_messages (user_id, user_name, message, is_support)
+                VALUES (?, ?, ?, ?)
+            ''', messages)
+            last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+            rows = conn.execute(f'''
+                SELECT {CHAT_COLUMNS} FROM chat_messages
+                WHERE id BETWEEN ? AND ?
+                ORDER BY id
+            ''', (last_id - len(messages) + 1, last_id)).fetchall()
+            saved = [ChatMessage.from_row(row) for row in rows]
+            self._update_conversations(conn, saved)
+            unread = {message.user_id: self._count_unread(conn, message.user_id)
+                      for message in saved if message.is_support and message.user_id is not None}
         
-        messages = cursor.fetchall()
-        conn.close()
+        for message in saved:
+            if message.user_id is not None:
+                self.chat_hub.publish(message.user_id, 'message', message.to_dict(), event_id=message.id)
+        for user_id, count in unread.items():
+            self.chat_hub.publish(user_id, 'unread', {'count': count})
+        return [message.id for message in saved]
+
+    def _update_conversations(self, conn, messages):
+        """Последнее сообщение и счетчики непрочитанных в chat_conversations
+
+        Сообщения гостей (user_id NULL) в сводку не попадают: ответить
+        гостю оператору некуда.
+        """
+        summary = {}
+        for message in messages:
+            if message.user_id is None:
+                continue
+            _, from_user, from_support = summary.get(message.user_id, (0, 0, 0))
+            summary[message.user_id] = (message.id, from_user + (not message.is_support),
+                                        from_support + message.is_support)
+        conn.executemany('''
+            INSERT INTO chat_conversations (user_id, last_message_id, unread_by_operator, unread_by_user)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET
+                last_message_id = MAX(last_message_id, excluded.last_message_id),
+                unread_by_operator = unread_by_operator + excluded.unread_by_operator,
+                unread_by_user = unread_by_user + excluded.unread_by_user
+        ''', [(user_id, *values) for user_id, values in summary.items()])
+
+    def rebuild_chat_conversations(self):
+        """Пересчет chat_conversations по всем сообщениям (после миграции); число разговоров"""
+        with self.transaction('IMMEDIATE') as conn:
+            conn.execute('DELETE FROM chat_conversations')
+            cursor = conn.execute('''
+                INSERT INTO chat_conversations (user_id, last_message_id, unread_by_operator, unread_by_user)
+                SELECT user_id, MAX(id), SUM(is_support = 0 AND is_read = 0), SUM(is_support = 1 AND is_read = 0)
+                FROM chat_messages
+                WHERE user_id IS NOT NULL
+                GROUP BY user_id
+            ''')
+            return cursor.rowcount
+
+    def get_chat_history(self, user_id, limit=50, before_id=None):
+        """Последние limit сообщений пользователя по возрастанию id
         
-        return [{
-            'id': m[0],
-            'user_id': m[1],
-            'user_name': m[2],
-            'message': m[3],
-            'is_support': bool(m[4]),
-            'is_read': bool(m[5]),
-            'created_at': m[6]
-        } for m in messages]
+        С before_id - сообщения старше него (прокрутка истории назад).
+        Только при прокрутке, когда в основной базе сообщения кончаются,
+        страница дочитывается из файлов архива: в архив уходят самые старые
+        сообщения, поэтому их id меньше, чем у оставшихся в основной базе.
+        Есть ли архив до первой страницы, говорит has_archived_chat.
+        """
+        with self.connection() as conn:
+            messages = self._read_chat_page(conn, user_id, limit, before_id)
+            months = []
+            if len(messages) < limit and before_id is not None:
+                before_id = messages[-1][0] if messages else before_id
+                months = self._archive_months(conn, 'chat_messages', user_id, before_id)
+        for month in months:
+            with self.archive.reader(month) as archive_conn:
+                messages += self._read_chat_page(archive_conn, user_id, limit - len(messages), before_id)
+            if len(messages) == limit:
+                break
+            before_id = messages[-1][0] if messages else before_id
+        return [ChatMessage.from_row(m) for m in reversed(messages)]
+
+    def has_archived_chat(self, user_id, before_id=None):
+        """Есть ли в архиве сообщения пользователя (с id меньше before_id)"""
+        with self.connection() as conn:
+            return bool(self._archive_months(conn, 'chat_messages', user_id, before_id))
+
+    def _read_chat_page(self, conn, user_id, limit, before_id):
+        """Строки сообщений по убыванию id"""
+        where = 'user_id = ?'
+        params = [user_id]
+        if before_id is not None:
+            where += ' AND id < ?'
+            params.append(before_id)
+        params.append(limit)
+        return conn.execute(f'''
+            SELECT {CHAT_COLUMNS} FROM chat_messages
+            WHERE {where}
+            ORDER BY id DESC
+            LIMIT ?
+        ''', params).fetchall()
+
+    def get_chat_messages_after(self, user_id, after_id, limit=100):
+        """Сообщения пользователя с id больше after_id, по возрастанию id"""
+        with self.connection() as conn:
+            messages = conn.execute(f'''
+                SELECT {CHAT_COLUMNS} FROM chat_messages
+                WHERE user_id = ? AND id > ?
+                ORDER BY id
+                LIMIT ?
+            ''', (user_id, after_id, limit)).fetchall()
+        return [ChatMessage.from_row(m) for m in messages]
+
+    def get_last_chat_message_id(self, user_id):
+        """id последнего сообщения пользователя (0, если сообщений нет)"""
+        with self.connection() as conn:
+            row = conn.execute(
+                'SELECT MAX(id) FROM chat_messages WHERE user_id = ?', (user_id,)
+            ).fetchone()
+        return row[0] or 0
 
     def get_unread_messages(self, user_id):
         """Получение непрочитанных сообщений"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT COUNT(*) FROM chat_messages 
-            WHERE user_id = ? AND is_support = 1 AND is_read = 0
-        ''', (user_id,))
-        
-        count = cursor.fetchone()[0]
-        conn.close()
-        return count
+        with self.connection() as conn:
+            return self._count_unread(conn, user_id)
+
+    def _count_unread(self, conn, user_id):
+        # Счетчик из сводки - чтение по первичному ключу вместо COUNT по сообщениям
+        row = conn.execute(
+            'SELECT unread_by_user FROM chat_conversations WHERE user_id = ?', (user_id,)
+        ).fetchone()
+        return row[0] if row else 0
 
     def mark_messages_as_read(self, user_id):
         """Отметить сообщения как прочитанные"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.transaction() as conn:
+            cursor = conn.execute('''
+                UPDATE chat_messages
+                SET is_read = 1
+                WHERE user_id = ? AND is_support = 1 AND is_read = 0
+            ''', (user_id,))
+            affected = cursor.rowcount
+            if affected:
+                conn.execute('''
+                    UPDATE chat_conversations SET unread_by_user = unread_by_user - ?
+                    WHERE user_id = ?
+                ''', (affected, user_id))
+        if affected:
+            self.chat_hub.publish(user_id, 'unread', {'count': 0})
+        return affected
+
+    # ========== ВХОДЯЩИЕ ОПЕРАТОРА ==========
+
+    def get_conversations(self, unread_only=False, limit=50, cursor=None):
+        """Страница разговоров, новые сверху: {'conversations', 'next_cursor'}
+
+        unread_only - только с непрочитанными сообщениями клиента. Курсор -
+        id последнего сообщения последнего разговора на странице.
+        """
+        where = ['c.unread_by_operator > 0'] if unread_only else []
+        params = []
+        if cursor:
+            values = decode_cursor(cursor, 1)
+            if not isinstance(values[0], int):
+                raise ValueError('Некорректный курсор')
+            where.append('c.last_message_id < ?')
+            params.extend(values)
+        where_sql = ' WHERE ' + ' AND '.join(where) if where else ''
+
+        with self.connection() as conn:
+            rows = conn.execute(f'''
+                {CONVERSATION_SELECT}{where_sql}
+                ORDER BY c.last_message_id DESC
+                LIMIT ?
+            ''', params + [limit + 1]).fetchall()
+        conversations = [Conversation.from_row(row) for row in rows[:limit]]
+        next_cursor = encode_cursor([conversations[-1].last_message_id]) if len(rows) > limit else None
+        return {'conversations': conversations, 'next_cursor': next_cursor}
+
+    def get_conversation(self, user_id):
+        """Разговор с клиентом или None, если клиент не писал в чат"""
+        with self.connection() as conn:
+            row = conn.execute(f'{CONVERSATION_SELECT} WHERE c.user_id = ?', (user_id,)).fetchone()
+        return Conversation.from_row(row) if row else None
+
+    def mark_conversation_read(self, user_id, up_to_id=None):
+        """Отметить сообщения клиента прочитанными оператором
         
-        cursor.execute('''
-            UPDATE chat_messages 
-            SET is_read = 1 
-            WHERE user_id = ? AND is_support = 1 AND is_read = 0
-        ''', (user_id,))
+        up_to_id - id последнего сообщения, которое оператор видел: пришедшие
+        позже остаются непрочитанными. Возвращает число отмеченных.
+        """
+        where = 'user_id = ? AND is_support = 0 AND is_read = 0'
+        params = [user_id]
+        if up_to_id is not None:
+            where += ' AND id <= ?'
+            params.append(up_to_id)
+        with self.transaction() as conn:
+            affected = conn.execute(f'UPDATE chat_messages SET is_read = 1 WHERE {where}', params).rowcount
+            if affected:
+                conn.execute('''
+                    UPDATE chat_conversations SET unread_by_operator = unread_by_operator - ?
+                    WHERE user_id = ?
+                ''', (affected, user_id))
+        return affected
+
+    # ========== АРХИВ ==========
+
+    def archive_history(self, older_than_days, order_statuses=ARCHIVE_ORDER_STATUSES,
+                        batch_size=ARCHIVE_BATCH_SIZE, vacuum_pages=ARCHIVE_VACUUM_PAGES):
+        """Перенести в помесячные архивы (archive.py) старые сообщения и закрытые заказы
         
-        affected = cursor.rowcount
-        conn.commit()
-        conn.close()
-        return affected
\ No newline at end of file
+        Переносятся сообщения чата и заказы со статусом из order_statuses,
+        созданные раньше older_than_days дней назад. Последнее сообщение
+        разговора остается в основной базе (превью во входящих оператора),
+        заказ - только уже учтенный в агрегатах отчетов (перед переносом
+        они обновляются). Работа идет пачками по batch_size строк; после
+        каждой пачки освободившиеся страницы понемногу возвращаются
+        файловой системе (incremental_vacuum, не больше vacuum_pages за шаг),
+        без долгой блокировки базы полным VACUUM.
+        Возвращает {'chat_messages': ..., 'orders': ..., 'freed_pages': ...}.
+        """
+        batch_size = min(batch_size, IDS_CHUNK_SIZE)
+        self.refresh_rollups()
+        with self.connection() as conn:
+            # created_at пишется как CURRENT_TIMESTAMP (UTC) - границу считаем так же
+            cutoff = conn.execute("SELECT datetime('now', ?)", (f'-{int(older_than_days)} days',)).fetchone()[0]
+            rolled_up = conn.execute("SELECT last_id FROM rollup_watermarks WHERE name = 'orders'").fetchone()[0]
+        statuses = list(order_statuses)
+        candidates = {
+            'chat_messages': ('''
+                SELECT m.id, strftime('%Y-%m', m.created_at) FROM chat_messages m
+                LEFT JOIN chat_conversations c ON c.user_id = m.user_id
+                WHERE m.id > ? AND m.created_at < ? AND m.id IS NOT c.last_message_id
+                ORDER BY m.id
+                LIMIT ?
+            ''', lambda after: [after, cutoff, batch_size]),
+            'orders': (f'''
+                SELECT id, strftime('%Y-%m', created_at) FROM orders
+                WHERE id > ? AND id <= ? AND created_at < ? AND status IN ({', '.join('?' * len(statuses))})
+                ORDER BY id
+                LIMIT ?
+            ''', lambda after: [after, rolled_up, cutoff, *statuses, batch_size]),
+        }
+        result = {'chat_messages': 0, 'orders': 0, 'freed_pages': 0}
+        for table, (sql, params) in candidates.items():
+            if table == 'orders' and not statuses:
+                continue
+            after = 0
+            while True:
+                with self.connection() as conn:
+                    rows = conn.execute(sql, params(after)).fetchall()
+                if not rows:
+                    break
+                after = rows[-1][0]
+                by_month = {}
+                for row_id, month in rows:
+                    by_month.setdefault(month, []).append(row_id)
+                for month, ids in sorted(by_month.items()):
+                    result[table] += self._archive_rows(table, month, ids)
+                result['freed_pages'] += self.incremental_vacuum(vacuum_pages)
+        return result
+
+    def _archive_rows(self, table, month, ids):
+        """Перенести строки table (chat_messages или orders) с id из ids в архив месяца
+        
+        Сначала копия фиксируется в файле архива, затем отдельной
+        транзакцией строки удаляются из основной базы. При сбое между ними
+        строки останутся в обеих базах, и повторный запуск перезапишет
+        копию (INSERT OR REPLACE), но ничего не потеряется.
+        """
+        marks = ', '.join('?' * len(ids))
+        copies = [(table, 'id')] + ([('order_items', 'order_id')] if table == 'orders' else [])
+        with self.connection() as conn, self.archive.attached(conn, month):
+            with self.transaction(conn=conn):
+                for name, key in copies:
+                    conn.execute(f'''
+                        INSERT OR REPLACE INTO archive.{name} ({ARCHIVE_COLUMNS[name]})
+                        SELECT {ARCHIVE_COLUMNS[name]} FROM main.{name} WHERE {key} IN ({marks})
+                    ''', ids)
+
+            with self.transaction('IMMEDIATE', conn):
+                if table == 'chat_messages':
+                    per_user = conn.execute(f'''
+                        SELECT user_id, MIN(id), MAX(id), COUNT(*),
+                               SUM(is_support = 0 AND is_read = 0), SUM(is_support = 1 AND is_read = 0)
+                        FROM main.chat_messages WHERE id IN ({marks}) AND user_id IS NOT NULL
+                        GROUP BY user_id
+                    ''', ids).fetchall()
+                    # Непрочитанные уходят в архив вместе со своими сообщениями
+                    conn.executemany('''
+                        UPDATE chat_conversations SET unread_by_operator = unread_by_operator - ?,
+                                                      unread_by_user = unread_by_user - ?
+                        WHERE user_id = ?
+                    ''', [(by_operator, by_user, user_id) for user_id, _, _, _, by_operator, by_user in per_user])
+                else:
+                    per_user = conn.execute(f'''
+                        SELECT user_id, MIN(id), MAX(id), COUNT(*) FROM main.orders
+                        WHERE id IN ({marks}) AND user_id IS NOT NULL
+                        GROUP BY user_id
+                    ''', ids).fetchall()
+                    conn.execute(f'DELETE FROM main.order_items WHERE order_id IN ({marks})', ids)
+                moved = conn.execute(f'DELETE FROM main.{table} WHERE id IN ({marks})', ids).rowcount
+                if table == 'orders':
+                    # Триггер orders_counter_delete вычел заказы; в /api/stats архивные остаются
+                    conn.execute("UPDATE stats_counters SET value = value + ? WHERE name = 'orders'", (moved,))
+                conn.executemany('''
+                    INSERT INTO archive_index (kind, user_id, month, first_id, last_id, row_count)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (kind, user_id, month) DO UPDATE SET
+                        first_id = MIN(first_id, excluded.first_id),
+                        last_id = MAX(last_id, excluded.last_id),
+                        row_count = row_count + excluded.row_count
+                ''', [(table, user_id, month, first_id, last_id, count)
+                      for user_id, first_id, last_id, count, *_ in per_user])
+        return moved
+
+    def _archive_months(self, conn, kind, user_id, before_id=None):
+        """Месяцы архива с данными пользователя (kind - таблица), от новых к старым"""
+        where = 'kind = ? AND user_id = ?'
+        params = [kind, user_id]
+        if before_id is not None:
+            where += ' AND first_id < ?'
+            params.append(before_id)
+        return [month for month, in conn.execute(
+            f'SELECT month FROM archive_index WHERE {where} ORDER BY month DESC', params)]
+
+    def get_archive_stats(self):
+        """Размеры основной базы и архива: страницы, свободные страницы, файлы архива"""
+        with self.connection() as conn:
+            page_size, pages, free_pages, auto_vacuum = (
+                conn.execute(f'PRAGMA {name}').fetchone()[0]
+                for name in ('page_size', 'page_count', 'freelist_count', 'auto_vacuum'))
+        months = self.archive.months()
+        return {'page_size': page_size, 'pages': pages, 'free_pages': free_pages,
+                'incremental_vacuum': auto_vacuum == 2, 'archive_months': months,
+                'archive_bytes': self.archive.size()}
+
+    def incremental_vacuum(self, pages=ARCHIVE_VACUUM_PAGES):
+        """Вернуть файловой системе до pages свободных страниц; сколько освобождено
+        
+        Работает при auto_vacuum=INCREMENTAL. В режиме WAL файл базы
+        уменьшается при следующей контрольной точке.
+        """
+        with self.connection() as conn:
+            before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if before:
+                # execute выполняет прагму на один шаг (одну страницу), executescript - целиком
+                conn.executescript(f'PRAGMA incremental_vacuum({int(pages)})')
+            return before - conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+    def enable_incremental_vacuum(self):
+        """Перевести существующую базу на auto_vacuum=INCREMENTAL (один полный VACUUM)
+        
+        Новые базы создаются сразу с ним (DEFAULT_PRAGMAS). Возвращает
+        True, если понадобился VACUUM.
+        """
+        with self.connection() as conn:
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+                return False
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+        return True
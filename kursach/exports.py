@@ -0,0 +1,48 @@
+"""Потоковая выгрузка в NDJSON и CSV: записи превращаются в куски текста по мере чтения"""
+import csv
+import io
+import json
+
+# Формат выгрузки -> (MIME-тип, расширение файла)
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+}
+
+# Примерный размер куска ответа: мелкие строки склеиваются, чтобы не
+# отправлять каждую отдельным фрагментом chunked-ответа
+CHUNK_SIZE = 64 * 1024
+
+
+def ndjson_chunks(records, chunk_size=CHUNK_SIZE):
+    """Одна запись - одна строка JSON"""
+    buffer = []
+    size = 0
+    for record in records:
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        buffer.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def csv_chunks(columns, rows, chunk_size=CHUNK_SIZE):
+    """Заголовок columns и строки rows (списки значений в том же порядке)
+
+    В начале - BOM, чтобы Excel открыл кириллицу в UTF-8.
+    """
+    buffer = io.StringIO()
+    buffer.write('\ufeff')
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
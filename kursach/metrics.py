@@ -0,0 +1,396 @@
+"""Метрики процесса в формате Prometheus: время ответов по маршрутам и работа Database
+
+Запросы Flask измеряются в before/after_request; для потоковых ответов
+(SSE, выгрузки) это время до отправки заголовков. У Database обертка над
+публичными методами считает вызовы и их длительность, а курсор
+InstrumentedCursor - SQL-запросы, строки и время внутри SQLite. Запрос
+засчитывается методу Database, который его выполнил.
+
+Счетчики живут в памяти процесса: при нескольких рабочих процессах
+Prometheus опрашивает /metrics каждого из них.
+
+Журнал медленных запросов (логгер kursach.sql, SQL и параметры) включается
+настройкой METRICS_SLOW_QUERY_MS.
+"""
+import bisect
+import functools
+import inspect
+import logging
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+from types import GeneratorType
+
+from flask import Response, current_app, g, request
+
+DEFAULTS = {
+    'METRICS_ENABLED': True,
+    'METRICS_SLOW_QUERY_MS': None,  # порог журнала медленных запросов, мс; None - выключен
+}
+
+# Границы корзин гистограмм, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Методы Database без собственных запросов к данным
+NOT_INSTRUMENTED = {'connection', 'transaction', 'get_connection', 'close',
+                    'pool_stats', 'cache_stats', 'init_database', 'check_schema',
+                    'start_chat_writer', 'submit_chat_message'}
+
+slow_query_log = logging.getLogger('kursach.sql')
+
+# Вызов метода Database, выполняемый сейчас в этом потоке (CallStats)
+_current_call = ContextVar('db_call', default=None)
+
+
+class Histogram:
+    __slots__ = ('counts', 'sum')
+
+    def __init__(self):
+        # counts[i] - наблюдения в (LATENCY_BUCKETS[i-1], LATENCY_BUCKETS[i]], последняя - выше всех
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+
+
+class MethodStats:
+    """Счетчики одного метода Database"""
+    __slots__ = ('name', 'metrics', 'calls', 'queries', 'rows', 'sql_seconds', 'slow')
+
+    def __init__(self, name, metrics):
+        self.name = name
+        self.metrics = metrics
+        self.calls = Histogram()
+        self.queries = 0
+        self.rows = 0
+        self.sql_seconds = 0.0
+        self.slow = 0
+
+
+class CallStats:
+    """Запросы одного вызова метода Database
+
+    Принадлежит одному потоку, поэтому курсор пишет сюда без блокировки;
+    в MethodStats итоги переносятся разом, когда вызов закончился.
+    """
+    __slots__ = ('method', 'queries', 'rows', 'sql_seconds', 'slow')
+
+    def __init__(self, method):
+        self.method = method
+        self.queries = 0
+        self.rows = 0
+        self.sql_seconds = 0.0
+        self.slow = 0
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Курсор, засчитывающий запросы, строки и время вызову из _current_call
+
+    Вне методов Database курсор ничего не считает. Время запроса - execute
+    плюс выборки строк; медленным он признается, когда строки кончились
+    (fetchone в этом коде читает единственную строку - после него тоже).
+    """
+    __slots__ = ('_call', '_sql', '_params', '_elapsed')
+
+    def execute(self, sql, parameters=()):
+        call = self._call = _current_call.get()
+        if call is None:
+            return super().execute(sql, parameters)
+        self._sql, self._params = sql, parameters
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._elapsed = elapsed = time.perf_counter() - started
+            call.queries += 1
+            call.sql_seconds += elapsed
+            if self.description is None:
+                self._finish()
+
+    def executemany(self, sql, seq_of_parameters):
+        call = self._call = _current_call.get()
+        if call is None:
+            return super().executemany(sql, seq_of_parameters)
+        self._sql, self._params = sql, '<пакет>'
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._elapsed = elapsed = time.perf_counter() - started
+            call.queries += 1
+            call.sql_seconds += elapsed
+            self._finish()
+
+    def fetchone(self):
+        call = getattr(self, '_call', None)
+        if call is None:
+            return super().fetchone()
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(call, 0 if row is None else 1, time.perf_counter() - started, True)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        call = getattr(self, '_call', None)
+        if call is None:
+            return super().fetchmany(size)
+        started = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(call, len(rows), time.perf_counter() - started, len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        call = getattr(self, '_call', None)
+        if call is None:
+            return super().fetchall()
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(call, len(rows), time.perf_counter() - started, True)
+        return rows
+
+    def __next__(self):
+        call = getattr(self, '_call', None)
+        if call is None:
+            return super().__next__()
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(call, 0, time.perf_counter() - started, True)
+            raise
+        self._fetched(call, 1, time.perf_counter() - started, False)
+        return row
+
+    def _fetched(self, call, rows, seconds, finished):
+        call.rows += rows
+        call.sql_seconds += seconds
+        self._elapsed += seconds
+        if finished:
+            self._finish()
+
+    def _finish(self):
+        call, self._call = self._call, None
+        threshold = call.method.metrics.slow_query_seconds
+        if threshold is not None and self._elapsed >= threshold:
+            call.slow += 1
+            slow_query_log.warning('Медленный запрос %.1f мс в Database.%s: %s; параметры: %r',
+                                   self._elapsed * 1000, call.method.name,
+                                   ' '.join(self._sql.split()), self._params)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Соединение, чьи курсоры - InstrumentedCursor (фабрика для sqlite3.connect)"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute в C создает курсор в обход cursor() - повторяем его здесь
+    def execute(self, sql, parameters=()):
+        return super().cursor(InstrumentedCursor).execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return super().cursor(InstrumentedCursor).executemany(sql, seq_of_parameters)
+
+
+class Metrics:
+    """Сбор метрик приложения и их выдача на /metrics
+
+    Настройки - METRICS_* в app.config (см. DEFAULTS). База подключается
+    отдельно: instrument(database) оборачивает методы, а соединения
+    должны создаваться с InstrumentedConnection.
+    """
+    connection_factory = InstrumentedConnection
+
+    def __init__(self, app=None):
+        self.slow_query_seconds = None
+        self._lock = threading.Lock()
+        self._requests = {}  # (эндпоинт, HTTP-метод) -> Histogram
+        self._statuses = {}  # (эндпоинт, HTTP-метод, статус) -> число ответов
+        self._methods = {}   # метод Database -> MethodStats
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        for name, value in DEFAULTS.items():
+            app.config.setdefault(name, value)
+        if not app.config['METRICS_ENABLED']:
+            return
+        slow_ms = app.config['METRICS_SLOW_QUERY_MS']
+        self.slow_query_seconds = None if slow_ms is None else slow_ms / 1000
+        app.extensions['metrics'] = self
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+    # ========== ЗАПРОСЫ FLASK ==========
+
+    def _before_request(self):
+        g.metrics_started = time.perf_counter()
+
+    def _after_request(self, response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            self.observe_request(request.endpoint or 'unmatched', request.method,
+                                 response.status_code, time.perf_counter() - started)
+        return response
+
+    def observe_request(self, endpoint, method, status, seconds):
+        with self._lock:
+            histogram = self._requests.get((endpoint, method))
+            if histogram is None:
+                histogram = self._requests[(endpoint, method)] = Histogram()
+            histogram.observe(seconds)
+            key = (endpoint, method, status)
+            self._statuses[key] = self._statuses.get(key, 0) + 1
+
+    # ========== DATABASE ==========
+
+    def instrument(self, database):
+        """Обернуть публичные методы database (на самом объекте, не на классе)"""
+        for name, function in inspect.getmembers(type(database), inspect.isfunction):
+            if name.startswith('_') or name in NOT_INSTRUMENTED:
+                continue
+            stats = self._methods.setdefault(name, MethodStats(name, self))
+            setattr(database, name, self._wrap(getattr(database, name), stats))
+        return database
+
+    def _wrap(self, method, stats):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            call = CallStats(stats)
+            token = _current_call.set(call)
+            started = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            except BaseException:
+                self._observe_call(call, time.perf_counter() - started)
+                raise
+            finally:
+                _current_call.reset(token)
+            if type(result) is GeneratorType:
+                return self._trace_generator(result, call, started)
+            self._observe_call(call, time.perf_counter() - started)
+            return result
+        return wrapper
+
+    def _trace_generator(self, generator, call, started):
+        # Потоковые методы (export_*) выполняют запросы между yield: вызов
+        # выставляется на время каждого шага, длительность - вся выгрузка
+        try:
+            while True:
+                token = _current_call.set(call)
+                try:
+                    item = next(generator)
+                except StopIteration:
+                    return
+                finally:
+                    _current_call.reset(token)
+                yield item
+        finally:
+            generator.close()
+            self._observe_call(call, time.perf_counter() - started)
+
+    def _observe_call(self, call, seconds):
+        stats = call.method
+        bucket = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        with self._lock:
+            stats.calls.counts[bucket] += 1
+            stats.calls.sum += seconds
+            stats.queries += call.queries
+            stats.rows += call.rows
+            stats.sql_seconds += call.sql_seconds
+            stats.slow += call.slow
+
+    # ========== ВЫДАЧА ==========
+
+    def metrics_view(self):
+        return Response(self.render(current_app.extensions.get('database'),
+                                    current_app.extensions.get('compressor')),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    def render(self, database=None, compressor=None):
+        """Все метрики в текстовом формате Prometheus"""
+        with self._lock:
+            requests = {key: (list(h.counts), h.sum) for key, h in self._requests.items()}
+            statuses = dict(self._statuses)
+            methods = [(s.name, list(s.calls.counts), s.calls.sum, s.queries, s.rows, s.sql_seconds, s.slow)
+                       for s in self._methods.values() if sum(s.calls.counts)]
+
+        lines = []
+        add_header(lines, 'http_requests_total', 'counter', 'Ответы по маршрутам и статусам')
+        for (endpoint, method, status), count in sorted(statuses.items()):
+            lines.append(sample('http_requests_total', count,
+                                endpoint=endpoint, method=method, status=status))
+        add_header(lines, 'http_request_duration_seconds', 'histogram', 'Время обработки запроса')
+        for (endpoint, method), (counts, total) in sorted(requests.items()):
+            add_histogram(lines, 'http_request_duration_seconds', counts, total,
+                          endpoint=endpoint, method=method)
+
+        methods.sort()
+        add_header(lines, 'db_method_duration_seconds', 'histogram', 'Время вызова метода Database')
+        for name, counts, total, *_ in methods:
+            add_histogram(lines, 'db_method_duration_seconds', counts, total, method=name)
+        for metric, index, help_text in (
+                ('db_queries_total', 3, 'SQL-запросы метода Database'),
+                ('db_rows_total', 4, 'Строки, полученные методом Database'),
+                ('db_sqlite_seconds_total', 5, 'Время внутри SQLite (execute и выборка строк)'),
+                ('db_slow_queries_total', 6, 'Запросы дольше METRICS_SLOW_QUERY_MS')):
+            add_header(lines, metric, 'counter', help_text)
+            for row in methods:
+                lines.append(sample(metric, row[index], method=row[0]))
+
+        if compressor is not None:
+            # Сжатие ответов (compression.py): байты до и после по эндпоинтам
+            endpoints = sorted(compressor.stats().items(), key=lambda item: str(item[0]))
+            for metric, key, help_text in (
+                    ('http_compressed_responses_total', 'responses', 'Сжатые ответы'),
+                    ('http_compression_bytes_in_total', 'bytes_in', 'Байт ответов до сжатия'),
+                    ('http_compression_bytes_out_total', 'bytes_out', 'Байт ответов после сжатия'),
+                    ('http_compression_saved_bytes_total', 'saved', 'Байт, сэкономленных сжатием')):
+                add_header(lines, metric, 'counter', help_text)
+                for endpoint, stats in endpoints:
+                    lines.append(sample(metric, stats[key], endpoint=endpoint or 'unmatched'))
+
+        sources = []
+        if compressor is not None:
+            sources.append(('compress_cache', compressor.cache.stats(), 'Кэш сжатых ответов'))
+        if database is not None:
+            sources += [('db_pool', database.pool_stats(), 'Пул соединений'),
+                        ('catalog_cache', database.cache_stats(), 'Кэш каталога')]
+            if database.chat_writer is not None:
+                sources.append(('chat_writer', database.chat_writer.stats(), 'Очередь записи чата'))
+        for prefix, stats, help_text in sources:
+            for key, value in sorted(stats.items()):
+                if isinstance(value, (int, float)):
+                    add_header(lines, f'{prefix}_{key}', 'gauge', f'{help_text}: {key}')
+                    lines.append(sample(f'{prefix}_{key}', value))
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def sample(name, value, **labels):
+    if labels:
+        name += '{' + ','.join(f'{key}="{escape_label(label)}"' for key, label in labels.items()) + '}'
+    return f'{name} {value}'
+
+
+def add_header(lines, name, kind, help_text):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {kind}')
+
+
+def add_histogram(lines, name, counts, total, **labels):
+    """Корзины накопительно (le), затем _sum и _count"""
+    cumulative = 0
+    for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), counts):
+        cumulative += count
+        lines.append(sample(f'{name}_bucket', cumulative, **labels, le=bound))
+    lines.append(sample(f'{name}_sum', total, **labels))
+    lines.append(sample(f'{name}_count', cumulative, **labels))
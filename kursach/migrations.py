@@ -0,0 +1,586 @@
+"""Версионные миграции схемы базы данных
+
+Номер последней примененной миграции хранится в PRAGMA user_version.
+Если он равен номеру последней миграции из MIGRATIONS, при запуске не
+выполняется ни одной DDL-команды. Новую миграцию добавляют в конец
+списка со следующим номером; примененные миграции не изменяют.
+
+Перенос данных после миграции (after) записывается в migration_hooks в
+одной транзакции с самой миграцией и вычеркивается, когда завершился.
+Если он упал, следующий migrate() запустит его снова, поэтому after
+должен выдерживать повторный запуск.
+"""
+
+
+class Migration:
+    def __init__(self, version, description, apply, after=None):
+        self.version = version
+        self.description = description
+        self.apply = apply    # apply(cursor) - внутри транзакции миграции
+        self.after = after    # after(db) - после коммита (долгие переносы данных пачками)
+
+
+def _base_tables(cursor):
+    """Исходные таблицы приложения"""
+    # Таблица пользователей
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            phone TEXT UNIQUE NOT NULL,
+            email TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Таблица запчастей
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS parts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            category TEXT NOT NULL,
+            brand TEXT NOT NULL,
+            price INTEGER NOT NULL,
+            description TEXT,
+            image TEXT,
+            in_stock BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Таблица заказов
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            order_data TEXT NOT NULL,
+            total_price INTEGER NOT NULL,
+            status TEXT DEFAULT 'new',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+    # Таблица записей на ТО
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS appointments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            car_brand TEXT NOT NULL,
+            car_model TEXT NOT NULL,
+            car_year INTEGER NOT NULL,
+            service_type TEXT NOT NULL,
+            appointment_date DATE NOT NULL,
+            appointment_time TEXT NOT NULL,
+            additional_info TEXT,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+    # Таблица автомобилей пользователя
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_cars (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            brand TEXT NOT NULL,
+            model TEXT NOT NULL,
+            year INTEGER,
+            vin TEXT,
+            license_plate TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+    ''')
+
+    # Таблица сообщений чата
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            user_name TEXT,
+            message TEXT NOT NULL,
+            is_support BOOLEAN DEFAULT 0,
+            is_read BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+
+def _catalog_indexes(cursor):
+    """Индексы каталога под фильтры и сортировки get_parts_page"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_parts_price ON parts (price)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_parts_name ON parts (name)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_parts_category_price ON parts (category, price)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_parts_category_name ON parts (category, name)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_parts_brand_price ON parts (brand, price)')
+
+
+def _parts_fts(cursor):
+    """Полнотекстовый индекс по каталогу, синхронизируемый триггерами"""
+    # external content: текст хранится только в parts, индекс - в parts_fts.
+    # unicode61 приводит кириллицу к нижнему регистру, prefix ускоряет
+    # поиск по первым буквам при наборе
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS parts_fts USING fts5(
+            name, description, category, brand,
+            content='parts', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3 4'
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS parts_fts_ai AFTER INSERT ON parts BEGIN
+            INSERT INTO parts_fts (rowid, name, description, category, brand)
+            VALUES (new.id, new.name, new.description, new.category, new.brand);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS parts_fts_ad AFTER DELETE ON parts BEGIN
+            INSERT INTO parts_fts (parts_fts, rowid, name, description, category, brand)
+            VALUES ('delete', old.id, old.name, old.description, old.category, old.brand);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS parts_fts_au AFTER UPDATE OF name, description, category, brand ON parts BEGIN
+            INSERT INTO parts_fts (parts_fts, rowid, name, description, category, brand)
+            VALUES ('delete', old.id, old.name, old.description, old.category, old.brand);
+            INSERT INTO parts_fts (rowid, name, description, category, brand)
+            VALUES (new.id, new.name, new.description, new.category, new.brand);
+        END
+    ''')
+
+    # Индекс создается для уже заполненной таблицы - строим его целиком
+    cursor.execute("INSERT INTO parts_fts (parts_fts) VALUES ('rebuild')")
+
+
+def _catalog_version(cursor):
+    """Счетчик версии каталога для кэша и ETag"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0)')
+
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS parts_version_{event.lower()} AFTER {event} ON parts BEGIN
+                UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+            END
+        ''')
+
+
+def _order_items(cursor):
+    """Позиции заказов (нормализованная копия orders.order_data)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL,
+            part_id INTEGER,
+            name TEXT,
+            price INTEGER NOT NULL,
+            image TEXT,
+            quantity INTEGER NOT NULL,
+            FOREIGN KEY (order_id) REFERENCES orders (id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items (order_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_order_items_part ON order_items (part_id)')
+
+
+def _user_indexes(cursor):
+    """Индексы под выборки по пользователю в Database (фильтр + сортировка)"""
+    # get_user_orders
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders (user_id, created_at)')
+    # get_user_appointments
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_appointments_user_date
+        ON appointments (user_id, appointment_date, appointment_time)
+    ''')
+    # get_user_cars
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_cars_user_created ON user_cars (user_id, created_at)')
+    # get_chat_history
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_user_created ON chat_messages (user_id, created_at)')
+    # get_unread_messages, mark_messages_as_read
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_chat_user_unread
+        ON chat_messages (user_id, is_support, is_read)
+    ''')
+
+
+def _chat_cursor_index(cursor):
+    # История чата читается по курсору id: get_chat_history,
+    # get_chat_messages_after. Индекс по created_at больше не нужен
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_user_id ON chat_messages (user_id, id)')
+    cursor.execute('DROP INDEX IF EXISTS idx_chat_user_created')
+
+
+def _appointment_slots(cursor):
+    # Занятость слотов записи: одна строка на услугу, дату и время слота.
+    # Свободные слоты ищутся диапазоном по первичному ключу, без прохода
+    # по appointments
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS appointment_slots (
+            service_type TEXT NOT NULL,
+            slot_date TEXT NOT NULL,
+            slot_time TEXT NOT NULL,
+            booked INTEGER NOT NULL DEFAULT 0 CHECK (booked >= 0),
+            PRIMARY KEY (service_type, slot_date, slot_time)
+        ) WITHOUT ROWID
+    ''')
+    # Сколько слотов подряд занимает запись (старые записи - один слот)
+    cursor.execute('ALTER TABLE appointments ADD COLUMN duration_slots INTEGER NOT NULL DEFAULT 1')
+
+
+def _parts_sku(cursor):
+    # Артикул поставщика: по нему загрузка каталога обновляет запчасти.
+    # У тестовых запчастей артикула нет (NULL не конфликтует в UNIQUE)
+    cursor.execute('ALTER TABLE parts ADD COLUMN sku TEXT')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_parts_sku ON parts (sku)')
+
+
+# Счетчики stats_counters: имя -> (таблица, вклад строки, колонки, при
+# изменении которых вклад пересчитывается). {row} - NEW. или OLD. в триггере
+STATS_COUNTERS = {
+    'users': ('users', '1', None),
+    'orders': ('orders', '1', None),
+    'appointments': ('appointments', '1', None),
+    'parts_in_stock': ('parts', 'COALESCE({row}in_stock, 0) != 0', 'in_stock'),
+}
+
+
+def _stats_counters(cursor):
+    """Счетчики строк для /api/stats, которые ведут триггеры (без COUNT(*) по таблицам)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    for name, (table, expression, columns) in STATS_COUNTERS.items():
+        # Начальное значение - один полный подсчет внутри транзакции миграции
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO stats_counters (name, value)
+            SELECT '{name}', COALESCE(SUM({expression.format(row='')}), 0) FROM {table}
+        ''')
+        new, old = expression.format(row='NEW.'), expression.format(row='OLD.')
+        triggers = [('insert', 'INSERT', f'+ ({new})'), ('delete', 'DELETE', f'- ({old})')]
+        if columns:
+            triggers.append(('update', f'UPDATE OF {columns}', f'+ ({new}) - ({old})'))
+        for suffix, event, delta in triggers:
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {name}_counter_{suffix} AFTER {event} ON {table} BEGIN
+                    UPDATE stats_counters SET value = value {delta} WHERE name = '{name}';
+                END
+            ''')
+
+
+def _rollups(cursor):
+    """Дневные агрегаты для отчетов и отметки (watermark) их обновления"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_sales (
+            day TEXT PRIMARY KEY,
+            orders INTEGER NOT NULL,
+            revenue INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_part_sales (
+            day TEXT NOT NULL,
+            part_id INTEGER NOT NULL,
+            units INTEGER NOT NULL,
+            revenue INTEGER NOT NULL,
+            PRIMARY KEY (day, part_id)
+        ) WITHOUT ROWID
+    ''')
+    # То же по месяцам ('YYYY-MM'): отчет за длинный период читает полные
+    # месяцы отсюда, а дни - только по краям периода
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS monthly_part_sales (
+            month TEXT NOT NULL,
+            part_id INTEGER NOT NULL,
+            units INTEGER NOT NULL,
+            revenue INTEGER NOT NULL,
+            PRIMARY KEY (month, part_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_category_sales (
+            day TEXT NOT NULL,
+            category TEXT NOT NULL,
+            units INTEGER NOT NULL,
+            revenue INTEGER NOT NULL,
+            PRIMARY KEY (day, category)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_appointments (
+            day TEXT NOT NULL,
+            service_type TEXT NOT NULL,
+            appointments INTEGER NOT NULL,
+            PRIMARY KEY (day, service_type)
+        ) WITHOUT ROWID
+    ''')
+    # Последний id источника, уже учтенный в агрегатах
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_watermarks (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL,
+            updated_at TIMESTAMP
+        )
+    ''')
+    cursor.executemany('INSERT OR IGNORE INTO rollup_watermarks (name, last_id) VALUES (?, 0)',
+                       [('orders',), ('appointments',)])
+
+    # Отмена записи удаляет строку: уже учтенную запись вычитаем из агрегата,
+    # чтобы он совпадал с пересчетом с нуля
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS appointments_rollup_delete AFTER DELETE ON appointments
+        WHEN OLD.id <= (SELECT last_id FROM rollup_watermarks WHERE name = 'appointments')
+        BEGIN
+            UPDATE daily_appointments SET appointments = appointments - 1
+            WHERE day = OLD.appointment_date AND service_type = OLD.service_type;
+            DELETE FROM daily_appointments
+            WHERE day = OLD.appointment_date AND service_type = OLD.service_type AND appointments <= 0;
+        END
+    ''')
+
+
+def _chat_conversations(cursor):
+    """Сводка переписки по клиентам для входящих оператора
+
+    Строку ведет Database.write_chat_messages и отметки о прочтении, поэтому
+    список разговоров - чтение страницы по индексу, без GROUP BY по всем
+    сообщениям. Заполняется после миграции (rebuild_chat_conversations).
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_conversations (
+            user_id INTEGER PRIMARY KEY,
+            last_message_id INTEGER NOT NULL,
+            unread_by_operator INTEGER NOT NULL DEFAULT 0,
+            unread_by_user INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    # Входящие новыми сверху: все разговоры и только с непрочитанными
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_conversations_last
+        ON chat_conversations (last_message_id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_conversations_unread
+        ON chat_conversations (last_message_id) WHERE unread_by_operator > 0
+    ''')
+
+
+def _archive_index(cursor):
+    """Какие месяцы помесячного архива (archive.py) хранят строки пользователя
+    
+    kind - архивная таблица (chat_messages, orders), first_id/last_id -
+    диапазон id строк пользователя в файле месяца. Чтение истории открывает
+    только файлы из этой таблицы. Существующая база после миграции один
+    раз проходит VACUUM для auto_vacuum=INCREMENTAL.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archive_index (
+            kind TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            first_id INTEGER NOT NULL,
+            last_id INTEGER NOT NULL,
+            row_count INTEGER NOT NULL,
+            PRIMARY KEY (kind, user_id, month)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _parts_suspended_ddl(cursor):
+    """Индексы и триггеры parts, снятые на время загрузки каталога
+
+    Database.import_parts сохраняет здесь их DDL в одной транзакции с DROP
+    и удаляет строки, вернув объекты. Оставшиеся строки - след прерванной
+    загрузки, их восстанавливает init_database.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS parts_suspended_ddl (
+            name TEXT PRIMARY KEY,
+            type TEXT NOT NULL,
+            sql TEXT NOT NULL
+        )
+    ''')
+
+
+MIGRATIONS = [
+    Migration(1, 'Базовые таблицы', _base_tables),
+    Migration(2, 'Индексы каталога', _catalog_indexes),
+    Migration(3, 'Полнотекстовый поиск по каталогу', _parts_fts),
+    Migration(4, 'Версия каталога', _catalog_version),
+    Migration(5, 'Таблица order_items', _order_items,
+              after=lambda db: db.migrate_order_items()),
+    Migration(6, 'Индексы выборок по пользователю', _user_indexes),
+    Migration(7, 'Индекс истории чата по id', _chat_cursor_index),
+    Migration(8, 'Слоты записи на обслуживание', _appointment_slots,
+              after=lambda db: db.rebuild_appointment_slots()),
+    Migration(9, 'Артикул поставщика у запчастей', _parts_sku),
+    Migration(10, 'Счетчики для статистики', _stats_counters),
+    Migration(11, 'Дневные агрегаты для отчетов', _rollups,
+              after=lambda db: db.refresh_rollups()),
+    Migration(12, 'Сводка разговоров чата для оператора', _chat_conversations,
+              after=lambda db: db.rebuild_chat_conversations()),
+    Migration(13, 'Индекс помесячного архива', _archive_index,
+              after=lambda db: db.enable_incremental_vacuum()),
+    Migration(14, 'Снятые на время загрузки каталога индексы и триггеры', _parts_suspended_ddl),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def pending_hooks(conn):
+    """Версии миграций, чей перенос данных (after) еще не завершился"""
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'migration_hooks'").fetchone():
+        return []
+    return [version for (version,) in conn.execute('SELECT version FROM migration_hooks ORDER BY version')]
+
+
+def migrate(db):
+    """Применить недостающие миграции и незавершенные переносы данных
+    
+    Возвращает список примененных версий.
+    """
+    with db.connection() as conn:
+        if schema_version(conn) >= LATEST_VERSION and not pending_hooks(conn):
+            return []
+
+    applied = []
+    for migration in MIGRATIONS:
+        # IMMEDIATE + повторная проверка версии: если несколько процессов
+        # стартуют одновременно, миграцию применит только первый
+        with db.transaction('IMMEDIATE') as conn:
+            if schema_version(conn) < migration.version:
+                migration.apply(conn.cursor())
+                if migration.after:
+                    conn.execute('CREATE TABLE IF NOT EXISTS migration_hooks (version INTEGER PRIMARY KEY)')
+                    conn.execute('INSERT OR IGNORE INTO migration_hooks (version) VALUES (?)',
+                                 (migration.version,))
+                conn.execute(f'PRAGMA user_version = {migration.version}')
+                applied.append(migration.version)
+                print(f"Применена миграция {migration.version}: {migration.description}")
+            pending = migration.version in pending_hooks(conn)
+        # Переносы идут по порядку миграций: следующие могут на них опираться
+        if pending:
+            migration.after(db)
+            with db.transaction('IMMEDIATE') as conn:
+                conn.execute('DELETE FROM migration_hooks WHERE version = ?', (migration.version,))
+    return applied
+
+
+# Запросы Database, которые должны обслуживаться индексом:
+# (название, SQL, параметры). Проверяются через EXPLAIN QUERY PLAN.
+INDEXED_QUERIES = [
+    ('get_user_orders', '''
+        SELECT o.id, i.id FROM orders o
+        LEFT JOIN order_items i ON i.order_id = o.id
+        WHERE o.user_id = ?
+        ORDER BY o.created_at DESC, o.id DESC, i.id
+    ''', (1,)),
+    ('export_orders', '''
+        SELECT o.id, i.id FROM orders o
+        LEFT JOIN order_items i ON i.order_id = o.id
+        WHERE o.user_id = ?
+        ORDER BY o.created_at, o.id, i.id
+    ''', (1,)),
+    ('export_chat', '''
+        SELECT * FROM chat_messages WHERE user_id = ? ORDER BY id
+    ''', (1,)),
+    ('get_user_appointments', '''
+        SELECT * FROM appointments WHERE user_id = ?
+        ORDER BY appointment_date DESC, appointment_time DESC
+    ''', (1,)),
+    ('get_user_cars', '''
+        SELECT * FROM user_cars WHERE user_id = ? ORDER BY created_at DESC
+    ''', (1,)),
+    ('get_chat_history', '''
+        SELECT * FROM chat_messages WHERE user_id = ? AND id < ? ORDER BY id DESC LIMIT ?
+    ''', (1, 100, 50)),
+    ('get_chat_messages_after', '''
+        SELECT * FROM chat_messages WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?
+    ''', (1, 0, 100)),
+    ('mark_messages_as_read', '''
+        UPDATE chat_messages SET is_read = 1 WHERE user_id = ? AND is_support = 1 AND is_read = 0
+    ''', (1,)),
+    ('mark_conversation_read', '''
+        UPDATE chat_messages SET is_read = 1
+        WHERE user_id = ? AND is_support = 0 AND is_read = 0 AND id <= ?
+    ''', (1, 100)),
+    ('get_conversations', '''
+        SELECT c.user_id, m.id FROM chat_conversations c
+        LEFT JOIN users u ON u.id = c.user_id
+        LEFT JOIN chat_messages m ON m.id = c.last_message_id
+        WHERE c.last_message_id < ? ORDER BY c.last_message_id DESC LIMIT ?
+    ''', (100, 50)),
+    ('get_conversations(unread)', '''
+        SELECT c.user_id, m.id FROM chat_conversations c
+        LEFT JOIN users u ON u.id = c.user_id
+        LEFT JOIN chat_messages m ON m.id = c.last_message_id
+        WHERE c.unread_by_operator > 0 AND c.last_message_id < ? ORDER BY c.last_message_id DESC LIMIT ?
+    ''', (100, 50)),
+    ('get_or_create_user', 'SELECT * FROM users WHERE phone = ?', ('',)),
+    ('get_chat_history(archive)', '''
+        SELECT month FROM archive_index WHERE kind = ? AND user_id = ? AND first_id < ? ORDER BY month DESC
+    ''', ('chat_messages', 1, 100)),
+    ('archive_history(chat_messages)', '''
+        SELECT m.id FROM chat_messages m
+        LEFT JOIN chat_conversations c ON c.user_id = m.user_id
+        WHERE m.id > ? AND m.created_at < ? AND m.id IS NOT c.last_message_id
+        ORDER BY m.id LIMIT ?
+    ''', (0, '2024-01-01', 500)),
+    ('archive_history(orders)', '''
+        SELECT id FROM orders WHERE id > ? AND id <= ? AND created_at < ? AND status IN (?, ?)
+        ORDER BY id LIMIT ?
+    ''', (0, 100, '2024-01-01', 'done', 'cancelled', 500)),
+    ('get_available_slots', '''
+        SELECT slot_date, slot_time, booked FROM appointment_slots
+        WHERE service_type = ? AND slot_date BETWEEN ? AND ?
+    ''', ('oil', '2024-01-01', '2024-01-31')),
+]
+
+
+def check_query_plans(conn):
+    """Проверка планов INDEXED_QUERIES: {название: список проблемных шагов плана}
+    
+    Проблемой считается полный проход по таблице (SCAN без индекса)
+    и временное B-дерево для сортировки. Пустой словарь - все в порядке.
+    """
+    problems = {}
+    for name, sql, params in INDEXED_QUERIES:
+        plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+        bad = [step for step in plan
+               if (step.startswith('SCAN') and 'USING' not in step) or 'TEMP B-TREE' in step]
+        if bad:
+            problems[name] = bad
+    return problems
+
+
+if __name__ == '__main__':
+    import sys
+    from database import Database
+
+    # python migrations.py путь_к_бд - миграция и проверка планов запросов
+    database = Database(sys.argv[1] if len(sys.argv) > 1 else None)
+    database.init_database()
+    with database.connection() as connection:
+        print(f"Версия схемы: {schema_version(connection)}")
+        failed = check_query_plans(connection)
+    for query, steps in failed.items():
+        print(f"{query}: {'; '.join(steps)}")
+    print("Все запросы используют индексы" if not failed else "Есть запросы без индекса")
+    sys.exit(1 if failed else 0)
@@ -1,24 +1,86 @@
+"""Записи таблиц базы данных
+
+Каждая модель перечисляет колонки в COLUMNS; этот же список идет в SELECT
+(sql_columns), а from_row раскладывает строку по позициям в том же
+порядке, поэтому запрос и разбор строки не могут разойтись. __slots__
+вместо __dict__ - примерно втрое меньше памяти на строку, чем словарь.
+"""
+import inspect
 from datetime import datetime
 
-class User:
+
+def _iso(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def to_dicts(records):
+    return [record.to_dict() for record in records]
+
+
+class Record:
+    """Базовый класс моделей: COLUMNS - колонки таблицы в порядке аргументов __init__"""
+    __slots__ = ()
+    COLUMNS = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # from_row передает строку в __init__ позиционно - порядок обязан совпадать
+        params = list(inspect.signature(cls.__init__).parameters)[1:len(cls.COLUMNS) + 1]
+        if tuple(params) != cls.COLUMNS:
+            raise TypeError(f'{cls.__name__}: аргументы __init__ не совпадают с COLUMNS')
+
+    @classmethod
+    def sql_columns(cls, alias=None):
+        """Список колонок для SELECT, с префиксом таблицы alias"""
+        prefix = f'{alias}.' if alias else ''
+        return ', '.join(prefix + column for column in cls.COLUMNS)
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.COLUMNS}
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __hash__(self):
+        # Без него __eq__ делает модели нехэшируемыми. Хэш - по колонкам
+        # таблицы: у равных моделей они равны, а списки (Order.items) не входят
+        return hash((type(self), tuple(getattr(self, name) for name in self.COLUMNS)))
+
+    def __repr__(self):
+        return f'{type(self).__name__}(id={getattr(self, "id", None)!r})'
+
+
+class User(Record):
+    COLUMNS = ('id', 'name', 'phone', 'email', 'created_at')
+    __slots__ = COLUMNS
+
     def __init__(self, id, name, phone, email=None, created_at=None):
         self.id = id
         self.name = name
         self.phone = phone
         self.email = email
         self.created_at = created_at or datetime.now()
-    
+
     def to_dict(self):
         return {
             'id': self.id,
             'name': self.name,
             'phone': self.phone,
             'email': self.email,
-            'created_at': self.created_at.isoformat() if isinstance(self.created_at, datetime) else self.created_at
+            'created_at': _iso(self.created_at)
         }
 
-class Part:
-    def __init__(self, id, name, category, brand, price, description, image, in_stock=True):
+
+class Part(Record):
+    COLUMNS = ('id', 'name', 'category', 'brand', 'price', 'description', 'image', 'in_stock', 'sku')
+    __slots__ = COLUMNS
+
+    def __init__(self, id, name, category, brand, price, description, image, in_stock=True, sku=None):
         self.id = id
         self.name = name
         self.category = category
@@ -26,42 +88,55 @@ class Part:
         self.price = price
         self.description = description
         self.image = image
-        self.in_stock = in_stock
-    
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'category': self.category,
-            'brand': self.brand,
-            'price': self.price,
-            'description': self.description,
-            'image': self.image,
-            'in_stock': self.in_stock
-        }
+        self.in_stock = bool(in_stock)
+        self.sku = sku
+
+
+class OrderItem(Record):
+    """Позиция заказа; id - id запчасти"""
+    COLUMNS = ('id', 'name', 'price', 'image', 'quantity')
+    __slots__ = COLUMNS
+
+    def __init__(self, id, name, price, image, quantity):
+        self.id = id
+        self.name = name
+        self.price = price
+        self.image = image
+        self.quantity = quantity
+
 
-class Order:
-    def __init__(self, id, user_id, items, total_price, status='new', created_at=None):
+class Order(Record):
+    COLUMNS = ('id', 'user_id', 'total_price', 'status', 'created_at')
+    __slots__ = COLUMNS + ('items',)
+
+    def __init__(self, id, user_id, total_price, status='new', created_at=None, items=None):
         self.id = id
         self.user_id = user_id
-        self.items = items
         self.total_price = total_price
         self.status = status
         self.created_at = created_at or datetime.now()
-    
+        self.items = items if items is not None else []
+
     def to_dict(self):
         return {
             'id': self.id,
             'user_id': self.user_id,
-            'items': self.items,
+            'items': to_dicts(self.items),
             'total_price': self.total_price,
             'status': self.status,
-            'created_at': self.created_at.isoformat() if isinstance(self.created_at, datetime) else self.created_at
+            'created_at': _iso(self.created_at)
         }
 
-class Appointment:
+
+class Appointment(Record):
+    COLUMNS = ('id', 'user_id', 'car_brand', 'car_model', 'car_year', 'service_type',
+               'appointment_date', 'appointment_time', 'additional_info', 'status',
+               'created_at', 'duration_slots')
+    __slots__ = COLUMNS
+
     def __init__(self, id, user_id, car_brand, car_model, car_year, service_type,
-                 appointment_date, appointment_time, additional_info='', status='pending', created_at=None):
+                 appointment_date, appointment_time, additional_info='', status='pending',
+                 created_at=None, duration_slots=1):
         self.id = id
         self.user_id = user_id
         self.car_brand = car_brand
@@ -73,18 +148,56 @@ class Appointment:
         self.additional_info = additional_info
         self.status = status
         self.created_at = created_at or datetime.now()
-    
+        self.duration_slots = duration_slots
+
     def to_dict(self):
-        return {
-            'id': self.id,
-            'user_id': self.user_id,
-            'car_brand': self.car_brand,
-            'car_model': self.car_model,
-            'car_year': self.car_year,
-            'service_type': self.service_type,
-            'appointment_date': self.appointment_date,
-            'appointment_time': self.appointment_time,
-            'additional_info': self.additional_info,
-            'status': self.status,
-            'created_at': self.created_at.isoformat() if isinstance(self.created_at, datetime) else self.created_at
-        }
\ No newline at end of file
+        result = super().to_dict()
+        result['created_at'] = _iso(self.created_at)
+        return result
+
+
+class Car(Record):
+    COLUMNS = ('id', 'user_id', 'brand', 'model', 'year', 'vin', 'license_plate', 'created_at')
+    __slots__ = COLUMNS
+
+    def __init__(self, id, user_id, brand, model, year=None, vin=None, license_plate=None, created_at=None):
+        self.id = id
+        self.user_id = user_id
+        self.brand = brand
+        self.model = model
+        self.year = year
+        self.vin = vin
+        self.license_plate = license_plate
+        self.created_at = created_at
+
+
+class ChatMessage(Record):
+    COLUMNS = ('id', 'user_id', 'user_name', 'message', 'is_support', 'is_read', 'created_at')
+    __slots__ = COLUMNS
+
+    def __init__(self, id, user_id, user_name, message, is_support=False, is_read=False, created_at=None):
+        self.id = id
+        self.user_id = user_id
+        self.user_name = user_name
+        self.message = message
+        self.is_support = bool(is_support)
+        self.is_read = bool(is_read)
+        self.created_at = created_at
+
+
+class Conversation(Record):
+    """Разговор во входящих оператора: клиент, последнее сообщение и непрочитанные им"""
+    COLUMNS = ('user_id', 'user_name', 'phone', 'last_message_id', 'last_message',
+               'last_is_support', 'last_at', 'unread')
+    __slots__ = COLUMNS
+
+    def __init__(self, user_id, user_name, phone, last_message_id, last_message=None,
+                 last_is_support=False, last_at=None, unread=0):
+        self.user_id = user_id
+        self.user_name = user_name
+        self.phone = phone
+        self.last_message_id = last_message_id
+        self.last_message = last_message
+        self.last_is_support = bool(last_is_support)
+        self.last_at = last_at
+        self.unread = unread
@@ -0,0 +1,100 @@
+"""Расписание записи на обслуживание: часы работы, слоты и вместимость по услугам"""
+import json
+import os
+from datetime import datetime, timedelta
+
+SCHEDULE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'schedule.json')
+
+WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+
+
+def parse_date(value):
+    """'YYYY-MM-DD' -> date; ValueError при неверном формате"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise ValueError(f'Некорректная дата: {value}')
+
+
+def _minutes(value):
+    try:
+        parsed = datetime.strptime(value, '%H:%M')
+    except (TypeError, ValueError):
+        raise ValueError(f'Некорректное время: {value}')
+    return parsed.hour * 60 + parsed.minute
+
+
+def _format_minutes(minutes):
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+class Service:
+    def __init__(self, code, name, bays, slots, working_hours):
+        self.code = code
+        self.name = name
+        self.bays = bays
+        self.slots = slots
+        self.working_hours = working_hours
+
+
+class SlotSchedule:
+    """Сетка слотов по дням и услугам
+
+    День делится на слоты по slot_minutes от начала рабочего времени.
+    Услуга занимает slots слотов подряд и должна закончиться до конца
+    рабочего дня; одновременно на нее можно записать bays машин.
+    """
+
+    def __init__(self, config):
+        self.slot_minutes = config.get('slot_minutes', 60)
+        self.horizon_days = config.get('horizon_days', 60)
+        default_hours = config['working_hours']
+        self.services = {}
+        for code, service in config['services'].items():
+            hours = service.get('working_hours', default_hours)
+            self.services[code] = Service(
+                code=code,
+                name=service.get('name', code),
+                bays=service['bays'],
+                slots=service.get('slots', 1),
+                working_hours={day: (tuple(_minutes(t) for t in hours[day]) if hours.get(day) else None)
+                               for day in WEEKDAYS}
+            )
+
+    @classmethod
+    def from_file(cls, path=SCHEDULE_PATH):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def service(self, code):
+        if code not in self.services:
+            raise ValueError(f'Неизвестная услуга: {code}')
+        return self.services[code]
+
+    def day_slots(self, service, day):
+        """Начала всех слотов дня (HH:MM); пустой список - выходной"""
+        hours = service.working_hours[WEEKDAYS[day.weekday()]]
+        if not hours:
+            return []
+        opens, closes = hours
+        return [_format_minutes(m) for m in range(opens, closes - self.slot_minutes + 1, self.slot_minutes)]
+
+    def start_times(self, service, day):
+        """Время, с которого услуга помещается в рабочий день: {начало: занимаемые слоты}"""
+        slots = self.day_slots(service, day)
+        return {slots[i]: slots[i:i + service.slots] for i in range(len(slots) - service.slots + 1)}
+
+    def booking_slots(self, service, day, time):
+        """Слоты, которые займет запись на day/time; ValueError, если время вне сетки"""
+        _minutes(time)  # ValueError, если time - не строка 'HH:MM' (в том числе не строка из JSON)
+        occupied = self.start_times(service, day).get(time)
+        if occupied is None:
+            raise ValueError(f'На {day.isoformat()} {time} запись на эту услугу невозможна')
+        return occupied
+
+    def check_range(self, date_from, date_to, today):
+        """Проверка диапазона дат для поиска свободных слотов"""
+        if date_to < date_from:
+            raise ValueError('Дата окончания раньше даты начала')
+        if date_to > today + timedelta(days=self.horizon_days):
+            raise ValueError(f'Запись открыта не более чем на {self.horizon_days} дней вперед')
@@ -0,0 +1,1447 @@
+// ==================== ГЛОБАЛЬНЫЕ ПЕРЕМЕННЫЕ ====================
+
+let currentUser = null;
+let cart = [];
+let parts = [];
+let currentPage = 1;
+const itemsPerPage = 8;
+let totalParts = 0;
+let pageCursors = [null];  // курсор начала каждой открытой страницы
+let nextCursor = null;
+let searchTimer = null;
+let filters = {
+    category: 'all',
+    brand: 'all',
+    search: '',
+    sort: 'default'
+};
+
+// ==================== ИНИЦИАЛИЗАЦИЯ ====================
+
+document.addEventListener('DOMContentLoaded', function() {
+    loadStats();
+    loadParts();
+    loadUser();
+    loadAppointments(); // Загружаем записи при загрузке страницы
+    loadCartFromStorage(); // Загружаем корзину из localStorage
+    setupEventListeners();
+    setMinDate();
+});
+
+// Загрузка корзины из localStorage
+function loadCartFromStorage() {
+    const savedCart = localStorage.getItem('cart');
+    if (savedCart) {
+        cart = JSON.parse(savedCart);
+        updateCartUI();
+    }
+}
+
+// Сохранение корзины в localStorage
+function saveCartToStorage() {
+    localStorage.setItem('cart', JSON.stringify(cart));
+}
+
+function setupEventListeners() {
+    // Запись: свободное время зависит от услуги и даты
+    document.getElementById('serviceType')?.addEventListener('change', loadAvailableSlots);
+    document.getElementById('bookingDate')?.addEventListener('change', loadAvailableSlots);
+
+    // Чат: у верхнего края подгружаем более ранние сообщения
+    document.getElementById('chatMessages')?.addEventListener('scroll', (e) => {
+        if (e.target.scrollTop < 40) loadOlderChatMessages();
+    });
+
+    // Фильтры
+    document.getElementById('categoryFilter')?.addEventListener('change', (e) => {
+        filters.category = e.target.value;
+        applyFilters();
+    });
+
+    document.getElementById('brandFilter')?.addEventListener('change', (e) => {
+        filters.brand = e.target.value;
+        applyFilters();
+    });
+
+    document.getElementById('sortFilter')?.addEventListener('change', (e) => {
+        filters.sort = e.target.value;
+        applyFilters();
+    });
+
+    document.getElementById('searchParts')?.addEventListener('input', (e) => {
+        filters.search = e.target.value;
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(applyFilters, 250);
+    });
+
+    // Форма авторизации
+    document.getElementById('loginForm')?.addEventListener('submit', function(e) {
+        e.preventDefault();
+        login();
+    });
+
+    // Форма записи
+    document.getElementById('bookingForm')?.addEventListener('submit', function(e) {
+        e.preventDefault();
+        createAppointment();
+    });
+
+    // Обработчик для кнопки "Мои записи" в навигации
+    document.querySelector('a[href="#appointments"]')?.addEventListener('click', function(e) {
+        if (currentUser) {
+            loadAppointments(); // Перезагружаем записи при переходе в раздел
+        }
+    });
+}
+
+// ==================== РАБОТА С ПОЛЬЗОВАТЕЛЕМ ====================
+
+async function login() {
+    const name = document.getElementById('loginName').value;
+    const phone = document.getElementById('loginPhone').value;
+    const email = document.getElementById('loginEmail').value;
+
+    if (!name || !phone) {
+        showNotification('Пожалуйста, заполните имя и телефон', 'warning');
+        return;
+    }
+
+    try {
+        const response = await fetch('/api/user', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({name, phone, email})
+        });
+
+        const data = await response.json();
+
+        if (data.success) {
+            currentUser = data.user;
+            showNotification('Добро пожаловать, ' + currentUser.name, 'success');
+
+            // Закрываем модальное окно
+            const modal = bootstrap.Modal.getInstance(document.getElementById('loginModal'));
+            if (modal) modal.hide();
+
+            // Загружаем записи и заказы пользователя
+            startChatStream();
+            await loadAppointments();
+            await loadOrders();
+        } else {
+            showNotification(data.message, 'danger');
+        }
+    } catch (error) {
+        showNotification('Ошибка при входе', 'danger');
+    }
+}
+
+async function loadUser() {
+    try {
+        const response = await fetch('/api/user');
+        const data = await response.json();
+
+        if (data.success) {
+            currentUser = data.user;
+            startChatStream();
+            // Если пользователь авторизован, загружаем его записи
+            await loadAppointments();
+            await loadOrders();
+        }
+    } catch (error) {
+        console.error('Ошибка загрузки пользователя:', error);
+    }
+}
+
+function showLoginModal() {
+    if (currentUser) {
+        showNotification(`Вы уже вошли как ${currentUser.name}`, 'info');
+    } else {
+        const modal = new bootstrap.Modal(document.getElementById('loginModal'));
+        modal.show();
+    }
+}
+
+// ==================== РАБОТА С КАТАЛОГОМ ====================
+
+async function loadParts() {
+    const params = new URLSearchParams({limit: itemsPerPage, sort: filters.sort});
+    if (filters.category !== 'all') params.set('category', filters.category);
+    if (filters.brand !== 'all') params.set('brand', filters.brand);
+    if (filters.search) params.set('search', filters.search);
+    const cursor = pageCursors[currentPage - 1];
+    if (cursor) params.set('cursor', cursor);
+
+    try {
+        const response = await fetch('/api/parts?' + params.toString());
+        const data = await response.json();
+
+        if (data.success) {
+            parts = data.parts;
+            totalParts = data.total;
+            nextCursor = data.next_cursor;
+            renderCatalog();
+        }
+    } catch (error) {
+        showNotification('Ошибка загрузки каталога', 'danger');
+    }
+}
+
+function applyFilters() {
+    currentPage = 1;
+    pageCursors = [null];
+    loadParts();
+}
+
+function renderCatalog() {
+    const grid = document.getElementById('partsGrid');
+
+    if (parts.length === 0) {
+        grid.innerHTML = `
+            <div class="col-12 text-center py-5">
+                <i class="fas fa-box-open fa-4x text-muted mb-3"></i>
+                <h5 class="text-muted">Запчасти не найдены</h5>
+                <p class="text-muted">Попробуйте изменить параметры поиска</p>
+            </div>
+        `;
+    } else {
+        grid.innerHTML = parts.map(part => `
+            <div class="col-lg-3 col-md-4 col-sm-6 mb-4">
+                <div class="part-card">
+                    <img src="${part.image}" class="part-image" alt="${part.name}">
+                    <div class="part-title">${part.name}</div>
+                    <p class="text-muted small mb-2">${part.description}</p>
+                    <div class="part-price">${part.price.toLocaleString()} ₽</div>
+                    <button class="btn btn-primary btn-cart" onclick="addToCart(${part.id})">
+                        <i class="fas fa-shopping-cart me-2"></i>
+                        В корзину
+                    </button>
+                </div>
+            </div>
+        `).join('');
+    }
+
+    renderPagination();
+}
+
+function renderPagination() {
+    const totalPages = Math.ceil(totalParts / itemsPerPage);
+    const pagination = document.getElementById('pagination');
+
+    if (totalPages <= 1) {
+        pagination.innerHTML = '';
+        return;
+    }
+
+    // Пагинация по курсору: переход только на соседние страницы
+    pagination.innerHTML = `
+        <li class="page-item ${currentPage === 1 ? 'disabled' : ''}">
+            <a class="page-link" href="#" onclick="changePage(${currentPage - 1})">Предыдущая</a>
+        </li>
+        <li class="page-item active">
+            <span class="page-link">${currentPage} из ${totalPages}</span>
+        </li>
+        <li class="page-item ${nextCursor ? '' : 'disabled'}">
+            <a class="page-link" href="#" onclick="changePage(${currentPage + 1})">Следующая</a>
+        </li>
+    `;
+}
+
+async function changePage(page) {
+    if (page < 1 || page > currentPage + 1) return;
+    if (page === currentPage + 1) {
+        if (!nextCursor) return;
+        pageCursors[page - 1] = nextCursor;
+    }
+    currentPage = page;
+    await loadParts();
+    scrollToCatalog();
+}
+
+function scrollToCatalog() {
+    const catalogSection = document.getElementById('catalog');
+    const navbar = document.querySelector('.navbar');
+    const navbarHeight = navbar ? navbar.offsetHeight : 0;
+
+    setTimeout(() => {
+        window.scrollTo({
+            top: catalogSection.offsetTop - navbarHeight - 20,
+            behavior: 'smooth'
+        });
+    }, 100);
+}
+
+function resetFilters() {
+    filters = {
+        category: 'all',
+        brand: 'all',
+        search: '',
+        sort: 'default'
+    };
+
+    document.getElementById('categoryFilter').value = 'all';
+    document.getElementById('brandFilter').value = 'all';
+    document.getElementById('sortFilter').value = 'default';
+    document.getElementById('searchParts').value = '';
+
+    applyFilters();
+    scrollToCatalog();
+}
+
+// ==================== РАБОТА С КОРЗИНОЙ ====================
+
+function addToCart(partId) {
+    const part = parts.find(p => p.id === partId);
+    if (!part) return;
+
+    const existingItem = cart.find(item => item.id === partId);
+
+    if (existingItem) {
+        existingItem.quantity += 1;
+    } else {
+        cart.push({
+            id: part.id,
+            name: part.name,
+            price: part.price,
+            image: part.image,
+            quantity: 1
+        });
+    }
+
+    saveCartToStorage(); // Сохраняем в localStorage
+    updateCartUI();
+    showNotification('Товар добавлен в корзину', 'success');
+}
+
+function removeFromCart(partId) {
+    cart = cart.filter(item => item.id !== partId);
+    saveCartToStorage(); // Сохраняем в localStorage
+    updateCartUI();
+}
+
+function updateQuantity(partId, quantity) {
+    const item = cart.find(item => item.id === partId);
+    if (item) {
+        if (quantity <= 0) {
+            removeFromCart(partId);
+        } else {
+            item.quantity = quantity;
+            saveCartToStorage(); // Сохраняем в localStorage
+            updateCartUI();
+        }
+    }
+}
+
+function getTotalPrice() {
+    return cart.reduce((sum, item) => sum + (item.price * item.quantity), 0);
+}
+
+function getTotalItems() {
+    return cart.reduce((sum, item) => sum + item.quantity, 0);
+}
+
+function updateCartUI() {
+    const counter = document.getElementById('cart-counter');
+    const totalItems = getTotalItems();
+    counter.textContent = totalItems;
+    counter.style.display = totalItems > 0 ? 'inline' : 'none';
+
+    renderCartItems();
+}
+
+function renderCartItems() {
+    const cartItemsContainer = document.getElementById('cartItems');
+    const emptyCartMessage = document.getElementById('emptyCartMessage');
+    const cartSummary = document.getElementById('cartSummary');
+
+    if (cart.length === 0) {
+        cartItemsContainer.innerHTML = '';
+        emptyCartMessage.style.display = 'block';
+        cartSummary.style.display = 'none';
+        return;
+    }
+
+    emptyCartMessage.style.display = 'none';
+    cartSummary.style.display = 'block';
+
+    let html = '';
+    cart.forEach(item => {
+        html += `
+            <div class="cart-item">
+                <img src="${item.image}" alt="${item.name}">
+                <div class="cart-item-details">
+                    <div class="cart-item-title">${item.name}</div>
+                    <div class="cart-item-price mb-2">${item.price.toLocaleString()} ₽</div>
+                    <div class="d-flex align-items-center">
+                        <button class="btn btn-sm btn-outline-secondary" onclick="updateQuantity(${item.id}, ${item.quantity - 1})">
+                            <i class="fas fa-minus"></i>
+                        </button>
+                        <span class="mx-3 fw-bold">${item.quantity}</span>
+                        <button class="btn btn-sm btn-outline-secondary" onclick="updateQuantity(${item.id}, ${item.quantity + 1})">
+                            <i class="fas fa-plus"></i>
+                        </button>
+                        <button class="btn btn-sm btn-outline-danger ms-3" onclick="removeFromCart(${item.id})">
+                            <i class="fas fa-trash"></i>
+                        </button>
+                    </div>
+                </div>
+            </div>
+        `;
+    });
+
+    cartItemsContainer.innerHTML = html;
+    document.getElementById('cartTotalPrice').innerHTML = `${getTotalPrice().toLocaleString()} ₽`;
+}
+
+async function checkout() {
+    if (cart.length === 0) {
+        showNotification('Корзина пуста', 'warning');
+        return;
+    }
+
+    if (!currentUser) {
+        showNotification('Пожалуйста, войдите в систему', 'warning');
+        showLoginModal();
+        return;
+    }
+
+    try {
+        const response = await fetch('/api/orders', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({
+                items: cart,
+                total_price: getTotalPrice()
+            })
+        });
+
+        const data = await response.json();
+
+        if (data.success) {
+            cart = [];
+            saveCartToStorage(); // Очищаем корзину в localStorage
+            updateCartUI();
+            showNotification('Заказ успешно оформлен!', 'success');
+
+            const offcanvas = bootstrap.Offcanvas.getInstance(document.getElementById('cartOffcanvas'));
+            if (offcanvas) offcanvas.hide();
+
+            setTimeout(() => {
+                showOrdersModal();
+            }, 500);
+        } else {
+            showNotification(data.message, 'danger');
+        }
+    } catch (error) {
+        showNotification('Ошибка при оформлении заказа', 'danger');
+    }
+}
+
+function goToCatalogFromCart() {
+    const offcanvas = bootstrap.Offcanvas.getInstance(document.getElementById('cartOffcanvas'));
+    if (offcanvas) offcanvas.hide();
+
+    scrollToCatalog();
+}
+
+// ==================== РАБОТА С ЗАКАЗАМИ ====================
+
+async function loadOrders() {
+    if (!currentUser) return;
+
+    try {
+        const response = await fetch('/api/orders');
+        const data = await response.json();
+
+        if (data.success) {
+            // Можно обновить UI с заказами если нужно
+            console.log('Заказы загружены:', data.orders);
+        }
+    } catch (error) {
+        console.error('Ошибка загрузки заказов:', error);
+    }
+}
+
+async function showOrdersModal() {
+    if (!currentUser) {
+        showNotification('Пожалуйста, войдите в систему', 'warning');
+        showLoginModal();
+        return;
+    }
+
+    try {
+        const response = await fetch('/api/orders');
+        const data = await response.json();
+
+        const modalBody = document.getElementById('ordersModalBody');
+
+        if (data.orders.length === 0) {
+            modalBody.innerHTML = `
+                <div class="text-center py-5">
+                    <i class="fas fa-box-open fa-4x text-muted mb-3"></i>
+                    <h5 class="text-muted">У вас пока нет заказов</h5>
+                    <p class="text-muted">Перейдите в каталог, чтобы сделать первый заказ</p>
+                    <button class="btn btn-primary mt-3" onclick="closeOrdersModal(); goToCatalogFromCart();">
+                        <i class="fas fa-search me-2"></i>
+                        Перейти в каталог
+                    </button>
+                </div>
+            `;
+        } else {
+            modalBody.innerHTML = data.orders.map(order => `
+                <div class="order-item">
+                    <div class="order-header">
+                        <span class="order-id">Заказ №${order.id}</span>
+                        <span class="order-date">${new Date(order.created_at).toLocaleString()}</span>
+                    </div>
+                    <div class="order-items">
+                        ${order.items.map(item => `
+                            <div class="order-item-row">
+                                <div>
+                                    <span class="order-item-name">${item.name}</span>
+                                    <span class="order-item-quantity ms-2">x${item.quantity}</span>
+                                </div>
+                                <span class="order-item-price">${(item.price * item.quantity).toLocaleString()} ₽</span>
+                            </div>
+                        `).join('')}
+                    </div>
+                    <div class="order-total">
+                        <span>Итого:</span>
+                        <span class="text-primary">${order.total_price.toLocaleString()} ₽</span>
+                    </div>
+                    <div class="mt-3">
+                        <span class="order-status order-status-${order.status}">
+                            ${order.status === 'new' ? 'Новый' : order.status === 'processing' ? 'В обработке' : 'Выполнен'}
+                        </span>
+                    </div>
+                </div>
+            `).reverse().join('');
+        }
+
+        const modal = new bootstrap.Modal(document.getElementById('ordersModal'));
+        modal.show();
+    } catch (error) {
+        showNotification('Ошибка при загрузке заказов', 'danger');
+    }
+}
+
+function closeOrdersModal() {
+    const modal = bootstrap.Modal.getInstance(document.getElementById('ordersModal'));
+    if (modal) modal.hide();
+}
+
+// ==================== РАБОТА С ЗАПИСЯМИ ====================
+
+async function createAppointment() {
+    if (!currentUser) {
+        showNotification('Пожалуйста, войдите в систему', 'warning');
+        showLoginModal();
+        return;
+    }
+
+    const requiredFields = ['carBrand', 'carModel', 'carYear', 'serviceType', 'bookingDate', 'bookingTime'];
+    let isValid = true;
+
+    requiredFields.forEach(field => {
+        const element = document.getElementById(field);
+        if (!element.value) {
+            element.classList.add('is-invalid');
+            isValid = false;
+        } else {
+            element.classList.remove('is-invalid');
+        }
+    });
+
+    if (!isValid) {
+        showNotification('Пожалуйста, заполните все обязательные поля', 'warning');
+        return;
+    }
+
+    const formData = {
+        carBrand: document.getElementById('carBrand').value,
+        carModel: document.getElementById('carModel').value,
+        carYear: document.getElementById('carYear').value,
+        serviceType: document.getElementById('serviceType').value,
+        date: document.getElementById('bookingDate').value,
+        time: document.getElementById('bookingTime').value,
+        additionalInfo: document.getElementById('additionalInfo').value
+    };
+
+    try {
+        const response = await fetch('/api/appointments', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify(formData)
+        });
+
+        const data = await response.json();
+
+        if (data.success) {
+            showNotification('Запись успешно создана!', 'success');
+            document.getElementById('bookingForm').reset();
+            loadAvailableSlots();
+            await loadAppointments(); // Перезагружаем записи с сервера
+
+            setTimeout(() => {
+                document.getElementById('appointments').scrollIntoView({ behavior: 'smooth' });
+            }, 1000);
+        } else {
+            showNotification(data.message, 'danger');
+            // Время могли занять, пока форма была открыта
+            if (response.status === 409) loadAvailableSlots();
+        }
+    } catch (error) {
+        showNotification('Ошибка при создании записи', 'danger');
+    }
+}
+
+// Свободное время для выбранной услуги и даты
+async function loadAvailableSlots() {
+    const service = document.getElementById('serviceType').value;
+    const date = document.getElementById('bookingDate').value;
+    const select = document.getElementById('bookingTime');
+
+    if (!service || !date) {
+        select.innerHTML = '<option value="">Выберите услугу и дату</option>';
+        return;
+    }
+
+    try {
+        const response = await fetch(`/api/appointments/slots?service=${encodeURIComponent(service)}&from=${date}&to=${date}`);
+        const data = await response.json();
+        const slots = data.success && data.days.length ? data.days[0].slots : [];
+
+        select.innerHTML = slots.length
+            ? '<option value="">Время</option>' + slots.map(slot => `<option value="${slot.time}">${slot.time}</option>`).join('')
+            : '<option value="">Нет свободного времени</option>';
+    } catch (error) {
+        console.error('Ошибка загрузки свободного времени:', error);
+    }
+}
+
+async function loadAppointments() {
+    if (!currentUser) {
+        // Если пользователь не авторизован, показываем пустой список
+        renderAppointments([]);
+        return;
+    }
+
+    try {
+        const response = await fetch('/api/appointments');
+        const data = await response.json();
+
+        if (data.success) {
+            renderAppointments(data.appointments);
+        } else {
+            renderAppointments([]);
+        }
+    } catch (error) {
+        console.error('Ошибка загрузки записей:', error);
+        renderAppointments([]);
+        showNotification('Ошибка при загрузке записей', 'danger');
+    }
+}
+
+function renderAppointments(appointments) {
+    const tbody = document.getElementById('appointmentsTableBody');
+    const noAppointmentsMessage = document.getElementById('noAppointmentsMessage');
+    const appointmentsCount = document.getElementById('appointments-count');
+
+    if (!appointments || appointments.length === 0) {
+        tbody.innerHTML = '';
+        noAppointmentsMessage.style.display = 'block';
+        appointmentsCount.textContent = '0 записей';
+        return;
+    }
+
+    noAppointmentsMessage.style.display = 'none';
+    appointmentsCount.textContent = `${appointments.length} ${getWordEnding(appointments.length, 'запись', 'записи', 'записей')}`;
+
+    tbody.innerHTML = appointments.map(app => {
+        let statusClass = '';
+        let statusText = '';
+
+        switch (app.status) {
+            case 'pending':
+                statusClass = 'status-pending';
+                statusText = 'Ожидает подтверждения';
+                break;
+            case 'confirmed':
+                statusClass = 'status-confirmed';
+                statusText = 'Подтверждена';
+                break;
+            case 'completed':
+                statusClass = 'status-completed';
+                statusText = 'Выполнена';
+                break;
+            default:
+                statusClass = 'status-pending';
+                statusText = 'Ожидает';
+        }
+
+        return `
+            <tr>
+                <td>${app.appointment_date}</td>
+                <td>${app.appointment_time}</td>
+                <td>${app.car_brand} ${app.car_model} (${app.car_year})</td>
+                <td>${getServiceName(app.service_type)}</td>
+                <td><span class="status-badge ${statusClass}">${statusText}</span></td>
+                <td>
+                    ${app.status === 'pending' ? 
+                        `<button class="btn btn-sm btn-outline-danger" onclick="cancelAppointment(${app.id})">
+                            <i class="fas fa-times"></i> Отменить
+                        </button>` : ''}
+                </td>
+            </tr>
+        `;
+    }).join('');
+}
+
+async function cancelAppointment(appointmentId) {
+    if (!currentUser) return;
+
+    try {
+        const response = await fetch(`/api/appointments/${appointmentId}`, {
+            method: 'DELETE'
+        });
+
+        const data = await response.json();
+
+        if (data.success) {
+            showNotification('Запись отменена', 'info');
+            await loadAppointments(); // Перезагружаем записи с сервера
+        } else {
+            showNotification(data.message, 'danger');
+        }
+    } catch (error) {
+        showNotification('Ошибка при отмене записи', 'danger');
+    }
+}
+
+function getServiceName(serviceId) {
+    const services = {
+        'oil': 'Замена масла и фильтров',
+        'diagnostic': 'Диагностика двигателя',
+        'brake': 'Ремонт тормозной системы',
+        'suspension': 'Ремонт подвески',
+        'ac': 'Заправка кондиционера',
+        'full': 'Комплексное ТО'
+    };
+    return services[serviceId] || serviceId;
+}
+
+// ==================== СТАТИСТИКА ====================
+
+async function loadStats() {
+    try {
+        const response = await fetch('/api/stats');
+        const data = await response.json();
+
+        if (data.success) {
+            document.getElementById('client-count').textContent = data.stats.clients.toLocaleString();
+            document.getElementById('works-count').textContent = data.stats.works.toLocaleString();
+            document.getElementById('parts-count').textContent = data.stats.parts.toLocaleString();
+        }
+    } catch (error) {
+        console.error('Ошибка загрузки статистики:', error);
+    }
+}
+
+// ==================== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ====================
+
+function setMinDate() {
+    const dateInput = document.getElementById('bookingDate');
+    const today = new Date();
+    today.setDate(today.getDate() + 1);
+    const tomorrow = today.toISOString().split('T')[0];
+    dateInput.min = tomorrow;
+}
+
+function getWordEnding(number, one, two, five) {
+    let n = Math.abs(number);
+    n %= 100;
+    if (n >= 5 && n <= 20) return five;
+    n %= 10;
+    if (n === 1) return one;
+    if (n >= 2 && n <= 4) return two;
+    return five;
+}
+
+function showNotification(message, type = 'info') {
+    const alertDiv = document.createElement('div');
+    alertDiv.className = `alert alert-${type} notification`;
+    alertDiv.innerHTML = `
+        <i class="fas ${type === 'success' ? 'fa-check-circle' : type === 'danger' ? 'fa-exclamation-circle' : 'fa-info-circle'} me-2"></i>
+        ${message}
+    `;
+
+    document.body.appendChild(alertDiv);
+
+    setTimeout(() => {
+        alertDiv.remove();
+    }, 3000);
+}
+// ==================== ЛИЧНЫЙ КАБИНЕТ ====================
+
+// Показать личный кабинет
+function showProfile() {
+    if (!currentUser) {
+        showNotification('Пожалуйста, войдите в систему', 'warning');
+        showLoginModal();
+        return;
+    }
+
+    // Заполняем данные профиля
+    document.getElementById('profileName').textContent = currentUser.name;
+    document.getElementById('profilePhone').textContent = currentUser.phone;
+    document.getElementById('profileEditName').value = currentUser.name;
+    document.getElementById('profileEditPhone').value = currentUser.phone;
+    document.getElementById('profileEditEmail').value = currentUser.email || '';
+
+    // Автомобили и статистика - одним запросом
+    loadUserDashboard();
+
+    const modal = new bootstrap.Modal(document.getElementById('profileModal'));
+    modal.show();
+}
+
+// Данные личного кабинета одним запросом
+async function loadUserDashboard() {
+    try {
+        const response = await fetch('/api/user/dashboard?sections=cars,unread,summary');
+        const data = await response.json();
+
+        if (data.success) {
+            renderUserCars(data.cars);
+            renderUserStats(data.summary);
+            updateUnreadBadge(data.unread);
+        }
+    } catch (error) {
+        console.error('Ошибка загрузки личного кабинета:', error);
+    }
+}
+
+// Загрузка автомобилей пользователя
+async function loadUserCars() {
+    try {
+        const response = await fetch('/api/user/cars');
+        const data = await response.json();
+
+        if (data.success) {
+            renderUserCars(data.cars);
+        }
+    } catch (error) {
+        console.error('Ошибка загрузки автомобилей:', error);
+    }
+}
+
+// Отображение автомобилей
+function renderUserCars(cars) {
+    const carsList = document.getElementById('carsList');
+
+    if (cars.length === 0) {
+        carsList.innerHTML = `
+            <div class="text-center py-4">
+                <i class="fas fa-car fa-3x text-muted mb-3"></i>
+                <p class="text-muted">У вас пока нет добавленных автомобилей</p>
+            </div>
+        `;
+        return;
+    }
+
+    carsList.innerHTML = cars.map(car => `
+        <div class="card mb-3">
+            <div class="card-body">
+                <div class="d-flex justify-content-between align-items-center">
+                    <div>
+                        <h6 class="fw-bold mb-1">
+                            <i class="fas fa-car text-primary me-2"></i>
+                            ${car.brand} ${car.model} ${car.year ? '(' + car.year + ')' : ''}
+                        </h6>
+                        ${car.vin ? `<p class="small text-muted mb-1">VIN: ${car.vin}</p>` : ''}
+                        ${car.license_plate ? `<p class="small text-muted mb-0">Госномер: ${car.license_plate}</p>` : ''}
+                    </div>
+                    <button class="btn btn-sm btn-outline-danger" onclick="deleteCar(${car.id})">
+                        <i class="fas fa-trash"></i>
+                    </button>
+                </div>
+            </div>
+        </div>
+    `).join('');
+}
+
+// Удаление автомобиля
+async function deleteCar(carId) {
+    if (!confirm('Вы уверены, что хотите удалить этот автомобиль?')) return;
+
+    try {
+        const response = await fetch(`/api/user/cars/${carId}`, {
+            method: 'DELETE'
+        });
+
+        const data = await response.json();
+
+        if (data.success) {
+            showNotification('Автомобиль удален', 'success');
+            loadUserCars(); // Перезагружаем список
+        }
+    } catch (error) {
+        showNotification('Ошибка при удалении', 'danger');
+    }
+}
+
+// Отображение статистики пользователя (сводка из /api/user/dashboard)
+function renderUserStats(summary) {
+    const totalServices = summary.appointments_count + summary.orders_count;
+
+    document.getElementById('totalServices').textContent = totalServices;
+    document.getElementById('totalSpent').textContent = summary.total_spent.toLocaleString() + ' ₽';
+
+    // Создаем график
+    createActivityChart();
+}
+
+// Создание графика активности
+function createActivityChart() {
+    const ctx = document.getElementById('activityChart')?.getContext('2d');
+    if (!ctx) return;
+
+    // Очищаем предыдущий график если есть
+    const existingChart = Chart.getChart(ctx);
+    if (existingChart) {
+        existingChart.destroy();
+    }
+
+    // Тестовые данные для графика
+    new Chart(ctx, {
+        type: 'line',
+        data: {
+            labels: ['Янв', 'Фев', 'Мар', 'Апр', 'Май', 'Июн'],
+            datasets: [{
+                label: 'Посещений',
+                data: [2, 3, 1, 4, 2, 3],
+                borderColor: '#0d6efd',
+                backgroundColor: 'rgba(13, 110, 253, 0.1)',
+                tension: 0.4,
+                fill: true
+            }]
+        },
+        options: {
+            responsive: true,
+            maintainAspectRatio: false,
+            plugins: {
+                legend: {
+                    display: false
+                }
+            }
+        }
+    });
+}
+
+// Обновление профиля
+document.getElementById('profileForm')?.addEventListener('submit', async function(e) {
+    e.preventDefault();
+
+    const name = document.getElementById('profileEditName').value;
+    const email = document.getElementById('profileEditEmail').value;
+
+    try {
+        const response = await fetch('/api/user/profile', {
+            method: 'PUT',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({name, email})
+        });
+
+        const data = await response.json();
+
+        if (data.success) {
+            currentUser = data.user;
+            document.getElementById('profileName').textContent = name;
+            showNotification('Профиль обновлен', 'success');
+        } else {
+            showNotification(data.message, 'danger');
+        }
+    } catch (error) {
+        showNotification('Ошибка при обновлении', 'danger');
+    }
+});
+
+// Добавление автомобиля
+document.getElementById('addCarForm')?.addEventListener('submit', async function(e) {
+    e.preventDefault();
+
+    const carData = {
+        brand: document.getElementById('carBrand').value,
+        model: document.getElementById('carModel').value,
+        year: document.getElementById('carYear').value,
+        vin: document.getElementById('carVin').value,
+        license_plate: document.getElementById('carPlate').value
+    };
+
+    try {
+        const response = await fetch('/api/user/cars', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify(carData)
+        });
+
+        const data = await response.json();
+
+        if (data.success) {
+            showNotification('Автомобиль добавлен', 'success');
+            document.getElementById('addCarForm').reset();
+            loadUserCars(); // Перезагружаем список
+        } else {
+            showNotification(data.message, 'danger');
+        }
+    } catch (error) {
+        showNotification('Ошибка при добавлении', 'danger');
+    }
+});
+
+// Смена аватара
+function changeAvatar() {
+    const input = document.createElement('input');
+    input.type = 'file';
+    input.accept = 'image/*';
+
+    input.onchange = function(e) {
+        const file = e.target.files[0];
+        if (file) {
+            // Здесь можно добавить загрузку на сервер
+            showNotification('Функция загрузки фото будет добавлена позже', 'info');
+        }
+    };
+
+    input.click();
+}
+
+// Выход из системы
+async function logout() {
+    try {
+        const response = await fetch('/api/user/logout', {
+            method: 'POST'
+        });
+
+        const data = await response.json();
+
+        if (data.success) {
+            currentUser = null;
+            stopChatStream();
+            showNotification('Вы вышли из системы', 'success');
+
+            // Закрываем модальное окно
+            const modal = bootstrap.Modal.getInstance(document.getElementById('profileModal'));
+            if (modal) modal.hide();
+
+            // Обновляем UI
+            loadAppointments();
+        }
+    } catch (error) {
+        showNotification('Ошибка при выходе', 'danger');
+    }
+}
+
+// ==================== ЧАТ ПОДДЕРЖКИ ====================
+
+let chatInitialized = false;
+let unreadCount = 0;
+let checkInterval = null;
+let chatStream = null;
+const shownMessageIds = new Set();  // id сообщений, уже показанных в окне чата
+let chatHistoryLoaded = false;
+let chatFirstId = null;   // самое старое загруженное сообщение (курсор прокрутки назад)
+let chatLastId = 0;       // самое новое загруженное сообщение (курсор дозагрузки)
+let chatHasOlder = false;
+let chatLoadingOlder = false;
+
+// Переключение чата
+function toggleChat() {
+    const chatWindow = document.getElementById('chatWindow');
+    chatWindow.classList.toggle('active');
+
+    if (chatWindow.classList.contains('active')) {
+        // Если чат открывается, загружаем историю и убираем бейдж
+        loadChatHistory();
+        chatInitialized = true;
+        hideChatNotification();
+        removeUnreadBadge(); // Убираем бейдж сразу
+    }
+}
+
+// Запоминаем id показанного сообщения и сдвигаем курсоры истории
+function rememberChatMessage(id) {
+    if (!id) return;
+    shownMessageIds.add(id);
+    chatLastId = Math.max(chatLastId, id);
+    if (chatFirstId === null || id < chatFirstId) chatFirstId = id;
+}
+
+// Загрузка истории чата: первый раз последние сообщения, затем только новые
+async function loadChatHistory() {
+    try {
+        if (chatHistoryLoaded) {
+            await loadNewChatMessages();
+            return;
+        }
+
+        const response = await fetch('/api/chat/history');
+        const data = await response.json();
+
+        if (data.success) {
+            chatHistoryLoaded = true;
+            chatHasOlder = data.has_more;
+            renderChatMessages(data.messages);
+            // После загрузки истории проверяем, нет ли непрочитанных
+            if (!chatStream) setTimeout(checkUnreadMessages, 1000);
+        }
+    } catch (error) {
+        console.error('Ошибка загрузки истории чата:', error);
+    }
+}
+
+// Дозагрузка сообщений новее последнего показанного
+async function loadNewChatMessages() {
+    let hasMore = true;
+    while (hasMore) {
+        const response = await fetch(`/api/chat/history?after=${chatLastId}`);
+        const data = await response.json();
+        if (!data.success) return;
+
+        data.messages.forEach(msg => {
+            if (shownMessageIds.has(msg.id)) return;
+            rememberChatMessage(msg.id);
+            addMessageToChat(msg.message, msg.is_support ? 'support' : 'user', false);
+        });
+        hasMore = data.has_more && data.messages.length > 0;
+    }
+}
+
+// Прокрутка назад: подгружаем сообщения старше самого раннего показанного
+async function loadOlderChatMessages() {
+    if (!chatHasOlder || chatLoadingOlder || chatFirstId === null) return;
+    chatLoadingOlder = true;
+
+    try {
+        const response = await fetch(`/api/chat/history?before=${chatFirstId}`);
+        const data = await response.json();
+        if (!data.success) return;
+
+        chatHasOlder = data.has_more;
+        const chatMessages = document.getElementById('chatMessages');
+        // Вставляем после системного сообщения, сохраняя положение прокрутки
+        const anchor = chatMessages.firstElementChild ? chatMessages.firstElementChild.nextSibling : null;
+        const heightBefore = chatMessages.scrollHeight;
+        data.messages.forEach(msg => {
+            if (shownMessageIds.has(msg.id)) return;
+            rememberChatMessage(msg.id);
+            chatMessages.insertBefore(
+                createMessageElement(msg.message, msg.is_support ? 'support' : 'user', formatChatTime(msg.created_at)),
+                anchor
+            );
+        });
+        chatMessages.scrollTop += chatMessages.scrollHeight - heightBefore;
+    } catch (error) {
+        console.error('Ошибка загрузки истории чата:', error);
+    } finally {
+        chatLoadingOlder = false;
+    }
+}
+
+// Время сообщения из created_at (UTC в SQLite)
+function formatChatTime(createdAt) {
+    const date = createdAt ? new Date(createdAt.replace(' ', 'T') + 'Z') : new Date();
+    return date.toLocaleTimeString('ru-RU', {hour: '2-digit', minute: '2-digit'});
+}
+
+// Отображение сообщений
+function renderChatMessages(messages) {
+    const chatMessages = document.getElementById('chatMessages');
+
+    // Очищаем чат
+    chatMessages.innerHTML = '';
+
+    // Добавляем системное сообщение
+    const systemMsg = document.createElement('div');
+    systemMsg.className = 'message message-system';
+    systemMsg.innerHTML = '<small>Чат поддержки работает круглосуточно</small>';
+    chatMessages.appendChild(systemMsg);
+
+    // Добавляем все сообщения из истории
+    if (messages && messages.length > 0) {
+        messages.forEach(msg => {
+            rememberChatMessage(msg.id);
+            chatMessages.appendChild(
+                createMessageElement(msg.message, msg.is_support ? 'support' : 'user', formatChatTime(msg.created_at))
+            );
+        });
+    } else {
+        // Если нет истории, добавляем приветственное сообщение
+        const welcomeMsg = document.createElement('div');
+        welcomeMsg.className = 'message message-support';
+        welcomeMsg.innerHTML = `
+            <div class="message-content">Здравствуйте! Чем я могу вам помочь?</div>
+            <div class="message-time">${new Date().toLocaleTimeString('ru-RU', {hour: '2-digit', minute: '2-digit'})}</div>
+        `;
+        chatMessages.appendChild(welcomeMsg);
+    }
+
+    // Прокручиваем вниз
+    scrollChatToBottom();
+}
+
+// Отправка сообщения
+async function sendMessage(event) {
+    event.preventDefault();
+
+    const input = document.getElementById('chatInput');
+    const message = input.value.trim();
+
+    if (!message) return;
+
+    // Добавляем сообщение пользователя в чат
+    addMessageToChat(message, 'user', true);
+
+    // Очищаем поле ввода
+    input.value = '';
+
+    // Отправляем на сервер
+    try {
+        const response = await fetch('/api/chat/messages', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({message: message})
+        });
+
+        const data = await response.json();
+        rememberChatMessage(data.message_id);
+
+        if (data.auto_response && !shownMessageIds.has(data.auto_response_id)) {
+            // Ответ мог уже прийти через поток событий
+            rememberChatMessage(data.auto_response_id);
+            // Добавляем ответ через небольшую задержку
+            setTimeout(() => {
+                addMessageToChat(data.auto_response, 'support', true);
+            }, 1000);
+        }
+    } catch (error) {
+        console.error('Ошибка отправки сообщения:', error);
+        setTimeout(() => {
+            addMessageToChat('Извините, произошла ошибка. Пожалуйста, попробуйте позже.', 'support', true);
+        }, 500);
+    }
+}
+
+// Элемент сообщения чата
+function createMessageElement(text, type, time) {
+    const messageDiv = document.createElement('div');
+    messageDiv.className = `message message-${type}`;
+    messageDiv.innerHTML = `
+        <div class="message-content">${text}</div>
+        <div class="message-time">${time}</div>
+    `;
+    return messageDiv;
+}
+
+// Добавление сообщения в чат
+function addMessageToChat(text, type, save = true) {
+    const chatMessages = document.getElementById('chatMessages');
+    const time = new Date().toLocaleTimeString('ru-RU', {hour: '2-digit', minute: '2-digit'});
+
+    chatMessages.appendChild(createMessageElement(text, type, time));
+    scrollChatToBottom();
+
+    // Если это сообщение от поддержки и чат закрыт, показываем уведомление
+    if (type === 'support' && !document.getElementById('chatWindow').classList.contains('active')) {
+        showChatNotification(text);
+        // Обновляем счетчик непрочитанных (при потоке событий он придет сам)
+        if (!chatStream) setTimeout(checkUnreadMessages, 500);
+    }
+}
+
+// Отправка быстрого вопроса
+function sendQuickQuestion(question) {
+    const input = document.getElementById('chatInput');
+    input.value = question;
+    sendMessage(new Event('submit'));
+}
+
+// Прокрутка чата вниз
+function scrollChatToBottom() {
+    const chatMessages = document.getElementById('chatMessages');
+    chatMessages.scrollTop = chatMessages.scrollHeight;
+}
+
+// Показать уведомление о новом сообщении
+function showChatNotification(message) {
+    // Удаляем старое уведомление если есть
+    const oldNotification = document.getElementById('chatNotification');
+    if (oldNotification) {
+        oldNotification.remove();
+    }
+
+    const notification = document.createElement('div');
+    notification.id = 'chatNotification';
+    notification.className = 'chat-notification show';
+    notification.innerHTML = `
+        <div class="chat-notification-avatar">
+            <i class="fas fa-headset"></i>
+        </div>
+        <div class="chat-notification-content">
+            <p>Поддержка</p>
+            <small>${message.substring(0, 30)}${message.length > 30 ? '...' : ''}</small>
+        </div>
+        <div class="chat-notification-close" onclick="this.parentElement.remove()">
+            <i class="fas fa-times"></i>
+        </div>
+    `;
+
+    document.body.appendChild(notification);
+
+    // Автоматически скрыть через 5 секунд
+    setTimeout(() => {
+        const notif = document.getElementById('chatNotification');
+        if (notif) {
+            notif.classList.remove('show');
+            setTimeout(() => notif.remove(), 300);
+        }
+    }, 5000);
+}
+
+// Убрать бейдж непрочитанных
+function removeUnreadBadge() {
+    const badge = document.querySelector('.chat-button .unread-badge');
+    if (badge) {
+        badge.remove();
+    }
+    unreadCount = 0;
+}
+
+// Проверка непрочитанных сообщений
+async function checkUnreadMessages() {
+    // Если чат открыт, не показываем уведомления
+    if (document.getElementById('chatWindow').classList.contains('active')) {
+        removeUnreadBadge();
+        return;
+    }
+
+    try {
+        const response = await fetch('/api/chat/unread');
+        const data = await response.json();
+
+        if (data.success) {
+            updateUnreadBadge(data.count);
+        }
+    } catch (error) {
+        console.error('Ошибка проверки сообщений:', error);
+    }
+}
+
+// Обновление счетчика непрочитанных на кнопке чата
+function updateUnreadBadge(count) {
+    if (count > 0 && !document.getElementById('chatWindow').classList.contains('active')) {
+        unreadCount = count;
+        const chatButton = document.querySelector('.chat-button');
+        let badge = chatButton.querySelector('.unread-badge');
+
+        if (!badge) {
+            badge = document.createElement('span');
+            badge.className = 'unread-badge';
+            chatButton.appendChild(badge);
+        }
+        badge.textContent = count;
+    } else {
+        // Убираем бейдж если нет непрочитанных
+        removeUnreadBadge();
+    }
+}
+
+// Поток событий чата: новые сообщения и счетчик непрочитанных без опроса
+function startChatStream() {
+    if (!window.EventSource || chatStream) return;
+
+    // При обрыве EventSource переподключается сам и передает Last-Event-ID
+    chatStream = new EventSource('/api/chat/stream');
+
+    chatStream.addEventListener('message', (e) => {
+        const msg = JSON.parse(e.data);
+        // Свои сообщения уже показаны при отправке
+        if (!msg.is_support || shownMessageIds.has(msg.id)) return;
+        rememberChatMessage(msg.id);
+
+        if (document.getElementById('chatWindow').classList.contains('active')) {
+            addMessageToChat(msg.message, 'support', false);
+            fetch('/api/chat/read', {method: 'POST'});
+        } else {
+            showChatNotification(msg.message);
+        }
+    });
+
+    chatStream.addEventListener('unread', (e) => {
+        updateUnreadBadge(JSON.parse(e.data).count);
+    });
+}
+
+function stopChatStream() {
+    if (chatStream) {
+        chatStream.close();
+        chatStream = null;
+    }
+    shownMessageIds.clear();
+    chatHistoryLoaded = false;
+    chatFirstId = null;
+    chatLastId = 0;
+    chatHasOlder = false;
+    removeUnreadBadge();
+}
+
+// Добавляем обработчик для закрытия чата по клику вне его
+document.addEventListener('click', function(event) {
+    const chatWindow = document.getElementById('chatWindow');
+    const chatButton = document.querySelector('.chat-button');
+
+    if (chatWindow && chatWindow.classList.contains('active') && 
+        !chatWindow.contains(event.target) && 
+        !chatButton.contains(event.target)) {
+        chatWindow.classList.remove('active');
+    }
+});
+
+// Очищаем интервал и закрываем поток при уходе со страницы
+window.addEventListener('beforeunload', function() {
+    if (checkInterval) {
+        clearInterval(checkInterval);
+    }
+    if (chatStream) {
+        chatStream.close();
+    }
+});
+
+// Без поддержки EventSource остаемся на опросе каждые 10 секунд
+if (!window.EventSource) {
+    checkInterval = setInterval(checkUnreadMessages, 10000);
+
+    // Первая проверка через 2 секунды после загрузки
+    setTimeout(checkUnreadMessages, 2000);
+}
+
+// ==================== ГЛОБАЛЬНЫЕ ФУНКЦИИ ====================
+
+window.addToCart = addToCart;
+window.updateQuantity = updateQuantity;
+window.removeFromCart = removeFromCart;
+window.checkout = checkout;
+window.goToCatalogFromCart = goToCatalogFromCart;
+window.showOrdersModal = showOrdersModal;
+window.closeOrdersModal = closeOrdersModal;
+window.showLoginModal = showLoginModal;
+window.resetFilters = resetFilters;
+window.changePage = changePage;
+window.cancelAppointment = cancelAppointment;
+window.showProfile = showProfile;
+window.deleteCar = deleteCar;
+window.changeAvatar = changeAvatar;
+window.logout = logout;
+window.toggleChat = toggleChat;
+window.sendMessage = sendMessage;
+window.sendQuickQuestion = sendQuickQuestion;
+window.hideChatNotification = hideChatNotification;